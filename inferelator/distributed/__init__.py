@@ -2,6 +2,12 @@
 
 from abc import abstractmethod
 
+# Number of tasks to keep submitted for each worker when streaming results with imap
+IN_FLIGHT_PER_WORKER = 2
+
+# Number of seconds to wait on one async result before checking all of them again
+POLL_INTERVAL = 0.01
+
 
 class AbstractController:
     # The object which handles the multiprocessing
@@ -14,6 +20,10 @@ class AbstractController:
     _controller_name = None
     _controller_dask = False
 
+    # Restart dask workers after a regression if their process memory is above this fraction of their memory limit
+    # None never restarts workers
+    restart_memory_fraction = None
+
     @classmethod
     def name(cls):
         """
@@ -27,6 +37,13 @@ class AbstractController:
     def is_dask(cls):
         return cls._controller_dask
 
+    @classmethod
+    def num_workers(cls):
+        """
+        Return the number of workers which can run tasks at the same time
+        """
+        return getattr(cls, "processes", 1)
+
     @classmethod
     @abstractmethod
     def connect(cls, *args, **kwargs):
@@ -45,6 +62,23 @@ class AbstractController:
         """
         raise NotImplementedError
 
+    @classmethod
+    def imap(cls, func, *args, ordered=True, max_in_flight=None, **kwargs):
+        """
+        Map a function across iterable(s) and yield (index, result) tuples. Controllers should override this to
+        yield results as they finish; this default waits for `map` to finish and then yields everything.
+
+        :param ordered: Yield results in input order. If False, yield results as they finish.
+        :type ordered: bool
+        :param max_in_flight: Maximum number of tasks which are submitted but not yet yielded
+        :type max_in_flight: int
+        """
+        return enumerate(cls.map(func, *args, **kwargs))
+
+    @classmethod
+    def _max_in_flight(cls, max_in_flight=None):
+        return max(cls.num_workers() * IN_FLIGHT_PER_WORKER, 1) if max_in_flight is None else max_in_flight
+
     @classmethod
     @abstractmethod
     def set_processes(cls, process_count):
@@ -53,6 +87,21 @@ class AbstractController:
         """
         raise NotImplementedError
 
+    @classmethod
+    def set_restart_memory_fraction(cls, fraction):
+        """
+        Set the fraction of their memory limit that dask workers can still be using after a regression is finished
+        and memory has been freed. Workers over this fraction are restarted. This has no effect on engines which
+        are not dask.
+
+        :param fraction: Restart workers using more than this fraction of their memory limit. None never restarts
+            workers.
+        :type fraction: float
+        """
+        if fraction is not None and fraction <= 0:
+            raise ValueError("restart_memory_fraction must be positive; {f} provided".format(f=fraction))
+        cls.restart_memory_fraction = fraction
+
     @classmethod
     @abstractmethod
     def shutdown(cls):
@@ -60,3 +109,61 @@ class AbstractController:
         Clean shutdown of the multiprocessing state
         """
         raise NotImplementedError
+
+
+def stream_tasks(submit, wait_any, get_result, n, ordered=True, max_in_flight=None):
+    """
+    Submit tasks with a bounded number in flight and yield (index, result) tuples as they finish
+
+    :param submit: Function that takes a task index, starts the task, and returns a (hashable) handle for it
+    :type submit: callable
+    :param wait_any: Function that takes a list of handles, blocks until at least one is done, and returns the done
+        handles
+    :type wait_any: callable
+    :param get_result: Function that takes a done handle and returns its result (or raises its error)
+    :type get_result: callable
+    :param n: Number of tasks
+    :type n: int
+    :param ordered: Yield results in task order. If False, yield results as they finish.
+    :type ordered: bool
+    :param max_in_flight: Maximum number of tasks which are submitted but not yet yielded. None is unbounded.
+    :type max_in_flight: int
+    """
+
+    in_flight, buffered = {}, {}
+    next_submit, next_yield, n_yielded = 0, 0, 0
+
+    while n_yielded < n:
+
+        while next_submit < n and (max_in_flight is None or len(in_flight) + len(buffered) < max_in_flight):
+            in_flight[submit(next_submit)] = next_submit
+            next_submit += 1
+
+        for handle in wait_any(list(in_flight.keys())):
+            i = in_flight.pop(handle)
+
+            if ordered:
+                buffered[i] = get_result(handle)
+            else:
+                n_yielded += 1
+                yield i, get_result(handle)
+
+        while ordered and next_yield in buffered:
+            n_yielded += 1
+            yield next_yield, buffered.pop(next_yield)
+            next_yield += 1
+
+
+def poll_any(handles):
+    """
+    Wait for any multiprocessing async result (with ready() and wait()) to finish, and return the ones that have
+    """
+
+    while True:
+        done = [h for h in handles if h.ready()]
+
+        if len(done) > 0:
+            return done
+
+        handles[0].wait(POLL_INTERVAL)
+
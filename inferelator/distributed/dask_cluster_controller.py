@@ -12,7 +12,7 @@ from dask_jobqueue.slurm import SLURMJob
 from inferelator import utils
 from inferelator.utils import Validator as check
 from inferelator.distributed import AbstractController
-from inferelator.distributed.dask_functions import dask_map
+from inferelator.distributed.dask_functions import dask_map, dask_imap
 
 _DEFAULT_NUM_JOBS = 1
 _DEFAULT_THREADS_PER_WORKER = 1
@@ -181,6 +181,14 @@ class DaskHPCClusterController(AbstractController):
     def map(cls, func, *args, **kwargs):
         return dask_map(func, *args, **kwargs)
 
+    @classmethod
+    def imap(cls, func, *args, ordered=True, max_in_flight=None, **kwargs):
+        return dask_imap(func, *args, ordered=ordered, max_in_flight=max_in_flight, **kwargs)
+
+    @classmethod
+    def num_workers(cls):
+        return (cls._job_n * cls._job_n_workers + cls._num_local_workers) * cls._worker_n_threads
+
     @classmethod
     def use_default_configuration(cls, known_config, n_jobs=1):
         """
@@ -1,7 +1,12 @@
-from inferelator.distributed.inferelator_mp import MPControl
+from inferelator.distributed.inferelator_mp import MPControl, _stage_name
+from inferelator.distributed.telemetry import RecordedTask
+from inferelator.distributed import stream_tasks, IN_FLIGHT_PER_WORKER
 from inferelator.regression import base_regression
 from inferelator import utils
 import copy
+import ctypes
+import gc
+import time
 
 import numpy as np
 import scipy.sparse as sps
@@ -14,6 +19,12 @@ more advanced memory and task tools of dask to be used)
 
 DASK_SCATTER_TIMEOUT = 120
 
+# Number of MI blocks to create for each worker thread
+DASK_MI_BLOCKS_PER_THREAD = 4
+
+# Number of response variable blocks to create for each worker thread
+DASK_RESPONSE_BLOCKS_PER_THREAD = 4
+
 
 def amusr_regress_dask(X, Y, priors, prior_weight, n_tasks, genes, tfs, G, remove_autoregulation=True,
                        lambda_Bs=None, lambda_Ss=None, Cs=None, Ss=None, regression_function=None, 
@@ -74,24 +85,30 @@ def amusr_regress_dask(X, Y, priors, prior_weight, n_tasks, genes, tfs, G, remov
     distributed.wait(scatter_x, timeout=DASK_SCATTER_TIMEOUT)
     distributed.wait(scatter_priors, timeout=DASK_SCATTER_TIMEOUT)
 
-    future_list = [DaskController.client.submit(regression_maker, i, scatter_x, response_maker(Y, i), scatter_priors,
-                                                tfs)
+    start, task_func = time.time(), _record_tasks(regression_maker)
+    future_list = [DaskController.client.submit(task_func, i, scatter_x, response_maker(Y, i), scatter_priors, tfs)
                    for i in range(G)]
 
     # Collect results as they finish instead of waiting for all workers to be done
-    result_list = process_futures_into_list(future_list)
+    result_list = _record_stage(process_futures_into_list(future_list), regression_maker, start, labels=genes)
 
     DaskController.client.cancel(scatter_x)
     DaskController.client.cancel(scatter_priors)
-    DaskController.client.restart()
+
+    # Free memory on the workers instead of restarting all of them
+    del future_list
+    worker_memory_hygiene(restart_memory_fraction=DaskController.restart_memory_fraction)
 
     return result_list
 
 
-def bbsr_regress_dask(X, Y, pp_mat, weights_mat, G, genes, nS):
+def bbsr_regress_dask(X, Y, pp_mat, weights_mat, G, genes, nS, block_size=None):
     """
     Execute regression (BBSR)
 
+    The response is split into blocks of genes which are scattered to the workers once, and each task regresses
+    one block and returns its results packed into arrays
+
     :return: list
         Returns a list of regression results that the pileup_data can process
     """
@@ -100,39 +117,50 @@ def bbsr_regress_dask(X, Y, pp_mat, weights_mat, G, genes, nS):
     from inferelator.regression import bayes_stats
     DaskController = MPControl.client
 
-    def regression_maker(j, x, y, pp, weights):
-        level = 0 if j % 100 == 0 else 2
-        utils.Debug.allprint(base_regression.PROGRESS_STR.format(gn=genes[j], i=j, total=G), level=level)
-        data = bayes_stats.bbsr(x, utils.scale_vector(y), pp[j, :].flatten(), weights[j, :].flatten(), nS)
-        data['ind'] = j
-        return j, data
+    def regression_maker(i, genes_idx, x, y, pp, weights):
+        level = 0 if i % 100 == 0 else 2
+        utils.Debug.allprint(base_regression.PROGRESS_STR.format(gn=genes[genes_idx[0]], i=genes_idx[0], total=G),
+                             level=level)
+
+        results = []
+        for k, j in enumerate(genes_idx):
+            data = bayes_stats.bbsr(x, utils.scale_vector(y[:, k]), pp[j, :].flatten(), weights[j, :].flatten(), nS)
+            results.append(base_regression.compact_result(data, j))
+
+        return i, base_regression.pack_results(results)
 
     # Scatter common data to workers
     [scatter_x] = DaskController.client.scatter([X.values], broadcast=True, hash=False)
     [scatter_pp] = DaskController.client.scatter([pp_mat.values], broadcast=True, hash=False)
     [scatter_weights] = DaskController.client.scatter([weights_mat.values], broadcast=True, hash=False)
 
+    # Scatter each block of the response once
+    blocks, scatter_y = _scatter_response_blocks(Y, G, block_size=block_size)
+
     # Wait for scattering to finish before creating futures
     distributed.wait(scatter_x, timeout=DASK_SCATTER_TIMEOUT)
     distributed.wait(scatter_pp, timeout=DASK_SCATTER_TIMEOUT)
     distributed.wait(scatter_weights, timeout=DASK_SCATTER_TIMEOUT)
+    distributed.wait(scatter_y, timeout=DASK_SCATTER_TIMEOUT)
 
-    future_list = [DaskController.client.submit(regression_maker, i, scatter_x,
-                                                Y.get_gene_data(i, force_dense=True, flatten=True),
+    start, task_func = time.time(), _record_tasks(regression_maker)
+    future_list = [DaskController.client.submit(task_func, i, blocks[i], scatter_x, scatter_y[i],
                                                 scatter_pp, scatter_weights)
-                   for i in range(G)]
+                   for i in range(len(blocks))]
 
     # Collect results as they finish instead of waiting for all workers to be done
-    result_list = process_futures_into_list(future_list)
+    result_list = _unpack_block_results(_record_stage(process_futures_into_list(future_list), regression_maker,
+                                                      start, labels=[genes[b[0]] for b in blocks]))
 
     DaskController.client.cancel(scatter_x)
     DaskController.client.cancel(scatter_pp)
     DaskController.client.cancel(scatter_weights)
+    DaskController.client.cancel(scatter_y)
 
     return result_list
 
 
-def sklearn_regress_dask(X, Y, model, G, genes, min_coef):
+def sklearn_regress_dask(X, Y, model, G, genes, min_coef, block_size=None):
     """
     Execute regression (SKLearn)
 
@@ -144,32 +172,43 @@ def sklearn_regress_dask(X, Y, model, G, genes, min_coef):
     from inferelator.regression import sklearn_regression
     DaskController = MPControl.client
 
-    def regression_maker(j, x, y):
-        level = 0 if j % 100 == 0 else 2
-        utils.Debug.allprint(base_regression.PROGRESS_STR.format(gn=genes[j], i=j, total=G), level=level)
-        data = sklearn_regression.sklearn_gene(x, utils.scale_vector(y), copy.copy(model))
-        data['ind'] = j
-        return j, data
+    def regression_maker(i, genes_idx, x, y):
+        level = 0 if i % 100 == 0 else 2
+        utils.Debug.allprint(base_regression.PROGRESS_STR.format(gn=genes[genes_idx[0]], i=genes_idx[0], total=G),
+                             level=level)
+
+        results = []
+        for k, j in enumerate(genes_idx):
+            data = sklearn_regression.sklearn_gene(x, utils.scale_vector(y[:, k]), copy.copy(model))
+            results.append(base_regression.compact_result(data, j))
+
+        return i, base_regression.pack_results(results)
 
     # Scatter common data to workers
     [scatter_x] = DaskController.client.scatter([X.values], broadcast=True, hash=False)
 
+    # Scatter each block of the response once
+    blocks, scatter_y = _scatter_response_blocks(Y, G, block_size=block_size)
+
     # Wait for scattering to finish before creating futures
     distributed.wait(scatter_x, timeout=DASK_SCATTER_TIMEOUT)
+    distributed.wait(scatter_y, timeout=DASK_SCATTER_TIMEOUT)
 
-    future_list = [DaskController.client.submit(regression_maker, i, scatter_x,
-                                                Y.get_gene_data(i, force_dense=True, flatten=True))
-                   for i in range(G)]
+    start, task_func = time.time(), _record_tasks(regression_maker)
+    future_list = [DaskController.client.submit(task_func, i, blocks[i], scatter_x, scatter_y[i])
+                   for i in range(len(blocks))]
 
     # Collect results as they finish instead of waiting for all workers to be done
-    result_list = process_futures_into_list(future_list)
+    result_list = _unpack_block_results(_record_stage(process_futures_into_list(future_list), regression_maker,
+                                                      start, labels=[genes[b[0]] for b in blocks]))
 
     DaskController.client.cancel(scatter_x)
+    DaskController.client.cancel(scatter_y)
 
     return result_list
 
 
-def lasso_stars_regress_dask(X, Y, alphas, num_subsamples, random_seed, method, params, G, genes):
+def lasso_stars_regress_dask(X, Y, alphas, num_subsamples, random_seed, method, params, G, genes, block_size=None):
     """
     Execute regression (LASSO-StARS)
 
@@ -181,85 +220,246 @@ def lasso_stars_regress_dask(X, Y, alphas, num_subsamples, random_seed, method,
     from inferelator.regression import stability_selection
     DaskController = MPControl.client
 
-    def regression_maker(j, x, y):
-        level = 0 if j % 100 == 0 else 2
-        utils.Debug.allprint(base_regression.PROGRESS_STR.format(gn=genes[j], i=j, total=G), level=level)
-        data = stability_selection.stars_model_select(x, utils.scale_vector(y), alphas, num_subsamples=num_subsamples,
-                                                      method=method, random_seed=random_seed, **params)
-        data['ind'] = j
-        return j, data
+    def regression_maker(i, genes_idx, x, y):
+        level = 0 if i % 100 == 0 else 2
+        utils.Debug.allprint(base_regression.PROGRESS_STR.format(gn=genes[genes_idx[0]], i=genes_idx[0], total=G),
+                             level=level)
+
+        results = []
+        for k, j in enumerate(genes_idx):
+            data = stability_selection.stars_model_select(x, utils.scale_vector(y[:, k]), alphas,
+                                                          num_subsamples=num_subsamples, method=method,
+                                                          random_seed=random_seed, **params)
+            results.append(base_regression.compact_result(data, j))
+
+        return i, base_regression.pack_results(results)
 
     # Scatter common data to workers
     [scatter_x] = DaskController.client.scatter([X.values], broadcast=True, hash=False)
 
+    # Scatter each block of the response once
+    blocks, scatter_y = _scatter_response_blocks(Y, G, block_size=block_size)
+
     # Wait for scattering to finish before creating futures
     distributed.wait(scatter_x, timeout=DASK_SCATTER_TIMEOUT)
+    distributed.wait(scatter_y, timeout=DASK_SCATTER_TIMEOUT)
 
-    future_list = [DaskController.client.submit(regression_maker, i, scatter_x,
-                                                Y.get_gene_data(i, force_dense=True, flatten=True))
-                   for i in range(G)]
+    start, task_func = time.time(), _record_tasks(regression_maker)
+    future_list = [DaskController.client.submit(task_func, i, blocks[i], scatter_x, scatter_y[i])
+                   for i in range(len(blocks))]
 
     # Collect results as they finish instead of waiting for all workers to be done
-    result_list = process_futures_into_list(future_list)
+    result_list = _unpack_block_results(_record_stage(process_futures_into_list(future_list), regression_maker,
+                                                      start, labels=[genes[b[0]] for b in blocks]))
 
     DaskController.client.cancel(scatter_x)
+    DaskController.client.cancel(scatter_y)
 
     return result_list
 
 
-def build_mi_array_dask(X, Y, bins, logtype):
+def _scatter_response_blocks(Y, G, block_size=None):
+    """
+    Split the response variables into blocks and scatter each block to the workers once (not broadcast; tasks are
+    run wherever their block is)
+
+    :param Y: Response data [N x G]
+    :type Y: InferelatorData, InferelatorBootstrapView
+    :param G: Number of response variables
+    :type G: int
+    :param block_size: The number of response variables in each block. Will be set from the number of worker
+        threads if None.
+    :type block_size: int
+    :return: A list of response variable indices for each block and a list of Futures for each dense [N x b] block
+    :rtype: list(list(int)), list(distributed.Future)
+    """
+
+    DaskController = MPControl.client
+
+    if block_size is None:
+        n_threads = max(sum(DaskController.client.nthreads().values()), 1)
+        block_size = max(1, int(np.ceil(G / (n_threads * DASK_RESPONSE_BLOCKS_PER_THREAD))))
+
+    assert utils.Validator.argument_integer(block_size, low=1)
+
+    blocks = [list(range(i, min(i + block_size, G))) for i in range(0, G, block_size)]
+    scatter_y = DaskController.client.scatter([Y.get_gene_data(b, force_dense=True) for b in blocks], hash=False)
+
+    return blocks, scatter_y
+
+
+def _unpack_block_results(block_results):
+    """
+    Unpack a list of packed blocks of results into one list of regression records
+    """
+    return [data for packed in base_regression._consume_results(block_results)
+            for data in base_regression.unpack_results(packed)]
+
+
+def _record_tasks(func):
+    """
+    Wrap a task function which returns (i, result) so that it returns (i, (result, record)) if task telemetry is
+    being recorded. The function is returned unchanged otherwise.
+    """
+
+    if MPControl.telemetry is None:
+        return func
+
+    recorded = RecordedTask(func)
+
+    def _recorded_func(i, *args):
+        (j, data), record = recorded(i, i, *args)
+        return j, (data, record)
+
+    return _recorded_func
+
+
+def _record_stage(result_list, func, start, labels=None):
+    """
+    Add the task records from a list of (result, record) tuples to the telemetry as a stage and return the results
+    """
+
+    if MPControl.telemetry is None:
+        return result_list
+
+    MPControl.telemetry.add_stage(_stage_name(func), start, time.time(), MPControl.client.num_workers(),
+                                  [record for _, record in result_list], labels=labels)
+
+    return [data for data, _ in result_list]
+
+
+def build_mi_array_dask(X, Y, bins, logtype, block_size=None):
     """
     Calculate MI into an array with dask (the naive map is very inefficient)
 
+    X is split into column blocks which are scattered to the workers once, and each task returns the dense MI
+    array for one block of X against every variable in Y
+
     :param X: np.ndarray (n x m1)
-        Discrete array of bins
+        Continuous data (this will be discretized by column)
     :param Y: np.ndarray (n x m2)
         Discrete array of bins
     :param bins: int
         The total number of bins that were used to make the arrays discrete
     :param logtype: np.log func
         Which log function to use (log2 gives bits, ln gives nats)
+    :param block_size: int
+        The number of X variables in each task. Will be set from the number of worker threads if None.
     :return mi: np.ndarray (m1 x m2)
         Returns the mutual information array
     """
 
     assert MPControl.is_dask()
 
-    from inferelator.regression.mi import _calc_mi, _make_table, _make_discrete
+    from inferelator.regression.mi import (_make_array_discrete, _make_onehot, _make_onehot_tables, _calc_mi_block,
+                                           _mi_block_size)
 
     # Get a reference to the Dask controller
     DaskController = MPControl.client
 
     m1, m2 = X.shape[1], Y.shape[1]
 
+    if block_size is None:
+        n_threads = max(sum(DaskController.client.nthreads().values()), 1)
+        block_size = max(1, int(np.ceil(m1 / (n_threads * DASK_MI_BLOCKS_PER_THREAD))))
+
+    assert utils.Validator.argument_integer(block_size, low=1)
+
+    blocks = [(i, min(i + block_size, m1)) for i in range(0, m1, block_size)]
+
     def mi_make(i, x, y):
-        x = _make_discrete(x, bins)
-        return i, [_calc_mi(_make_table(x, y[:, j], bins), logtype=logtype) for j in range(m2)]
+        x = _make_array_discrete(x, bins)
+        y_onehot = _make_onehot(y, bins)
+
+        # Build contingency tables for sub-blocks of x so that memory use stays bounded
+        sub_size = _mi_block_size(m2, bins)
+        mi = np.empty((x.shape[1], m2), dtype=float)
+
+        for j in range(0, x.shape[1], sub_size):
+            x_onehot = _make_onehot(x[:, j:j + sub_size], bins)
+            mi[j:j + sub_size, :] = _calc_mi_block(_make_onehot_tables(x_onehot, y_onehot, bins), logtype=logtype)
+
+        return i, mi
 
     # Scatter Y to workers and keep track as Futures
     [scatter_y] = DaskController.client.scatter([Y], broadcast=True, hash=False)
 
+    # Scatter each block of X once (not broadcast; tasks are run wherever their block is)
+    scatter_x = DaskController.client.scatter([X[:, a:b].A if sps.isspmatrix(X) else X[:, a:b] for a, b in blocks],
+                                              hash=False)
+
     # Wait for scattering to finish before creating futures
     distributed.wait(scatter_y, timeout=DASK_SCATTER_TIMEOUT)
+    distributed.wait(scatter_x, timeout=DASK_SCATTER_TIMEOUT)
 
-    # Build an asynchronous list of Futures for each calculation of mi_make
-    future_list = [DaskController.client.submit(mi_make, i,
-                                                X[:, i].A.flatten() if sps.isspmatrix(X) else X[:, i].flatten(),
-                                                scatter_y)
-                   for i in range(m1)]
+    # Build an asynchronous list of Futures for each block
+    start, task_func = time.time(), _record_tasks(mi_make)
+    future_list = [DaskController.client.submit(task_func, i, scatter_x[i], scatter_y) for i in range(len(blocks))]
 
     # Collect results as they finish instead of waiting for all workers to be done
-    mi_list = process_futures_into_list(future_list)
+    mi_list = _record_stage(process_futures_into_list(future_list), mi_make, start)
 
-    # Convert the list of lists to an array
-    mi = np.array(mi_list)
+    # Stack the blocks into an array
+    mi = np.vstack(mi_list) if len(mi_list) > 0 else np.zeros((m1, m2), dtype=float)
     assert (m1, m2) == mi.shape, "Array {sh} produced [({m1}, {m2}) expected]".format(sh=mi.shape, m1=m1, m2=m2)
 
     DaskController.client.cancel(scatter_y)
+    DaskController.client.cancel(scatter_x)
 
     return mi
 
 
+def worker_memory_hygiene(restart_memory_fraction=None):
+    """
+    Run garbage collection and return freed heap memory to the OS on every worker. Workers which are still using
+    more than restart_memory_fraction of their memory limit afterwards are restarted (only those workers).
+
+    :param restart_memory_fraction: Restart workers using more than this fraction of their memory limit.
+        None never restarts workers.
+    :type restart_memory_fraction: float
+    :return: Addresses of the workers which were restarted
+    :rtype: list(str)
+    """
+
+    assert MPControl.is_dask()
+
+    DaskController = MPControl.client
+    worker_memory = DaskController.client.run(_trim_worker_memory)
+
+    if restart_memory_fraction is None:
+        return []
+
+    restart = [w for w, (rss, limit) in worker_memory.items() if limit and rss > restart_memory_fraction * limit]
+
+    if len(restart) > 0:
+        utils.Debug.vprint("Restarting {n} workers over the memory threshold".format(n=len(restart)), level=0)
+        DaskController.client.restart_workers(workers=restart)
+
+    return restart
+
+
+def _trim_worker_memory(dask_worker=None):
+    """
+    Collect garbage and ask glibc malloc to release free heap memory on a worker
+
+    :return: Process memory (RSS) and the worker memory limit (None if unknown) in bytes
+    :rtype: int, int
+    """
+
+    gc.collect()
+
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+    import psutil
+    rss = psutil.Process().memory_info().rss
+    limit = getattr(dask_worker, "memory_limit", None)
+
+    return rss, limit
+
+
 def dask_map(func, *args, **kwargs):
     """
     Dask map
@@ -275,6 +475,10 @@ def dask_map(func, *args, **kwargs):
 
     assert MPControl.is_dask()
 
+    # Drop keyword arguments that are only used by the other engines
+    for k in ("tmp_file_path", "tell_children", "chunksize"):
+        kwargs.pop(k, None)
+
     def _func_caller(f, i, *a, **k):
         return i, f(*a, **k)
 
@@ -282,6 +486,48 @@ def dask_map(func, *args, **kwargs):
                                       for i, za in enumerate(zip(*args))])
 
 
+def dask_imap(func, *args, ordered=True, max_in_flight=None, **kwargs):
+    """
+    Dask map which yields (index, result) tuples as tasks finish. Only max_in_flight tasks are submitted to the
+    scheduler at once, and each future is released as soon as its result has been retrieved.
+
+    :param func: function to map
+    :type func: callable
+    :param args: positional arguments for func
+    :type args: iterable
+    :param ordered: Yield results in input order. If False, yield results as they finish.
+    :type ordered: bool
+    :param max_in_flight: Maximum number of tasks which are submitted but not yet yielded. Will be set from the
+        number of worker threads if None.
+    :type max_in_flight: int
+    :param kwargs: keyword (non-iterable) arguments for func. Keywords will be passed to dask client.submit.
+    """
+
+    assert MPControl.is_dask()
+
+    DaskController = MPControl.client
+
+    # Drop keyword arguments that are only used by the other engines
+    for k in ("tmp_file_path", "tell_children", "chunksize"):
+        kwargs.pop(k, None)
+
+    task_args = list(zip(*args))
+
+    if max_in_flight is None:
+        max_in_flight = max(sum(DaskController.client.nthreads().values()), 1) * IN_FLIGHT_PER_WORKER
+
+    def _get_result(future):
+        DaskController.check_cluster_state()
+        result = future.result()
+        future.cancel()
+        return result
+
+    return stream_tasks(lambda i: DaskController.client.submit(func, *task_args[i], pure=False, **kwargs),
+                        lambda futures: distributed.wait(futures, return_when="FIRST_COMPLETED").done,
+                        _get_result,
+                        len(task_args), ordered=ordered, max_in_flight=max_in_flight)
+
+
 def process_futures_into_list(future_list, raise_on_error=True, check_results=True):
     """
     Take a list of futures and turn them into a list of results
@@ -8,6 +8,7 @@ except ImportError:
     pass
 
 from inferelator.distributed import AbstractController
+from inferelator.distributed.dask_functions import dask_map, dask_imap
 
 from dask import distributed
 
@@ -64,7 +65,11 @@ class DaskK8Controller(AbstractController):
 
     @classmethod
     def map(cls, func, *args, **kwargs):
-        raise NotImplementedError
+        return dask_map(func, *args, **kwargs)
+
+    @classmethod
+    def imap(cls, func, *args, ordered=True, max_in_flight=None, **kwargs):
+        return dask_imap(func, *args, ordered=ordered, max_in_flight=max_in_flight, **kwargs)
 
     @classmethod
     def set_processes(cls, process_count):
@@ -1,4 +1,4 @@
-from inferelator.distributed.dask_functions import dask_map
+from inferelator.distributed.dask_functions import dask_map, dask_imap
 import os
 
 # Maintain python 2 compatibility
@@ -66,6 +66,10 @@ class DaskController(AbstractController):
     def map(cls, func, *args, **kwargs):
         return dask_map(func, *args, **kwargs)
 
+    @classmethod
+    def imap(cls, func, *args, ordered=True, max_in_flight=None, **kwargs):
+        return dask_imap(func, *args, ordered=ordered, max_in_flight=max_in_flight, **kwargs)
+
     @classmethod
     def set_processes(cls, process_count):
         """
@@ -0,0 +1,286 @@
+"""
+FaultTolerantController runs everything through forked worker processes which are managed one task at a time
+Workers that die (e.g. segfault or OOM kill) are respawned, and failed or timed out tasks are retried up to a limit
+Completed results are kept, so a transient failure only costs the tasks which were running when it happened
+"""
+
+import time
+import collections
+import collections.abc
+from multiprocessing import connection
+
+from inferelator.distributed import shared_memory_controller as shm
+from inferelator.utils import Debug
+from inferelator.utils import Validator as check
+
+
+class TaskFailedError(RuntimeError):
+    """
+    A task failed more times than allowed. The results which were finished are in the results attribute
+    (with None for tasks which were not finished).
+    """
+
+    def __init__(self, message, results=None):
+        super(TaskFailedError, self).__init__(message)
+        self.results = results
+
+
+def _worker_loop(conn):
+    """
+    Run task indices from the parent until it sends None or closes the pipe
+    """
+
+    while True:
+        try:
+            idx = conn.recv()
+        except EOFError:
+            break
+
+        if idx is None:
+            break
+
+        try:
+            conn.send((idx, True, shm._run_task(idx)))
+        except Exception as err:
+            conn.send((idx, False, "{t}: {e}".format(t=type(err).__name__, e=str(err))))
+
+
+class _Worker:
+    """
+    A worker process, its pipe, and the task it is running
+    """
+
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_loop, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+        self.task, self.start = None, None
+
+    def send(self, idx):
+        self.conn.send(idx)
+        self.task, self.start = idx, time.monotonic()
+
+    def stop(self, timeout=1):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+
+        self.process.join(timeout)
+
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+
+        self.conn.close()
+
+    def kill(self):
+        self.process.terminate()
+        self.process.join()
+        self.conn.close()
+
+
+class FaultTolerantController(shm.SharedMemoryController):
+    _controller_name = "fault-tolerant"
+    client = None
+
+    # Num processes
+    processes = 4
+
+    # Number of times a task can be retried after it fails
+    max_retries = 2
+
+    # Number of seconds a task can run before it is killed and retried
+    # None allows tasks to run forever
+    task_timeout = None
+
+    @classmethod
+    def connect(cls, *args, **kwargs):
+        """
+        Get a fork multiprocessing context and set the task retry parameters
+
+        :param max_retries: Number of times a task can be retried after it fails
+        :type max_retries: int
+        :param task_timeout: Number of seconds a task can run before it is killed and retried. None disables timeouts.
+        :type task_timeout: float
+        """
+
+        cls.set_task_parameters(max_retries=kwargs.pop("max_retries", None),
+                                task_timeout=kwargs.pop("task_timeout", None))
+
+        return super(FaultTolerantController, cls).connect(*args, **kwargs)
+
+    @classmethod
+    def set_task_parameters(cls, max_retries=None, task_timeout=None):
+        """
+        Set the retry limit and timeout for tasks
+
+        :param max_retries: Number of times a task can be retried after it fails
+        :type max_retries: int
+        :param task_timeout: Number of seconds a task can run before it is killed and retried
+        :type task_timeout: float
+        """
+
+        if max_retries is not None:
+            assert check.argument_integer(max_retries, low=0)
+            cls.max_retries = max_retries
+
+        if task_timeout is not None:
+            assert check.argument_numeric(task_timeout, low=0)
+            cls.task_timeout = task_timeout
+
+    @classmethod
+    def map(cls, func, *args, **kwargs):
+        """
+        Map a function across iterable(s) and return a list of results
+
+        Each worker runs one task at a time. If a task raises an exception, runs longer than the task timeout, or
+        its worker dies, the task is retried (on a new worker if necessary). If any task fails more than max_retries
+        times, a TaskFailedError is raised with the results that were finished.
+
+        :param func: function
+            Mappable function
+        :param args: iterable
+            Iterator(s)
+        """
+        assert check.argument_callable(func)
+        assert check.argument_list_type(args, collections.abc.Iterable)
+
+        # Nested calls to map (from inside a worker) run serially
+        if shm._MAP_FUNC is not None:
+            return list(map(func, *args))
+
+        task_args = list(zip(*args))
+        results = [None] * len(task_args)
+
+        try:
+            for idx, data in cls._imap(func, task_args, False, None):
+                results[idx] = data
+        except TaskFailedError as err:
+            err.results = results
+            raise
+
+        return results
+
+    @classmethod
+    def _imap(cls, func, task_args, ordered, max_in_flight):
+        """
+        Publish the function and arguments and yield (index, result) tuples from the workers. Each worker has one
+        task at a time, and no more than max_in_flight tasks are started but not yet yielded (results which are
+        waiting for an earlier task to be yielded in order count against this limit).
+        """
+
+        if len(task_args) == 0:
+            return
+
+        shm._MAP_FUNC, shm._MAP_ARGS = func, task_args
+
+        try:
+            yield from cls._run_tasks(len(task_args), ordered=ordered, max_in_flight=max_in_flight)
+        finally:
+            shm._MAP_FUNC, shm._MAP_ARGS = None, None
+
+    @classmethod
+    def _run_tasks(cls, n, ordered=False, max_in_flight=None):
+        """
+        Run tasks [0, n) on workers, retrying failures, and yield (index, result) tuples as they finish (or in index
+        order if ordered is set). No more than max_in_flight tasks are started but not yet yielded; tasks which are
+        being retried have already been started, so they are always run.
+        """
+
+        finished, failures = [False] * n, [0] * n
+        retries, workers, buffered = collections.deque(), [], {}
+        next_submit, next_yield, n_yielded = 0, 0, 0
+
+        def _n_ready():
+            n_new = n - next_submit
+            if max_in_flight is not None:
+                n_new = min(n_new, max_in_flight - (next_submit - n_yielded))
+            return len(retries) + max(n_new, 0)
+
+        def _fail(idx, reason):
+            failures[idx] += 1
+
+            if failures[idx] > cls.max_retries:
+                raise TaskFailedError("Task {i} failed {n} times ({r})".format(i=idx, n=failures[idx], r=reason))
+
+            Debug.vprint("Retrying task {i} ({r})".format(i=idx, r=reason), level=0)
+            retries.append(idx)
+
+        def _remove(worker):
+            workers.remove(worker)
+            worker.kill()
+
+        try:
+            while n_yielded < n:
+
+                # Start workers to replace any that were lost, and give every idle worker a task
+                while len(workers) < min(cls.processes, _n_ready() + sum(w.task is not None for w in workers)):
+                    workers.append(_Worker(cls.client))
+
+                for worker in workers:
+                    if worker.task is not None or _n_ready() == 0:
+                        continue
+
+                    if len(retries) > 0:
+                        idx = retries.popleft()
+                    else:
+                        idx, next_submit = next_submit, next_submit + 1
+
+                    try:
+                        worker.send(idx)
+                    except (OSError, ValueError):
+                        retries.appendleft(idx)
+
+                # Wait for a result, a worker to die, or the next task timeout
+                wait_time = None
+                if cls.task_timeout is not None:
+                    now = time.monotonic()
+                    wait_time = max(min([w.start + cls.task_timeout - now for w in workers if w.task is not None],
+                                        default=cls.task_timeout), 0)
+
+                connection.wait([w.conn for w in workers] + [w.process.sentinel for w in workers], timeout=wait_time)
+
+                for worker in list(workers):
+                    try:
+                        message = worker.conn.recv() if worker.conn.poll() else None
+                    except (EOFError, OSError):
+                        message = None
+
+                    if message is not None:
+                        idx, success, data = message
+                        worker.task = None
+
+                        if success and not finished[idx]:
+                            finished[idx] = True
+
+                            if ordered:
+                                buffered[idx] = data
+                            else:
+                                n_yielded += 1
+                                yield idx, data
+
+                        elif not success:
+                            _fail(idx, data)
+
+                    if not worker.process.is_alive():
+                        _remove(worker)
+
+                        if worker.task is not None:
+                            _fail(worker.task, "worker exited with code {c}".format(c=worker.process.exitcode))
+
+                    elif (cls.task_timeout is not None and worker.task is not None and
+                          time.monotonic() - worker.start > cls.task_timeout):
+                        _remove(worker)
+                        _fail(worker.task, "timed out after {t} seconds".format(t=cls.task_timeout))
+
+                while ordered and next_yield in buffered:
+                    n_yielded += 1
+                    yield next_yield, buffered.pop(next_yield)
+                    next_yield += 1
+
+        finally:
+            for worker in workers:
+                worker.stop()
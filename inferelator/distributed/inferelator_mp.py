@@ -1,9 +1,20 @@
 from inferelator.distributed import AbstractController
+from inferelator.distributed.telemetry import TaskTelemetry, RecordedTask
 from inferelator import utils
+import itertools
+import threading
+import time
+import numpy as np
 import warnings
 
 DEFAULT_MP_ENGINE = "local"
 
+# Number of chunks to make for each worker when map is given cost estimates
+CHUNKS_PER_WORKER = 4
+
+# Set in the thread that is running a SerialTask
+_serial_state = threading.local()
+
 
 class MPControl(AbstractController):
     """
@@ -17,6 +28,9 @@ class MPControl(AbstractController):
     # Relevant external state booleans
     is_initialized = False
 
+    # Task telemetry (None if it isn't being recorded)
+    telemetry = None
+
     @classmethod
     def name(cls):
         """
@@ -31,7 +45,7 @@ class MPControl(AbstractController):
         """
         This returns True if dask functions should be used
         """
-        if cls.client is None:
+        if cls.client is None or _in_serial_task():
             return False
         return cls.client.is_dask()
 
@@ -46,6 +60,9 @@ class MPControl(AbstractController):
         dask-k8
         dask-local
         multiprocessing
+        shared-memory
+        fault-tolerant
+        threads
         local
 
         :param engine: A string to lookup the controller or a Controller object
@@ -71,6 +88,15 @@ class MPControl(AbstractController):
             elif engine == "multiprocessing":
                 from inferelator.distributed.multiprocessing_controller import MultiprocessingController
                 cls.client = MultiprocessingController
+            elif engine == "shared-memory":
+                from inferelator.distributed.shared_memory_controller import SharedMemoryController
+                cls.client = SharedMemoryController
+            elif engine == "fault-tolerant":
+                from inferelator.distributed.fault_tolerant_controller import FaultTolerantController
+                cls.client = FaultTolerantController
+            elif engine == "threads":
+                from inferelator.distributed.thread_controller import ThreadController
+                cls.client = ThreadController
             elif engine == "local":
                 from inferelator.distributed.local_controller import LocalController
                 cls.client = LocalController
@@ -107,13 +133,171 @@ class MPControl(AbstractController):
         return connect_return
 
     @classmethod
-    def map(cls, func, *args, **kwargs):
+    def enable_telemetry(cls):
+        """
+        Start recording the time, worker and input and result sizes of every task that is mapped
+        """
+        if cls.telemetry is None:
+            cls.telemetry = TaskTelemetry()
+
+    @classmethod
+    def disable_telemetry(cls):
+        """
+        Stop recording task telemetry and discard any records
+        """
+        cls.telemetry = None
+
+    @classmethod
+    def map(cls, func, *args, cost=None, stage=None, labels=None, **kwargs):
         """
         Map using the `.map()` implementation in the multiprocessing engine
+
+        If cost estimates are provided, items are grouped into chunks with roughly equal total cost and the chunks
+        are submitted most expensive item first (longest processing time first). Expensive items start early and
+        cheap items fill in the gaps at the end, instead of a few expensive items running alone at the tail.
+
+        :param func: Mappable function
+        :type func: callable
+        :param args: Iterator(s)
+        :type args: iterable
+        :param cost: Estimated relative cost of each item. None maps every item with the engine's own scheduling.
+        :type cost: np.ndarray, list
+        :param stage: A name for this map in the task telemetry. None uses the function name.
+        :type stage: str
+        :param labels: Labels for each item in the task telemetry (e.g. gene names). None uses the item index.
+        :type labels: list
+        :return: List of results in the same order as the items
+        :rtype: list
         """
+        if _in_serial_task():
+            return list(map(func, *args))
+
         if not cls.is_initialized:
             raise RuntimeError("Connect before calling map()")
-        return cls.client.map(func, *args, **kwargs)
+
+        if cls.telemetry is None:
+            return cls._map(func, *args, cost=cost, **kwargs)
+
+        start = time.time()
+        recorded = cls._map(RecordedTask(func), itertools.count(), *args, cost=cost, **kwargs)
+        cls.telemetry.add_stage(_stage_name(func, stage), start, time.time(), cls.client.num_workers(),
+                                [rec for _, rec in recorded], labels=labels)
+
+        return [res for res, _ in recorded]
+
+    @classmethod
+    def _map(cls, func, *args, cost=None, **kwargs):
+
+        if cost is None or cls.client.num_workers() < 2:
+            return cls.client.map(func, *args, **kwargs)
+
+        tasks = list(zip(*args))
+
+        if len(tasks) != len(cost):
+            raise ValueError("{n} cost estimates provided for {t} items".format(n=len(cost), t=len(tasks)))
+
+        chunks = cost_chunks(cost, cls.client.num_workers() * CHUNKS_PER_WORKER)
+
+        kwargs["chunksize"] = 1
+        chunk_results = cls.client.map(_run_chunk, [func] * len(chunks), [[tasks[i] for i in c] for c in chunks],
+                                       **kwargs)
+
+        results = [None] * len(tasks)
+        for chunk, chunk_result in zip(chunks, chunk_results):
+            for i, res in zip(chunk, chunk_result):
+                results[i] = res
+
+        return results
+
+    @classmethod
+    def imap(cls, func, *args, max_in_flight=None, **kwargs):
+        """
+        Map using the `.imap()` implementation in the multiprocessing engine and yield results in input order as
+        they become available. Only max_in_flight tasks are submitted but not yet yielded at once, so results can be
+        processed one at a time without holding all of them in memory.
+
+        :param func: Mappable function
+        :type func: callable
+        :param args: Iterator(s)
+        :type args: iterable
+        :param max_in_flight: Maximum number of tasks which are submitted but not yet yielded. None uses a small
+            multiple of the number of workers.
+        :type max_in_flight: int
+        :return: Generator of results
+        """
+        return (res for _, res in cls._imap(func, *args, ordered=True, max_in_flight=max_in_flight, **kwargs))
+
+    @classmethod
+    def as_completed(cls, func, *args, max_in_flight=None, cost=None, labels=None, **kwargs):
+        """
+        Map using the `.imap()` implementation in the multiprocessing engine and yield (index, result) tuples in
+        the order that tasks finish
+
+        :param func: Mappable function
+        :type func: callable
+        :param args: Iterator(s)
+        :type args: iterable
+        :param max_in_flight: Maximum number of tasks which are submitted but not yet yielded. None uses a small
+            multiple of the number of workers.
+        :type max_in_flight: int
+        :param cost: Estimated relative cost of each item. Items are submitted most expensive first, so that
+            expensive items start early and cheap items fill in the gaps at the end. None submits items in order.
+        :type cost: np.ndarray, list
+        :param labels: Labels for each item in the task telemetry (e.g. gene names). None uses the item index.
+        :type labels: list
+        :return: Generator of (index, result) tuples
+        """
+
+        if cost is None:
+            return cls._imap(func, *args, ordered=False, max_in_flight=max_in_flight, labels=labels, **kwargs)
+
+        args = [list(a) for a in args]
+        cost = np.asarray(cost, dtype=float)
+
+        if any(len(a) != len(cost) for a in args):
+            raise ValueError("{n} cost estimates provided for {t} items".format(n=len(cost),
+                                                                                 t=min(len(a) for a in args)))
+
+        order = np.argsort(-cost, kind="stable")
+        labels = order if labels is None else [labels[i] for i in order]
+
+        return ((int(order[i]), res) for i, res in cls._imap(func, *[[a[i] for i in order] for a in args],
+                                                              ordered=False, max_in_flight=max_in_flight,
+                                                              labels=labels, **kwargs))
+
+    @classmethod
+    def _imap(cls, func, *args, ordered=True, max_in_flight=None, stage=None, labels=None, **kwargs):
+        if _in_serial_task():
+            return enumerate(map(func, *args))
+
+        if not cls.is_initialized:
+            raise RuntimeError("Connect before calling imap()")
+
+        if max_in_flight is not None:
+            assert utils.Validator.argument_integer(max_in_flight, low=1)
+
+        if cls.telemetry is None:
+            return cls.client.imap(func, *args, ordered=ordered, max_in_flight=max_in_flight, **kwargs)
+
+        recorded = cls.client.imap(RecordedTask(func), itertools.count(), *args, ordered=ordered,
+                                   max_in_flight=max_in_flight, **kwargs)
+
+        return cls._record_stream(recorded, _stage_name(func, stage), labels)
+
+    @classmethod
+    def _record_stream(cls, recorded, stage, labels):
+        """
+        Yield (index, result) tuples from a recorded imap and add the records to the telemetry when it's finished
+        """
+
+        start, records = time.time(), []
+
+        try:
+            for i, (res, rec) in recorded:
+                records.append(rec)
+                yield i, res
+        finally:
+            cls.telemetry.add_stage(stage, start, time.time(), cls.client.num_workers(), records, labels=labels)
 
     @classmethod
     def set_processes(cls, process_count):
@@ -124,6 +308,13 @@ class MPControl(AbstractController):
             raise RuntimeError("Cannot set processes after the engine has started")
         return cls.client.set_processes(process_count)
 
+    @classmethod
+    def set_restart_memory_fraction(cls, fraction):
+        """
+        Set the fraction of their memory limit that dask workers can use after a regression before they are restarted
+        """
+        return cls.client.set_restart_memory_fraction(fraction)
+
     @classmethod
     def shutdown(cls):
         """
@@ -138,3 +329,70 @@ class MPControl(AbstractController):
             client_off = True
 
         return client_off
+
+
+class SerialTask:
+    """
+    Wrap a mappable function so that any MPControl calls it makes are run serially in the worker that is running
+    it, instead of being submitted to the engine from inside a task
+    """
+
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, *args):
+        previous = _in_serial_task()
+        _serial_state.active = True
+
+        try:
+            return self.func(*args)
+        finally:
+            _serial_state.active = previous
+
+
+def _in_serial_task():
+    return getattr(_serial_state, "active", False)
+
+
+def cost_chunks(cost, n_chunks):
+    """
+    Group items into chunks with roughly equal total cost. Items are taken from most to least expensive, so
+    expensive items end up alone in the first chunks and cheap items are grouped together in the last chunks.
+
+    :param cost: Estimated relative cost of each item
+    :type cost: np.ndarray, list
+    :param n_chunks: Target number of chunks
+    :type n_chunks: int
+    :return: List of chunks, each of which is a list of item indices
+    :rtype: list(list(int))
+    """
+
+    cost = np.clip(np.asarray(cost, dtype=float), 0, None)
+
+    # Fall back to uniform costs if there's no useful estimate
+    if cost.sum() <= 0 or not np.all(np.isfinite(cost)):
+        cost = np.ones_like(cost)
+
+    target = cost.sum() / max(n_chunks, 1)
+
+    chunks, current, current_cost = [], [], 0.
+    for i in np.argsort(-cost, kind="stable"):
+        current.append(int(i))
+        current_cost += cost[i]
+
+        if current_cost >= target:
+            chunks.append(current)
+            current, current_cost = [], 0.
+
+    if len(current) > 0:
+        chunks.append(current)
+
+    return chunks
+
+
+def _run_chunk(func, chunk_tasks):
+    return [func(*task) for task in chunk_tasks]
+
+
+def _stage_name(func, stage=None):
+    return stage if stage is not None else getattr(func, "__qualname__", type(func).__name__)
@@ -34,6 +34,20 @@ class LocalController(AbstractController):
         assert check.argument_list_type(arg, collections.abc.Iterable)
         return list(map(func, *arg))
 
+    @classmethod
+    def imap(cls, func, *args, ordered=True, max_in_flight=None, **kwargs):
+        """
+        Map a function across iterable(s) lazily and yield (index, result) tuples
+
+        :param func: function
+            Mappable function
+        :param args: iterable
+            Iterator(s)
+        """
+        assert check.argument_callable(func)
+        assert check.argument_list_type(args, collections.abc.Iterable)
+        return enumerate(map(func, *args))
+
     @classmethod
     def set_processes(cls, process_count):
         """
@@ -6,7 +6,7 @@ This requires pathos because the default multiprocessing serializes with cPickle
 import pathos
 import collections.abc
 
-from inferelator.distributed import AbstractController
+from inferelator.distributed import AbstractController, stream_tasks, poll_any
 from inferelator.utils import Validator as check
 
 
@@ -48,7 +48,30 @@ class MultiprocessingController(AbstractController):
         """
         assert check.argument_callable(func)
         assert check.argument_list_type(args, collections.abc.Iterable)
-        return cls.client.map(func, *args, chunksize=cls.chunk)
+        return cls.client.map(func, *args, chunksize=kwargs.pop("chunksize", cls.chunk))
+
+    @classmethod
+    def imap(cls, func, *args, ordered=True, max_in_flight=None, **kwargs):
+        """
+        Map a function across iterable(s) and yield (index, result) tuples as they finish, with a limited number of
+        tasks submitted to the pool at once
+
+        :param func: function
+            Mappable function
+        :param args: iterable
+            Iterator(s)
+        :param ordered: Yield results in input order
+        :type ordered: bool
+        :param max_in_flight: Maximum number of tasks which are submitted but not yet yielded
+        :type max_in_flight: int
+        """
+        assert check.argument_callable(func)
+        assert check.argument_list_type(args, collections.abc.Iterable)
+
+        task_args = list(zip(*args))
+
+        return stream_tasks(lambda i: cls.client.apipe(func, *task_args[i]), poll_any, lambda h: h.get(),
+                            len(task_args), ordered=ordered, max_in_flight=cls._max_in_flight(max_in_flight))
 
     @classmethod
     def shutdown(cls):
@@ -0,0 +1,143 @@
+"""
+SharedMemoryController runs everything through a forked multiprocessing Pool
+The mapped function and its arguments are handed to the pool initializer and inherited by the forked workers
+Workers only receive task indices, so large read-only arrays (the design matrix, priors, weights) are never pickled
+"""
+
+import multiprocessing
+import collections.abc
+
+from inferelator.distributed import AbstractController, stream_tasks, poll_any
+from inferelator.utils import Validator as check
+
+# The function and argument tuples for the map call which this worker is running
+# These are only set in the workers (by the pool initializer), so the parent process keeps no state between calls
+_MAP_FUNC = None
+_MAP_ARGS = None
+
+
+def _init_worker(func, task_args):
+    """
+    Set the function and argument tuples in a forked worker. With the fork context, initializer arguments are
+    inherited by the worker instead of being pickled.
+    """
+    global _MAP_FUNC, _MAP_ARGS
+    _MAP_FUNC, _MAP_ARGS = func, task_args
+
+
+def _run_task(idx):
+    """
+    Run one task in a worker process from its index into the published arguments
+    """
+    return _MAP_FUNC(*_MAP_ARGS[idx])
+
+
+class SharedMemoryController(AbstractController):
+    _controller_name = "shared-memory"
+    client = None
+
+    # Control variables
+    # None lets the pool pick a chunk size from the number of tasks
+    chunk = None
+
+    # Num processes
+    processes = 4
+
+    @classmethod
+    def connect(cls, *args, **kwargs):
+        """
+        Get a fork multiprocessing context. This engine requires fork so that workers inherit the parent's memory.
+        """
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise RuntimeError("The shared-memory engine requires fork; use the multiprocessing engine instead")
+
+        cls.client = multiprocessing.get_context("fork")
+        return True
+
+    @classmethod
+    def set_processes(cls, process_count):
+        """
+        Set the number of worker processes to use
+        :param process_count: int
+        :return:
+        """
+        assert check.argument_integer(process_count, low=1)
+
+        cls.processes = process_count
+
+    @classmethod
+    def map(cls, func, *args, **kwargs):
+        """
+        Map a function across iterable(s) and return a list of results
+
+        A new pool is forked for each call, so anything the function references is shared with the workers
+        once per stage instead of being serialized into every chunk. Only the task index is sent to the workers
+        and only the function return value is sent back.
+
+        :param func: function
+            Mappable function
+        :param args: iterable
+            Iterator(s)
+        """
+        assert check.argument_callable(func)
+        assert check.argument_list_type(args, collections.abc.Iterable)
+
+        # Nested calls to map (from inside a worker) run serially
+        if _MAP_FUNC is not None:
+            return list(map(func, *args))
+
+        task_args = list(zip(*args))
+
+        if len(task_args) == 0:
+            return []
+
+        with cls._pool(func, task_args) as pool:
+            return pool.map(_run_task, range(len(task_args)), chunksize=kwargs.pop("chunksize", cls.chunk))
+
+    @classmethod
+    def imap(cls, func, *args, ordered=True, max_in_flight=None, **kwargs):
+        """
+        Map a function across iterable(s) and yield (index, result) tuples as they finish, with a limited number of
+        tasks submitted to the pool at once. The pool (and the published arguments) are kept until the generator
+        is finished or closed.
+
+        :param func: function
+            Mappable function
+        :param args: iterable
+            Iterator(s)
+        :param ordered: Yield results in input order
+        :type ordered: bool
+        :param max_in_flight: Maximum number of tasks which are submitted but not yet yielded
+        :type max_in_flight: int
+        """
+        assert check.argument_callable(func)
+        assert check.argument_list_type(args, collections.abc.Iterable)
+
+        if _MAP_FUNC is not None:
+            return enumerate(map(func, *args))
+
+        return cls._imap(func, list(zip(*args)), ordered, cls._max_in_flight(max_in_flight))
+
+    @classmethod
+    def _imap(cls, func, task_args, ordered, max_in_flight):
+
+        if len(task_args) == 0:
+            return
+
+        with cls._pool(func, task_args) as pool:
+            yield from stream_tasks(lambda i: pool.apply_async(_run_task, (i,)), poll_any, lambda h: h.get(),
+                                    len(task_args), ordered=ordered, max_in_flight=max_in_flight)
+
+    @classmethod
+    def _pool(cls, func, task_args):
+        """
+        Fork a pool whose workers run func on task_args. The state is only set in the workers, so an unfinished
+        imap generator cannot leave it set in the parent and cause later calls to run serially.
+        """
+        return cls.client.Pool(processes=min(cls.processes, len(task_args)), initializer=_init_worker,
+                               initargs=(func, task_args))
+
+    @classmethod
+    def shutdown(cls):
+        cls.client = None
+        return True
@@ -0,0 +1,186 @@
+"""
+Task telemetry records the wall time, worker, and input and result sizes for every task mapped through MPControl
+Stages (one call to map) are summarized with throughput, latency percentiles, idle worker time and the slowest tasks
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import threading
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sps
+
+from inferelator.utils import Debug
+
+TASK_REPORT_FILE_NAME = "task_telemetry.tsv"
+STAGE_REPORT_FILE_NAME = "stage_telemetry.json"
+
+# Number of the slowest tasks to include in each stage summary
+NUM_SLOWEST_TASKS = 10
+
+TASK_REPORT_COLUMNS = ["stage", "index", "label", "worker", "start", "seconds", "input_bytes", "result_bytes"]
+
+
+class RecordedTask:
+    """
+    Wrap a mappable function so that it returns (result, record) where record has the task timing, worker id and
+    input and result sizes. The first argument is the task index.
+    """
+
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, idx, *args):
+        start = time.time()
+        result = self.func(*args)
+        end = time.time()
+
+        return result, dict(index=idx,
+                            start=start,
+                            end=end,
+                            worker="{h}:{p}:{t}".format(h=socket.gethostname(), p=os.getpid(),
+                                                        t=threading.current_thread().name),
+                            input_bytes=_nbytes(args),
+                            result_bytes=_nbytes(result))
+
+
+class TaskTelemetry:
+    """
+    Collect task records from each stage and write reports
+    """
+
+    stages = None
+
+    def __init__(self):
+        self.stages = []
+
+    def add_stage(self, name, start, end, n_workers, records, labels=None):
+        """
+        Add the task records for a stage
+
+        :param name: Stage name
+        :type name: str
+        :param start: Stage start time (from time.time())
+        :type start: float
+        :param end: Stage end time (from time.time())
+        :type end: float
+        :param n_workers: Number of workers which were available for the stage
+        :type n_workers: int
+        :param records: Task records from RecordedTask
+        :type records: list(dict)
+        :param labels: Labels for each task index (e.g. gene names). None uses the task index.
+        :type labels: list
+        """
+
+        records = [r for r in records if r is not None]
+
+        for r in records:
+            r["label"] = str(labels[r["index"]]) if labels is not None else str(r["index"])
+
+        self.stages.append(dict(name=name, start=start, end=end, n_workers=n_workers, records=records))
+
+        summary = self.summarize_stage(self.stages[-1])
+        Debug.vprint("Stage {n}: {t} tasks in {w:.2f}s (p95 {p:.3f}s)".format(n=name, t=summary["n_tasks"],
+                                                                             w=summary["wall_seconds"],
+                                                                             p=summary["latency_p95"]), level=1)
+
+    @staticmethod
+    def summarize_stage(stage):
+        """
+        Summarize the task records for a stage
+
+        :param stage: Stage from add_stage
+        :type stage: dict
+        :return: Stage summary with task count, throughput, latency percentiles, idle worker time and the slowest
+            tasks
+        :rtype: dict
+        """
+
+        records = stage["records"]
+        seconds = np.array([r["end"] - r["start"] for r in records], dtype=float)
+        wall = max(stage["end"] - stage["start"], 0.)
+
+        def _pct(q):
+            return float(np.percentile(seconds, q)) if len(seconds) > 0 else 0.
+
+        slowest = sorted(records, key=lambda r: r["end"] - r["start"], reverse=True)[:NUM_SLOWEST_TASKS]
+
+        return dict(name=stage["name"],
+                    n_tasks=len(records),
+                    n_workers=stage["n_workers"],
+                    n_workers_used=len(set(r["worker"] for r in records)),
+                    wall_seconds=wall,
+                    task_seconds=float(seconds.sum()),
+                    throughput=len(records) / wall if wall > 0 else 0.,
+                    latency_p50=_pct(50),
+                    latency_p95=_pct(95),
+                    latency_p99=_pct(99),
+                    latency_max=float(seconds.max()) if len(seconds) > 0 else 0.,
+                    idle_worker_seconds=max(stage["n_workers"] * wall - float(seconds.sum()), 0.),
+                    input_bytes=int(sum(r["input_bytes"] for r in records)),
+                    result_bytes=int(sum(r["result_bytes"] for r in records)),
+                    slowest=[dict(label=r["label"], seconds=r["end"] - r["start"], worker=r["worker"])
+                             for r in slowest])
+
+    def summarize(self):
+        """
+        Summarize every stage
+
+        :return: Stage summaries
+        :rtype: list(dict)
+        """
+        return [self.summarize_stage(s) for s in self.stages]
+
+    def to_dataframe(self):
+        """
+        Make a dataframe with one row for each task in every stage. Start times are relative to the stage start.
+
+        :return: Task records
+        :rtype: pd.DataFrame
+        """
+
+        return pd.DataFrame([[i, r["index"], r["label"], r["worker"], r["start"] - s["start"], r["end"] - r["start"],
+                              r["input_bytes"], r["result_bytes"]]
+                             for i, s in enumerate(self.stages) for r in s["records"]],
+                            columns=TASK_REPORT_COLUMNS)
+
+    def write_report(self, output_dir):
+        """
+        Write the task records (TSV) and stage summaries (JSON) into a directory
+
+        :param output_dir: Path to write the reports into
+        :type output_dir: str
+        """
+
+        self.to_dataframe().to_csv(os.path.join(output_dir, TASK_REPORT_FILE_NAME), sep="\t", index=False)
+
+        with open(os.path.join(output_dir, STAGE_REPORT_FILE_NAME), "w") as out_fh:
+            json.dump([dict(stage=i, **s) for i, s in enumerate(self.summarize())], out_fh, indent=2)
+
+    def clear(self):
+        self.stages = []
+
+
+def _nbytes(obj):
+    """
+    Estimate the size of an object in bytes without serializing it
+    """
+
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    elif sps.issparse(obj) and hasattr(obj, "indptr"):
+        return obj.data.nbytes + obj.indices.nbytes + obj.indptr.nbytes
+    elif isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=False).sum())
+    elif isinstance(obj, pd.Series):
+        return int(obj.memory_usage(deep=False))
+    elif isinstance(obj, dict):
+        return sum(_nbytes(v) for v in obj.values())
+    elif isinstance(obj, (list, tuple)):
+        return sum(_nbytes(v) for v in obj)
+    else:
+        return sys.getsizeof(obj)
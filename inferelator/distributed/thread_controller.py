@@ -0,0 +1,141 @@
+"""
+ThreadController runs everything through a ThreadPoolExecutor in this process
+This works well for the regression functions which spend most of their time in numpy/BLAS/sklearn code that releases
+the GIL, and avoids pickling or duplicating the data for each worker
+"""
+
+import os
+import threading
+import itertools
+import collections.abc
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from inferelator.distributed import AbstractController, stream_tasks
+from inferelator.utils import Debug
+from inferelator.utils import Validator as check
+
+# Flag set on worker threads so that nested calls to map run serially instead of deadlocking the pool
+_worker_state = threading.local()
+
+
+def _run_in_worker(func, *args):
+    _worker_state.in_map = True
+    try:
+        return func(*args)
+    finally:
+        _worker_state.in_map = False
+
+
+class ThreadController(AbstractController):
+    _controller_name = "threads"
+    client = None
+
+    # Control variables
+    chunk = None
+
+    # Num threads
+    processes = 4
+
+    # Num BLAS threads per worker thread
+    # None sets this to the number of cores divided by the number of worker threads
+    blas_threads = None
+
+    # The threadpoolctl limiter which is active while the engine is connected
+    _blas_limiter = None
+
+    @classmethod
+    def connect(cls, *args, **kwargs):
+        """
+        Start a thread pool and limit BLAS threads so that worker threads x BLAS threads does not exceed the number
+        of cores. This requires threadpoolctl; if it is not installed, BLAS threads are not limited.
+
+        :param blas_threads: Number of BLAS threads to allow for each worker thread
+        :type blas_threads: int
+        """
+
+        blas_threads = kwargs.pop("blas_threads", cls.blas_threads)
+
+        if blas_threads is None:
+            blas_threads = max(1, (os.cpu_count() or 1) // cls.processes)
+
+        assert check.argument_integer(blas_threads, low=1)
+
+        try:
+            import threadpoolctl
+            cls._blas_limiter = threadpoolctl.threadpool_limits(limits=blas_threads, user_api="blas")
+            Debug.vprint("Using {n} threads with {b} BLAS threads each".format(n=cls.processes, b=blas_threads),
+                         level=1)
+        except ImportError:
+            Debug.vprint("Unable to import threadpoolctl; BLAS threads will not be limited", level=0)
+
+        cls.client = ThreadPoolExecutor(max_workers=cls.processes, **kwargs)
+        return True
+
+    @classmethod
+    def set_processes(cls, process_count):
+        """
+        Set the number of worker threads to use
+        :param process_count: int
+        :return:
+        """
+        assert check.argument_integer(process_count, low=1)
+
+        cls.processes = process_count
+
+    @classmethod
+    def map(cls, func, *args, **kwargs):
+        """
+        Map a function across iterable(s) and return a list of results
+
+        :param func: function
+            Mappable function
+        :param args: iterable
+            Iterator(s)
+        """
+        assert check.argument_callable(func)
+        assert check.argument_list_type(args, collections.abc.Iterable)
+
+        if getattr(_worker_state, "in_map", False):
+            return list(map(func, *args))
+
+        return list(cls.client.map(_run_in_worker, itertools.repeat(func), *args))
+
+    @classmethod
+    def imap(cls, func, *args, ordered=True, max_in_flight=None, **kwargs):
+        """
+        Map a function across iterable(s) and yield (index, result) tuples as they finish, with a limited number of
+        tasks submitted to the pool at once
+
+        :param func: function
+            Mappable function
+        :param args: iterable
+            Iterator(s)
+        :param ordered: Yield results in input order
+        :type ordered: bool
+        :param max_in_flight: Maximum number of tasks which are submitted but not yet yielded
+        :type max_in_flight: int
+        """
+        assert check.argument_callable(func)
+        assert check.argument_list_type(args, collections.abc.Iterable)
+
+        if getattr(_worker_state, "in_map", False):
+            return enumerate(map(func, *args))
+
+        task_args = list(zip(*args))
+
+        return stream_tasks(lambda i: cls.client.submit(_run_in_worker, func, *task_args[i]),
+                            lambda h: wait(h, return_when=FIRST_COMPLETED).done,
+                            lambda h: h.result(),
+                            len(task_args), ordered=ordered, max_in_flight=cls._max_in_flight(max_in_flight))
+
+    @classmethod
+    def shutdown(cls):
+        if cls.client is not None:
+            cls.client.shutdown(wait=True)
+            cls.client = None
+
+        if cls._blas_limiter is not None:
+            cls._blas_limiter.restore_original_limits()
+            cls._blas_limiter = None
+
+        return True
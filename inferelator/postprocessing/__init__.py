@@ -1,4 +1,5 @@
 from inferelator.postprocessing.column_names import *
+from inferelator.postprocessing.beta_stack import BetaStack
 from inferelator.postprocessing.model_metrics import MetricHandler, RankSummingMetric, CombinedMetric
 from inferelator.postprocessing.inferelator_results import InferelatorResults
 from inferelator.postprocessing.results_processor import ResultsProcessor
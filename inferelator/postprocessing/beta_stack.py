@@ -0,0 +1,190 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+class BetaStack(object):
+    """
+    A stack of model coefficients from each bootstrap [B x G x K]. Each bootstrap is stored as a sparse CSR
+    matrix [G x K], and summaries across bootstraps are calculated from the non-zero values without making the
+    stack dense.
+
+    Indexing or iterating over a BetaStack returns a dense pd.DataFrame [G x K] for each bootstrap, so it can be
+    used in place of a list of dataframes.
+    """
+
+    # Labels
+    index = None
+    columns = None
+
+    # List of sparse.csr_matrix [G x K]
+    _stack = None
+
+    def __init__(self, index=None, columns=None):
+        """
+        :param index: Row (gene) labels. Set from the first dataframe appended if None.
+        :type index: pd.Index
+        :param columns: Column (regulator) labels. Set from the first dataframe appended if None.
+        :type columns: pd.Index
+        """
+        self.index = pd.Index(index) if index is not None else None
+        self.columns = pd.Index(columns) if columns is not None else None
+        self._stack = []
+
+    @classmethod
+    def from_dataframes(cls, dataframes):
+        """
+        Create a BetaStack from a list of aligned dataframes
+
+        :param dataframes: list(pd.DataFrame [G x K]) [B]
+        :return: BetaStack
+        """
+        stack = cls()
+        for df in dataframes:
+            stack.append(df)
+        return stack
+
+    @property
+    def shape(self):
+        return len(self.index), len(self.columns)
+
+    @property
+    def nnz(self):
+        return sum(m.nnz for m in self._stack)
+
+    def __len__(self):
+        return len(self._stack)
+
+    def __getitem__(self, i):
+        return pd.DataFrame(self._stack[i].A, index=self.index, columns=self.columns)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def append(self, data):
+        """
+        Add one bootstrap to the stack
+
+        :param data: Model coefficients [G x K]. Dataframes are reordered to the stack labels.
+        :type data: pd.DataFrame, np.ndarray, sparse.spmatrix
+        """
+
+        if isinstance(data, pd.DataFrame):
+            if self.index is None:
+                self.index, self.columns = data.index, data.columns
+            elif not (data.index.equals(self.index) and data.columns.equals(self.columns)):
+                data = data.loc[self.index, self.columns]
+            data = data.values
+
+        if self.index is None:
+            raise ValueError("Labels must be set before adding unlabeled data to a BetaStack")
+
+        data = sparse.csr_matrix(data, dtype=float)
+        data.eliminate_zeros()
+
+        if data.shape != self.shape:
+            raise ValueError("Data {s} does not match BetaStack {s2}".format(s=data.shape, s2=self.shape))
+
+        self._stack.append(data)
+
+    def sign_sum(self):
+        """
+        Sum of the sign of each coefficient across bootstraps
+
+        :return: pd.DataFrame [G x K]
+        """
+        return self._to_dataframe(self._sum(lambda m: m.sign()))
+
+    def nonzero_count(self):
+        """
+        Number of bootstraps where each coefficient is non-zero
+
+        :return: pd.DataFrame [G x K]
+        """
+        return self._to_dataframe(self._sum(lambda m: (m != 0).astype(float)))
+
+    def mean(self):
+        """
+        Mean of each coefficient across bootstraps
+
+        :return: pd.DataFrame [G x K]
+        """
+        return self._to_dataframe(self._sum(lambda m: m) / len(self))
+
+    def median(self):
+        """
+        Median of each coefficient across bootstraps, counting the bootstraps where a coefficient is not stored as 0
+
+        :return: pd.DataFrame [G x K]
+        """
+
+        n_boots, (n_rows, n_cols) = len(self), self.shape
+        median = np.zeros(n_rows * n_cols, dtype=float)
+
+        if self.nnz == 0:
+            return self._to_dataframe(median.reshape(n_rows, n_cols))
+
+        # Flat index and value of every non-zero in the stack, sorted by flat index and then by value
+        coo = [m.tocoo() for m in self._stack]
+        flat_idx = np.concatenate([m.row.astype(np.int64) * n_cols + m.col for m in coo])
+        vals = np.concatenate([m.data for m in coo])
+
+        order = np.lexsort((vals, flat_idx))
+        flat_idx, vals = flat_idx[order], vals[order]
+
+        # Group the values for each coefficient
+        coef_idx, start, n_nonzero = np.unique(flat_idx, return_index=True, return_counts=True)
+        n_neg = np.add.reduceat((vals < 0).astype(int), start)
+        n_zero = n_boots - n_nonzero
+
+        def _order_statistic(rank):
+            # In sorted order, each coefficient has n_neg negative values, then n_zero zeros, then positive values
+            stat = np.zeros(len(coef_idx), dtype=float)
+            neg, pos = rank < n_neg, rank >= n_neg + n_zero
+            stat[neg] = vals[start[neg] + rank]
+            stat[pos] = vals[start[pos] + rank - n_zero[pos]]
+            return stat
+
+        median[coef_idx] = (_order_statistic((n_boots - 1) // 2) + _order_statistic(n_boots // 2)) / 2
+        median[coef_idx[np.add.reduceat(np.isnan(vals).astype(int), start) > 0]] = np.nan
+
+        return self._to_dataframe(median.reshape(n_rows, n_cols))
+
+    def rank_sum(self):
+        """
+        Rank all of the coefficients in each bootstrap (ties are given the average rank) and sum the ranks across
+        bootstraps. The zeros in each bootstrap all share one rank, so only the non-zero values are ranked.
+
+        :return: pd.DataFrame [G x K]
+        """
+
+        n_total = self.shape[0] * self.shape[1]
+        rank_sum = np.zeros(self.shape, dtype=float)
+
+        for m in self._stack:
+            m = m.tocoo()
+
+            n_neg = np.sum(m.data < 0)
+            n_zero = n_total - m.nnz
+
+            # Rank of every zero, which is added to every coefficient and corrected for the non-zero values
+            zero_rank = n_neg + (n_zero + 1) / 2
+            rank_sum += zero_rank
+
+            # Negative values rank below the zeros and positive values rank above them
+            ranks = pd.Series(m.data).rank().values
+            ranks[m.data > 0] += n_zero
+            rank_sum[m.row, m.col] += ranks - zero_rank
+
+        return self._to_dataframe(rank_sum)
+
+    def _sum(self, func):
+        total = np.zeros(self.shape, dtype=float)
+        for m in self._stack:
+            m = func(m).tocoo()
+            total[m.row, m.col] += m.data
+        return total
+
+    def _to_dataframe(self, arr):
+        return pd.DataFrame(arr, index=self.index, columns=self.columns)
@@ -24,7 +24,7 @@ class InferelatorResults(object):
     network = None
 
     #: Fit model coefficients for each model bootstrap.
-    #: This is a list of dataframes which are Genes x TFs.
+    #: This is a BetaStack (or a list of dataframes) which gives a Genes x TFs dataframe for each bootstrap.
     betas = None
 
     #: Count of non-zero betas.
@@ -4,6 +4,7 @@ import numpy as np
 import gzip
 from inferelator import utils
 from inferelator.utils import Validator as check
+from inferelator.postprocessing.beta_stack import BetaStack
 from inferelator.postprocessing import (GOLD_STANDARD_COLUMN, CONFIDENCE_COLUMN, TARGET_COLUMN, REGULATOR_COLUMN,
                                         TN, FN, TP, FP)
 
@@ -151,19 +152,26 @@ class RankSummingMetric(object):
     def compute_combined_confidences(rankable_data):
         """
         Calculate confidences based on ranking value in all of the data frames and summing the ranks
-        :param rankable_data: list(pd.DataFrame [M x N])
+        :param rankable_data: list(pd.DataFrame [M x N]) / BetaStack
         :return combine_conf: pd.DataFrame [M x N]
         """
-        # Create an 0s dataframe shaped to the data to be ranked
-        combine_conf = pd.DataFrame(np.zeros(rankable_data[0].shape),
-                                    index=rankable_data[0].index,
-                                    columns=rankable_data[0].columns)
-
-        for replicate in rankable_data:
-            # Flatten and rank based on the beta error reductions
-            ranked_replicate = np.reshape(pd.DataFrame(replicate.values.flatten()).rank().values, replicate.shape)
-            # Sum the rankings for each bootstrap
-            combine_conf += ranked_replicate
+
+        if isinstance(rankable_data, BetaStack):
+            # Rank the non-zero values of each bootstrap and sum the rankings
+            combine_conf = rankable_data.rank_sum()
+
+        else:
+            # Create an 0s dataframe shaped to the data to be ranked
+            combine_conf = pd.DataFrame(np.zeros(rankable_data[0].shape),
+                                        index=rankable_data[0].index,
+                                        columns=rankable_data[0].columns)
+
+            for replicate in rankable_data:
+                # Flatten and rank based on the beta error reductions
+                ranked_replicate = np.reshape(pd.DataFrame(replicate.values.flatten()).rank().values,
+                                              replicate.shape)
+                # Sum the rankings for each bootstrap
+                combine_conf += ranked_replicate
 
         # Convert rankings to confidence values
         min_element = min(combine_conf.values.flatten())
@@ -5,6 +5,7 @@ from inferelator import utils
 from inferelator.utils import Validator as check
 from inferelator.postprocessing.model_metrics import RankSummingMetric, MetricHandler
 from inferelator.postprocessing.inferelator_results import InferelatorResults
+from inferelator.postprocessing.beta_stack import BetaStack
 from inferelator.postprocessing import (BETA_SIGN_COLUMN, MEDIAN_EXPLAIN_VAR_COLUMN, CONFIDENCE_COLUMN,
                                         BETA_THRESHOLD_COLUMN, TARGET_COLUMN, REGULATOR_COLUMN, PRIOR_COLUMN)
 
@@ -37,9 +38,9 @@ class ResultsProcessor(object):
 
     def __init__(self, betas, rescaled_betas, threshold=None, filter_method=None, metric=None):
         """
-        :param betas: list(pd.DataFrame[G x K]) [B]
+        :param betas: list(pd.DataFrame[G x K]) [B] / BetaStack
             A list of model weights per bootstrap
-        :param rescaled_betas: list(pd.DataFrame[G x K]) [B]
+        :param rescaled_betas: list(pd.DataFrame[G x K]) [B] / BetaStack
             A list of the variance explained by each parameter per bootstrap
         :param threshold: float
             The proportion of bootstraps which an model weight must be non-zero for inclusion in the network output
@@ -61,12 +62,11 @@ class ResultsProcessor(object):
 
     @staticmethod
     def validate_init_args(betas, rescaled_betas, threshold=None, filter_method=None, metric=None):
-        assert check.argument_type(betas, list)
-        assert check.argument_type(betas[0], pd.DataFrame)
-        assert check.dataframes_align(betas)
-        assert check.argument_type(rescaled_betas, list)
-        assert check.argument_type(rescaled_betas[0], pd.DataFrame)
-        assert check.dataframes_align(rescaled_betas)
+        for stack in (betas, rescaled_betas):
+            if not isinstance(stack, BetaStack):
+                assert check.argument_type(stack, list)
+                assert check.argument_type(stack[0], pd.DataFrame)
+                assert check.dataframes_align(stack)
         assert check.argument_enum(filter_method, FILTER_METHODS, allow_none=True)
         assert check.argument_numeric(threshold, 0, 1, allow_none=True)
 
@@ -163,7 +163,7 @@ class ResultsProcessor(object):
         """
         Summarize a stack of betas
         Returns dataframes
-        :param betas: list(pd.DataFrame)
+        :param betas: list(pd.DataFrame) / BetaStack
             A list of dataframes that are aligned on both axes
         :param threshold: numeric
             The proportion of bootstraps an interaction must occur in to be valid
@@ -180,7 +180,7 @@ class ResultsProcessor(object):
         """
         Compute summary information about betas
 
-        :param betas: list(pd.DataFrame) B x [M x N]
+        :param betas: list(pd.DataFrame) B x [M x N] / BetaStack
             A list of dataframes that are aligned on both axes
         :return betas_sign: pd.DataFrame [M x N]
             A dataframe with the summation of np.sign() for each bootstrap
@@ -188,6 +188,9 @@ class ResultsProcessor(object):
             A dataframe with a count of the number of non-zero betas for an interaction
         """
 
+        if isinstance(betas, BetaStack):
+            return betas.sign_sum(), betas.nonzero_count()
+
         assert check.dataframes_align(betas)
 
         betas_sign = pd.DataFrame(np.zeros(betas[0].shape), index=betas[0].index, columns=betas[0].columns)
@@ -226,7 +229,7 @@ class ResultsProcessor(object):
         """
         Calculate the mean and median values of a list of dataframes
         Returns dataframes with the same dimensions as any one of the input stack
-        :param stack: list(pd.DataFrame)
+        :param stack: list(pd.DataFrame) / BetaStack
             List of dataframes which have the same size and dimensions
         :return mean_data: pd.DataFrame
             Mean values
@@ -234,6 +237,9 @@ class ResultsProcessor(object):
             Median values
         """
 
+        if isinstance(stack, BetaStack):
+            return stack.mean(), stack.median()
+
         assert check.dataframes_align(stack)
 
         matrix_stack = [x.values for x in stack]
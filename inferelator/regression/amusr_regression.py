@@ -256,7 +256,16 @@ class AMuSR_regression(base_regression.BaseRegression):
                                        lambda_Bs=self.lambda_Bs, lambda_Ss=self.lambda_Ss, 
                                        tol=self.tol, rel_tol=self.rel_tol, use_numba=self.use_numba)
 
-        return MPControl.map(regression_maker, range(self.G))
+        return MPControl.map(regression_maker, range(self.G), cost=self.gene_costs(), labels=self.genes)
+
+    def gene_costs(self):
+        """
+        The cost of regressing a gene grows with the number of tasks that it is in
+
+        :return: Relative cost [G]
+        :rtype: np.ndarray
+        """
+        return np.sum([np.isin(self.genes, self.Y[k].gene_names) for k in range(self.n_tasks)], axis=0).astype(float)
 
     def pileup_data(self, run_data):
 
@@ -1,15 +1,23 @@
 import numpy as np
 import pandas as pd
 import scipy.stats
+import scipy.linalg
 import copy
+import warnings
 
 from inferelator.utils import Debug, InferelatorData
-from inferelator.distributed.inferelator_mp import MPControl
+from inferelator.distributed.inferelator_mp import MPControl, SerialTask
+from inferelator.postprocessing.beta_stack import BetaStack
+from inferelator.regression.checkpoint import BootstrapCheckpoint
 from inferelator.utils import Validator as check
 
 DEFAULT_CHUNK = 25
 PROGRESS_STR = "Regression on {gn} [{i} / {total}]"
 
+# Largest condition number of xTx for which leave-one-out models are calculated by downdating the inverse
+# (instead of by solving each leave-one-out model)
+LEAVE_OUT_MAX_CONDITION = 1e8
+
 
 class BaseRegression(object):
     # These are all the things that have to be set in a new regression class
@@ -29,7 +37,7 @@ class BaseRegression(object):
         :param X: Expression or Activity data [N x K]
         :type X: InferelatorData
         :param Y: Response expression data [N x G]
-        :type Y: InferelatorData
+        :type Y: InferelatorData, InferelatorBootstrapView
         """
 
         # Get the IDs and total count for the genes and predictors
@@ -64,13 +72,80 @@ class BaseRegression(object):
         """
         raise NotImplementedError
 
+    def gene_blocks(self, block_size=None):
+        """
+        Split the response variables into blocks which can be regressed as separate tasks
+
+        :param block_size: Number of response variables in each block. None uses the chunk size.
+        :type block_size: int
+        :return: list(range)
+        """
+
+        block_size = self.chunk if block_size is None else block_size
+        return [range(i, min(i + block_size, self.G)) for i in range(0, self.G, block_size)]
+
+    def gene_costs(self):
+        """
+        Estimate the relative cost of regressing each response variable, so that expensive response variables can
+        be scheduled first. Extend this in regression classes where the cost isn't the same for every gene.
+
+        :return: Relative cost [G], or None if every response variable costs the same
+        :rtype: np.ndarray
+        """
+        return None
+
+    def block_costs(self, blocks):
+        """
+        Estimate the relative cost of regressing each block of response variables
+
+        :param blocks: Blocks of response variable indices from gene_blocks
+        :type blocks: list(range)
+        :return: Relative cost [n_blocks]
+        :rtype: np.ndarray
+        """
+        costs = self.gene_costs()
+
+        if costs is None:
+            return np.array([len(genes) for genes in blocks], dtype=float)
+
+        return np.array([np.sum(costs[list(genes)]) for genes in blocks], dtype=float)
+
+    def regress_block(self, genes):
+        """
+        Execute regression on a block of response variables in this process
+
+        :param genes: Indices of the response variables to regress
+        :type genes: iterable(int)
+        :return: list
+            Returns a list of regression results that pileup_data can process
+        """
+        raise NotImplementedError
+
+    def stream_blocks(self, blocks=None):
+        """
+        Regress blocks of response variables with the multiprocessing controller (most expensive block first) and
+        yield the regression results from each block as it finishes, so that pileup_data can write each result as it
+        arrives instead of waiting for every result
+
+        :param blocks: Blocks of response variable indices. None uses gene_blocks.
+        :type blocks: list(range)
+        :return: Generator of regression results that pileup_data can process
+        """
+
+        blocks = self.gene_blocks() if blocks is None else blocks
+
+        for _, block_results in MPControl.as_completed(self.regress_block, blocks, cost=self.block_costs(blocks),
+                                                       labels=[self.genes[genes[0]] for genes in blocks]):
+            yield from block_results
+
     def pileup_data(self, run_data):
         """
         Take the completed run data and pack it up into a DataFrame of betas
 
         :param run_data: list
-            A list of regression result dicts ordered by gene. Each regression result should have `ind`, `pp`, `betas`
-            and `betas_resc` keys with the appropriate data.
+            An iterable of regression result records (from compact_result) or dicts. Each regression result should
+            have `ind`, `pp`, `betas` and `betas_resc` keys with the appropriate data. If run_data is a list, each
+            result is removed from it once it has been written into the output arrays.
         :return betas, betas_rescale: (pd.DataFrame [G x K], pd.DataFrame [G x K])
         """
 
@@ -79,14 +154,14 @@ class BaseRegression(object):
         betas_rescale = np.zeros((self.G, self.K), dtype=np.dtype(float))
 
         # Populate the zero arrays with the BBSR betas
-        for data in run_data:
+        for data in _consume_results(run_data):
 
             # If data is None assume a null model
             if data is None:
                 raise RuntimeError("No model produced by regression method")
 
             xidx = data['ind']  # Int
-            yidx = data['pp']  # Boolean array of size K
+            yidx = data['pp']  # Boolean array of size K or array of predictor indices
             betas[xidx, yidx] = data['betas']
             betas_rescale[xidx, yidx] = data['betas_resc']
 
@@ -123,22 +198,144 @@ class _RegressionWorkflowMixin(object):
         pass
 
     def run_regression(self):
-        betas = []
-        rescaled_betas = []
+
+        if self.concurrent_bootstraps:
+            return self._run_regression_concurrent()
+
+        betas = BetaStack()
+        rescaled_betas = BetaStack()
+
+        checkpoint = BootstrapCheckpoint(self.checkpoint_dir) if self.checkpoint_dir is not None else None
+        data_hash = self._checkpoint_data_hash() if checkpoint is not None else None
 
         for idx, bootstrap in enumerate(self.get_bootstraps()):
             Debug.vprint('Bootstrap {} of {}'.format((idx + 1), self.num_bootstraps), level=0)
-            np.random.seed(self.random_seed + idx)
-            current_betas, current_rescaled_betas = self.run_bootstrap(bootstrap)
+
+            # Load this bootstrap from the checkpoint if it's already been run
+            if checkpoint is not None:
+                tag = checkpoint.make_tag(self._checkpoint_config(), self.random_seed + idx, bootstrap,
+                                          self.response.gene_names, self.design.gene_names, data_hash=data_hash)
+                current = checkpoint.get(idx, tag, self.response.gene_names, self.design.gene_names)
+            else:
+                current = None
+
+            if current is None:
+                np.random.seed(self.random_seed + idx)
+                current = self.run_bootstrap(bootstrap)
+
+                if checkpoint is not None:
+                    checkpoint.put(idx, tag, *current)
+
+            current_betas, current_rescaled_betas = current
 
             betas.append(current_betas)
             rescaled_betas.append(current_rescaled_betas)
 
         return betas, rescaled_betas
 
+    def _run_regression_concurrent(self):
+        """
+        Run several bootstraps at once. Each bootstrap is one task, which sets up the regression (e.g. calculates MI
+        and CLR) and regresses every gene in the worker that runs it, so that bootstraps run in parallel with each
+        other. Any multiprocessing calls that a bootstrap makes are run serially in its worker. Only
+        concurrent_bootstrap_window bootstraps are in flight at once (one for each worker if it is None).
+
+        Each bootstrap gets its own random state from a numpy SeedSequence spawned from the workflow random seed,
+        so results do not depend on which worker runs a bootstrap or on the order that bootstraps finish.
+        """
+
+        bootstraps = self.get_bootstraps()
+        seeds = np.random.SeedSequence(self.random_seed).spawn(len(bootstraps))
+
+        window = self.concurrent_bootstrap_window
+        window = MPControl.client.num_workers() if window is None else window
+        assert check.argument_integer(window, low=1)
+
+        checkpoint = BootstrapCheckpoint(self.checkpoint_dir) if self.checkpoint_dir is not None else None
+        data_hash = self._checkpoint_data_hash() if checkpoint is not None else None
+
+        results, tags = {}, {}
+
+        # Load bootstraps from the checkpoint if they've already been run
+        if checkpoint is not None:
+            for idx, bootstrap in enumerate(bootstraps):
+                tags[idx] = checkpoint.make_tag(self._checkpoint_config(), seeds[idx].spawn_key, bootstrap,
+                                                self.response.gene_names, self.design.gene_names,
+                                                data_hash=data_hash)
+                results[idx] = checkpoint.get(idx, tags[idx], self.response.gene_names, self.design.gene_names)
+
+        pending = [idx for idx in range(len(bootstraps)) if results.get(idx) is None]
+        Debug.vprint('Running {n} bootstraps, {w} at a time'.format(n=len(pending), w=window), level=0)
+
+        self._prepare_concurrent_bootstraps()
+
+        betas, rescaled_betas = BetaStack(), BetaStack()
+
+        def _append_finished():
+            # Bootstraps are added to the stack in order as they finish
+            while len(betas) < len(bootstraps) and results.get(len(betas)) is not None:
+                current_betas, current_rescaled_betas = results.pop(len(betas))
+                betas.append(current_betas)
+                rescaled_betas.append(current_rescaled_betas)
+
+        _append_finished()
+
+        for i, result in MPControl.as_completed(SerialTask(_run_seeded_bootstrap),
+                                                [self] * len(pending),
+                                                [bootstraps[idx] for idx in pending],
+                                                [seeds[idx] for idx in pending],
+                                                max_in_flight=window, stage="bootstrap", labels=pending):
+            idx = pending[i]
+            Debug.vprint('Bootstrap {} of {} complete'.format((idx + 1), self.num_bootstraps), level=0)
+
+            if checkpoint is not None:
+                checkpoint.put(idx, tags[idx], *result)
+
+            results[idx] = result
+            _append_finished()
+
+        return betas, rescaled_betas
+
     def run_bootstrap(self, bootstrap):
         raise NotImplementedError
 
+    def _make_bootstrap_regression(self, bootstrap, random_state=None):
+        """
+        Set up (but don't run) the regression object for one bootstrap. This is required to use concurrent
+        bootstraps.
+
+        :param bootstrap: Resampled sample indices
+        :type bootstrap: list(int)
+        :param random_state: Random state for this bootstrap. None uses the workflow random seed.
+        :type random_state: np.random.RandomState
+        :return: BaseRegression
+        """
+        raise NotImplementedError("This regression does not support concurrent bootstraps")
+
+    def _prepare_concurrent_bootstraps(self):
+        """
+        Do any work that can be shared by every bootstrap before the bootstraps are sent to workers
+        """
+        pass
+
+    def _checkpoint_config(self):
+        """
+        Describe any settings which change the regression results, so that checkpointed bootstraps are only
+        reused by a workflow with the same settings. Extend this in regression mixins which have parameters.
+
+        :return: str
+        """
+        return self.__class__.__name__
+
+    def _checkpoint_data_hash(self):
+        """
+        Hash the design, response and prior data, so that checkpointed bootstraps are not reused if the input data
+        has changed (e.g. an edited priors file or differently normalized expression data)
+
+        :return: str
+        """
+        return BootstrapCheckpoint.hash_data(self.design, self.response, getattr(self, "priors_data", None))
+
 
 class _MultitaskRegressionWorkflowMixin(_RegressionWorkflowMixin):
     """
@@ -148,6 +345,10 @@ class _MultitaskRegressionWorkflowMixin(_RegressionWorkflowMixin):
 
     def run_regression(self):
 
+        if self.checkpoint_dir is not None or self.concurrent_bootstraps:
+            warnings.warn("Multitask regression does not support checkpoint_dir or concurrent_bootstraps; "
+                          "these settings are ignored")
+
         betas = [[] for _ in range(self._n_tasks)]
         rescaled_betas = [[] for _ in range(self._n_tasks)]
 
@@ -165,6 +366,109 @@ class _MultitaskRegressionWorkflowMixin(_RegressionWorkflowMixin):
         raise NotImplementedError
 
 
+def compact_result(data, ind):
+    """
+    Convert a regression result dict into a compact record which only has the predictors with a non-zero beta or
+    rescaled beta
+
+    :param data: A regression result with `pp` (a boolean array of size K) and `betas` and `betas_resc` (arrays of
+        values for each True element of `pp`)
+    :type data: dict
+    :param ind: The index of the response variable
+    :type ind: int
+    :return: A regression result with `ind`, `pp` (an int32 array of predictor indices), and `betas` and
+        `betas_resc` (float32 arrays of values for each predictor index)
+    :rtype: dict
+    """
+
+    pp = np.where(np.asarray(data['pp'], dtype=bool))[0]
+    betas = np.asarray(data['betas']).reshape(-1)
+    betas_resc = np.asarray(data['betas_resc']).reshape(-1)
+
+    keep = (betas != 0) | (betas_resc != 0)
+
+    return dict(ind=ind,
+                pp=pp[keep].astype(np.int32),
+                betas=betas[keep].astype(np.float32),
+                betas_resc=betas_resc[keep].astype(np.float32))
+
+
+def pack_results(results):
+    """
+    Pack a list of compact regression records into one record of flat arrays, so that a block of results can be
+    sent between processes as a few arrays instead of many small objects
+
+    :param results: Regression records from compact_result
+    :type results: list(dict)
+    :return: A packed record with `ind` (int32 array of response indices), `indptr` (int64 array of offsets for each
+        response into the other arrays), `pp` (int32 array of predictor indices) and `betas` and `betas_resc`
+        (float32 arrays of values for each predictor index)
+    :rtype: dict
+    """
+
+    indptr = np.zeros(len(results) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(r['pp']) for r in results])
+
+    def _cat(key, dtype):
+        return np.concatenate([r[key] for r in results]).astype(dtype) if len(results) > 0 else np.array([], dtype)
+
+    return dict(ind=np.array([r['ind'] for r in results], dtype=np.int32),
+                indptr=indptr,
+                pp=_cat('pp', np.int32),
+                betas=_cat('betas', np.float32),
+                betas_resc=_cat('betas_resc', np.float32))
+
+
+def unpack_results(packed):
+    """
+    Unpack a record from pack_results into a list of compact regression records
+
+    :param packed: A packed record from pack_results
+    :type packed: dict
+    :return: Regression records (the arrays are views into the packed arrays)
+    :rtype: list(dict)
+    """
+
+    indptr = packed['indptr']
+
+    return [dict(ind=int(ind),
+                 pp=packed['pp'][indptr[i]:indptr[i + 1]],
+                 betas=packed['betas'][indptr[i]:indptr[i + 1]],
+                 betas_resc=packed['betas_resc'][indptr[i]:indptr[i + 1]])
+            for i, ind in enumerate(packed['ind'])]
+
+
+def _run_seeded_bootstrap(workflow, bootstrap, seed):
+    """
+    Set up and run the regression for one bootstrap with a random state from its seed sequence
+
+    :param workflow: The regression workflow
+    :param bootstrap: Resampled sample indices
+    :type bootstrap: list(int)
+    :param seed: Seed sequence for this bootstrap
+    :type seed: np.random.SeedSequence
+    :return: Model coefficients and rescaled coefficients
+    :rtype: pd.DataFrame, pd.DataFrame
+    """
+
+    random_state = np.random.RandomState(np.random.MT19937(seed))
+    return workflow._make_bootstrap_regression(bootstrap, random_state=random_state).run()
+
+
+def _consume_results(run_data):
+    """
+    Yield results from an iterable, dropping the reference to each result in a list once it has been yielded
+    """
+
+    if isinstance(run_data, list):
+        for i in range(len(run_data)):
+            data, run_data[i] = run_data[i], None
+            yield data
+    else:
+        for data in run_data:
+            yield data
+
+
 def recalculate_betas_from_selected(x, y, idx=None):
     """
     Estimate betas from a selected subset of predictors
@@ -207,6 +511,34 @@ def recalculate_betas_from_selected(x, y, idx=None):
     return best_betas
 
 
+def recalculate_betas_from_gram(xtx, xty, idx=None):
+    """
+    Estimate betas from a selected subset of predictors with a precalculated xTx and xTy, so that the predictor
+    matrix isn't needed
+    :param xtx: np.ndarray [k x k]
+    :param xty: np.ndarray [k,]
+    :param idx: np.ndarray [k x 1]
+        Predictors to use (unused predictors will return a beta of 0)
+        If None, use all predictors
+    :return: np.ndarray [k,]
+        Estimated beta-hats
+    """
+
+    best_betas = np.zeros(xtx.shape[1], dtype=np.dtype(float))
+
+    if idx is None:
+        idx = np.ones(xtx.shape[1], dtype=np.dtype(bool))
+
+    idx = bool_to_index(idx)
+
+    # Solve for beta-hat with LAPACK or return a null model if xTx is singular
+    xtx_idx = xtx[np.ix_(idx, idx)]
+    if np.linalg.matrix_rank(xtx_idx) == xtx_idx.shape[1]:
+        best_betas[idx] = np.linalg.solve(xtx_idx, np.asarray(xty).reshape(-1)[idx])
+
+    return best_betas
+
+
 def predict_error_reduction(x, y, betas):
     """
     Predict the error reduction from each predictor
@@ -224,10 +556,108 @@ def predict_error_reduction(x, y, betas):
     ss_all = sigma_squared(x, y, betas)
     error_reduction = np.zeros(k, dtype=np.dtype(float))
 
+    if len(pp_idx) == 0:
+        return error_reduction
+
+    if len(pp_idx) == 1:
+        error_reduction[pp_idx] = 1 - (ss_all / np.var(y, ddof=1))
+        return error_reduction
+
+    # Get the betas for every leave-one-out model [m x m] from one inverse of xTx
+    x_pp = x[:, pp_idx]
+    beta_leaveout = _leave_one_out_betas(np.dot(x_pp.T, x_pp), np.dot(x_pp.T, y).reshape(-1))
+
+    # Fall back to solving each leave-one-out model separately if xTx is ill-conditioned
+    if beta_leaveout is None:
+        return _predict_error_reduction_solve(x, y, pp_idx, ss_all, error_reduction)
+
+    # Predict y from every leave-one-out model at once [n x m]
+    y_leaveout = np.dot(x_pp, beta_leaveout)
+
+    for pp_i, lost in enumerate(pp_idx):
+        # Calculate the variance of the residuals for the leave-one-out betas
+        ss_leaveout = np.var(np.subtract(y, y_leaveout[:, pp_i].reshape(-1, 1)), ddof=1)
+        error_reduction[lost] = _error_reduction(ss_all, ss_leaveout, len(pp_idx))
+
+    return error_reduction
+
+
+def predict_error_reduction_gram(xtx, xty, y, betas, x_sum=None):
+    """
+    Predict the error reduction from each predictor with a precalculated xTx and xTy, so that the predictor matrix
+    isn't needed. The residual variances are calculated from xTx, xTy, y'y and the sums of x and y.
+    :param xtx: np.ndarray [k x k]
+    :param xty: np.ndarray [k,]
+    :param y: np.ndarray [n x 1]
+    :param betas: np.ndarray [k x 1]
+    :param x_sum: np.ndarray [k,]
+        Column sums of x. If None, x is assumed to be centered.
+    :return: np.ndarray [k,]
+    """
+    assert check.argument_type(betas, np.ndarray)
+
+    k = xtx.shape[0]
+    pp_idx = index_of_nonzeros(betas).tolist()
+    error_reduction = np.zeros(k, dtype=np.dtype(float))
+
+    if len(pp_idx) == 0:
+        return error_reduction
+
+    y = np.asarray(y, dtype=np.dtype(float)).reshape(-1)
+    xty = np.asarray(xty, dtype=np.dtype(float)).reshape(-1)
+    x_sum = np.zeros(k, dtype=np.dtype(float)) if x_sum is None else np.asarray(x_sum).reshape(-1)
+    n, yty, y_sum = y.shape[0], np.dot(y, y), np.sum(y)
+
+    # Calculate the variance of the residuals
+    ss_all = _sigma_squared_gram(xtx, xty, yty, y_sum, x_sum, n, betas.reshape(-1, 1))[0]
+
     if len(pp_idx) == 1:
         error_reduction[pp_idx] = 1 - (ss_all / np.var(y, ddof=1))
         return error_reduction
 
+    # Get the betas for every leave-one-out model [m x m] from one inverse of xTx
+    xtx_pp, xty_pp = xtx[np.ix_(pp_idx, pp_idx)], xty[pp_idx]
+    beta_leaveout = _leave_one_out_betas(xtx_pp, xty_pp)
+
+    # Fall back to solving each leave-one-out model separately if xTx is ill-conditioned
+    if beta_leaveout is None:
+        beta_leaveout = np.zeros((len(pp_idx), len(pp_idx)), dtype=np.dtype(float))
+
+        for pp_i in range(len(pp_idx)):
+            leave_out = [i for i in range(len(pp_idx)) if i != pp_i]
+            try:
+                beta_leaveout[leave_out, pp_i] = scipy.linalg.solve(xtx_pp[np.ix_(leave_out, leave_out)],
+                                                                    xty_pp[leave_out], assume_a='sym')
+            except np.linalg.LinAlgError:
+                pass
+
+    ss_leaveout = _sigma_squared_gram(xtx_pp, xty_pp, yty, y_sum, x_sum[pp_idx], n, beta_leaveout)
+
+    for pp_i, lost in enumerate(pp_idx):
+        error_reduction[lost] = _error_reduction(ss_all, ss_leaveout[pp_i], len(pp_idx))
+
+    return error_reduction
+
+
+def _sigma_squared_gram(xtx, xty, yty, y_sum, x_sum, n, betas):
+    """
+    Calculate the variance of the residuals for each column of betas [k x m] from xTx, xTy, y'y and the sums of
+    x and y
+    :return: np.ndarray [m,]
+    """
+
+    # SSR = y'y - 2 * beta'xTy + beta'xTx beta
+    model_ssr = yty - 2 * np.dot(xty, betas) + np.sum(betas * np.dot(xtx, betas), axis=0)
+    resid_sum = y_sum - np.dot(x_sum, betas)
+
+    return np.maximum(model_ssr - resid_sum * resid_sum / n, 0.) / (n - 1)
+
+
+def _predict_error_reduction_solve(x, y, pp_idx, ss_all, error_reduction):
+    """
+    Predict the error reduction from each predictor by solving every leave-one-out model
+    """
+
     for pp_i in range(len(pp_idx)):
         # Copy the index of predictors
         leave_out = copy.copy(pp_idx)
@@ -246,16 +676,50 @@ def predict_error_reduction(x, y, betas):
 
         # Calculate the variance of the residuals for the new estimated betas
         ss_leaveout = sigma_squared(x_leaveout, y, beta_hat)
-
-        # Check to make sure that the ss_all and ss_leaveout differences aren't just precision-related
-        if np.abs(ss_all - ss_leaveout) < np.finfo(float).eps * len(pp_idx):
-            error_reduction[lost] = 0.
-        else:
-            error_reduction[lost] = 1 - (ss_all / ss_leaveout)
+        error_reduction[lost] = _error_reduction(ss_all, ss_leaveout, len(pp_idx))
 
     return error_reduction
 
 
+def _error_reduction(ss_all, ss_leaveout, k):
+
+    # Check to make sure that the ss_all and ss_leaveout differences aren't just precision-related
+    if np.abs(ss_all - ss_leaveout) < np.finfo(float).eps * k:
+        return 0.
+    else:
+        return 1 - (ss_all / ss_leaveout)
+
+
+def _leave_one_out_betas(xtx, xty):
+    """
+    Calculate OLS betas for every model that leaves out one predictor, by downdating the full model with the
+    inverse of xTx (beta_-i = beta - beta[i] / inv[i, i] * inv[:, i])
+    :param xtx: np.ndarray [k x k]
+    :param xty: np.ndarray [k,]
+    :return: np.ndarray [k x k]
+        Column i is the betas for the model without predictor i (with a 0 for predictor i).
+        None if xTx is too ill-conditioned for the downdate to be accurate.
+    """
+
+    if not np.all(np.isfinite(xtx)) or np.linalg.cond(xtx) > LEAVE_OUT_MAX_CONDITION:
+        return None
+
+    try:
+        xtx_inv = scipy.linalg.inv(xtx)
+    except np.linalg.LinAlgError:
+        return None
+
+    inv_diag = np.diagonal(xtx_inv)
+    if np.any(inv_diag <= 0):
+        return None
+
+    beta = np.dot(xtx_inv, xty)
+    beta_leaveout = beta.reshape(-1, 1) - xtx_inv * (beta / inv_diag).reshape(1, -1)
+    np.fill_diagonal(beta_leaveout, 0.)
+
+    return beta_leaveout
+
+
 def sigma_squared(x, y, betas):
     return np.var(np.subtract(y, np.dot(x, betas).reshape(-1, 1)), ddof=1)
 
@@ -3,15 +3,21 @@ from __future__ import division
 import numpy as np
 import itertools
 import math
-import warnings
 import scipy.special
 import scipy.linalg
 
 from inferelator import utils
 from inferelator.regression import base_regression
 
+# Singular values at or below this are treated as 0 when checking if xTx is full rank
+RANK_TOL = 1e-10
 
-def bbsr(X, y, pp, weights, max_k, ordinary_least_squares=False):
+# A predictor is treated as a linear combination of the predictors already in a Cholesky factor if its pivot is
+# smaller than this fraction of its diagonal element in xTx
+CHOLESKY_PIVOT_TOL = 1e-10
+
+
+def bbsr(X, y, pp, weights, max_k, ordinary_least_squares=False, xtx=None, xty=None, x_sum=None):
     """
     Run BBSR to regress a response variable y in n conditions against predictors X in n conditions. Use the prior
     predictors matrix to filter the number of predictors from something massive to max_k.
@@ -25,6 +31,13 @@ def bbsr(X, y, pp, weights, max_k, ordinary_least_squares=False):
         Weight matrix
     :param max_k: int
         Max number of predictors
+    :param xtx: np.ndarray [K x K]
+        Precalculated X'X (shared by every response variable regressed against X). Calculated from X if None.
+    :param xty: np.ndarray [K,]
+        Precalculated X'y. Calculated from X and y if None. If xtx and xty are both provided, X is not used, so the
+        cost for each response variable doesn't depend on N (except for y itself).
+    :param x_sum: np.ndarray [K,]
+        Precalculated column sums of X, used with xtx and xty. If None, X is assumed to be centered.
     :return: dict
         pp: Boolean array indicating which predictors are included in the model                 [K,]
         betas: Float array indicating the beta for each predictor included in the model         [K,]
@@ -41,16 +54,25 @@ def bbsr(X, y, pp, weights, max_k, ordinary_least_squares=False):
     pp_idx = base_regression.bool_to_index(pp)
     utils.Debug.vprint("Beginning regression with {pp_len} predictors".format(pp_len=len(pp_idx)), level=2)
 
-    x = X[:, pp_idx]
+    # Use the precalculated X'X and X'y instead of X if they're both provided
+    use_xtx = xtx is not None and xty is not None
+
+    x = X[:, pp_idx] if not use_xtx else None
     gprior = weights[pp_idx].astype(np.dtype(float))
 
     # Make sure arrays are 2d
-    utils.make_array_2d(x)
+    if x is not None:
+        utils.make_array_2d(x)
     utils.make_array_2d(y)
     utils.make_array_2d(gprior)
 
+    # Slice the precalculated X'X and X'y for the predictors in pp
+    xtx_pp = xtx[np.ix_(pp_idx, pp_idx)] if xtx is not None else None
+    xty_pp = xty[pp_idx] if xty is not None else None
+
     # Reduce predictors to max_k
-    pp[pp_idx] = reduce_predictors(x, y, gprior, max_k, ordinary_least_squares=ordinary_least_squares)
+    pp[pp_idx] = reduce_predictors(x, y, gprior, max_k, ordinary_least_squares=ordinary_least_squares,
+                                   xtx=xtx_pp, xty=xty_pp)
     pp_idx = base_regression.bool_to_index(pp)
 
     utils.Debug.vprint("Reduced to {pp_len} predictors".format(pp_len=len(pp_idx)), level=2)
@@ -62,67 +84,91 @@ def bbsr(X, y, pp, weights, max_k, ordinary_least_squares=False):
                     betas_resc=np.zeros(pp.shape[0]))
 
     # Resubset with the newly reduced predictors
-    x = X[:, pp_idx]
+    x = X[:, pp_idx] if not use_xtx else None
     gprior = weights[pp_idx].astype(np.dtype(float))
     utils.make_array_2d(gprior)
 
-    betas = best_subset_regression(x, y, gprior, ordinary_least_squares=ordinary_least_squares)
-    betas_resc = base_regression.predict_error_reduction(x, y, betas)
+    xtx_pp = xtx[np.ix_(pp_idx, pp_idx)] if xtx is not None else None
+    xty_pp = xty[pp_idx] if xty is not None else None
+
+    betas = best_subset_regression(x, y, gprior, ordinary_least_squares=ordinary_least_squares,
+                                   xtx=xtx_pp, xty=xty_pp)
+
+    if use_xtx:
+        betas_resc = base_regression.predict_error_reduction_gram(xtx_pp, xty_pp, y, betas,
+                                                                  x_sum=x_sum[pp_idx] if x_sum is not None else None)
+    else:
+        betas_resc = base_regression.predict_error_reduction(x, y, betas)
 
     return dict(pp=pp,
                 betas=betas,
                 betas_resc=betas_resc)
 
 
-def best_subset_regression(x, y, gprior, ordinary_least_squares=False):
+def best_subset_regression(x, y, gprior, ordinary_least_squares=False, xtx=None, xty=None):
     """
 
     :param x: np.ndarray
-        Independent (predictor) variables [n x k]
+        Independent (predictor) variables [n x k]. Can be None if xtx and xty are provided.
     :param y: np.ndarray
         Dependent (response) variable [n x 1]
     :param gprior: np.ndarray
         Weighted priors [k x 1]
+    :param xtx: np.ndarray
+        Precalculated x'x [k x k]. Calculated from x if None.
+    :param xty: np.ndarray
+        Precalculated x'y [k,]. Calculated from x and y if None.
     :return:
     """
-    (n, k) = x.shape
-    combos = combo_index(k)
+    k = x.shape[1] if x is not None else xtx.shape[0]
 
-    bic_combos = calc_all_expected_BIC(x, y, gprior, combos, check_rank=False,
-                                       ordinary_least_squares=ordinary_least_squares)
+    # Singular combinations are already set to np.inf, so the lowest BIC is the best model
+    bic_combos = calc_all_expected_BIC_gray(x, y, gprior, ordinary_least_squares=ordinary_least_squares,
+                                            xtx=xtx, xty=xty)
+    best_combo = combo_index(k)[:, np.argmin(bic_combos)]
 
     best_betas = np.zeros(k, dtype=np.dtype(float))
-    try:
-        best_combo = combos[:, _best_combo_idx(x, bic_combos, combos)]
-    except np.linalg.LinAlgError:
-        return best_betas
 
-    if best_combo.sum() > 0:
+    if best_combo.sum() > 0 and x is None:
+        best_betas = base_regression.recalculate_betas_from_gram(xtx, xty, best_combo)
+    elif best_combo.sum() > 0:
         best_betas = base_regression.recalculate_betas_from_selected(x, y, best_combo)
 
     return best_betas
 
 
-def reduce_predictors(x, y, gprior, max_k, ordinary_least_squares=False):
+def reduce_predictors(x, y, gprior, max_k, ordinary_least_squares=False, xtx=None, xty=None):
     """
     Determine which predictors are the most valuable by calculating BICs for single and pairwise predictor models
-    :param x: np.ndarray [n x k]
+    :param x: np.ndarray [n x k] (or None if xtx and xty are provided)
     :param y: np.ndarray [n x 1]
     :param gprior: [k x 1]
     :param max_k: int
+    :param xtx: np.ndarray [k x k] precalculated x'x (or None)
+    :param xty: np.ndarray [k,] precalculated x'y (or None)
     :return: np.ndarray [k,]
     """
-    (_, k) = x.shape
+    k = x.shape[1] if x is not None else xtx.shape[0]
 
     if k <= max_k:
         return np.ones(k, dtype=np.dtype(bool))
     else:
-        # Get BIC for every combination of single or double predictors
-        combos = np.hstack((np.diag(np.repeat(True, k)), select_index(k)))
-        bic = calc_all_expected_BIC(x, y, gprior, combos, ordinary_least_squares=ordinary_least_squares)
+        # Get BIC for every single predictor [k,] and every pair of predictors [k x k]
+        single_bic, pair_bic = calc_single_pair_BIC(x, y, gprior, ordinary_least_squares=ordinary_least_squares,
+                                                    xtx=xtx, xty=xty)
 
         reset = np.seterr(divide='ignore', invalid='ignore')
-        bic = np.multiply(combos.T, bic.reshape(-1, 1)).sum(axis=0)
+
+        # Sum the BIC of every model that each predictor is in
+        np.fill_diagonal(pair_bic, 0.)
+        bic = single_bic + pair_bic.sum(axis=1)
+
+        # A non-finite BIC for any model makes the sum for every predictor that isn't in that model NaN
+        # (this is the result of masking the non-finite BIC with a multiplication by 0)
+        nonfinite_single, nonfinite_pair = ~np.isfinite(single_bic), np.triu(~np.isfinite(pair_bic), 1)
+        n_nonfinite = nonfinite_single.sum() + nonfinite_pair.sum()
+        n_nonfinite_in = nonfinite_single + nonfinite_pair.sum(axis=0) + nonfinite_pair.sum(axis=1)
+        bic[n_nonfinite_in < n_nonfinite] = np.nan
 
         # Return a boolean index pointing to the lowest BIC predictors
         predictors = np.zeros(k, dtype=np.dtype(bool))
@@ -132,6 +178,82 @@ def reduce_predictors(x, y, gprior, max_k, ordinary_least_squares=False):
         return predictors
 
 
+def calc_single_pair_BIC(x, y, g, ordinary_least_squares=False, xtx=None, xty=None):
+    """
+    Calculate BICs for every model with a single predictor or a pair of predictors. These are solved in closed form
+    for all models at once, instead of one model at a time with calc_all_expected_BIC
+    :param x: np.ndarray [n x k]
+        Array of predictor data (or None if xtx and xty are provided)
+    :param y: np.ndarray [n x 1]
+        Array of response data
+    :param g: np.ndarray [k x 1]
+        Weights for predictors
+    :param ordinary_least_squares: bool
+        Calculate BIC from the residual sum of squares instead of with the g-prior
+    :param xtx: np.ndarray [k x k]
+        Precalculated x'x. Calculated from x if None.
+    :param xty: np.ndarray [k,]
+        Precalculated x'y. Calculated from x and y if None.
+    :return single_bic, pair_bic: np.ndarray [k,], np.ndarray [k x k]
+        BIC for each single predictor model, and a symmetric array of BIC for each pair of predictors (the diagonal
+        is meaningless). Singular models are np.inf
+    """
+    y = np.asarray(y, dtype=np.dtype(float)).reshape(-1)
+    n = y.shape[0]
+
+    # Sanity check the data
+    assert x is None or n == x.shape[0]
+
+    # Precalculate xTx, xTy and yTy
+    digamma_shape = scipy.special.digamma(n / 2.0)
+    xtx = np.asarray(np.dot(x.T, x) if xtx is None else xtx, dtype=np.dtype(float))  # [k x k]
+    xty = np.dot(x.T, y) if xty is None else np.asarray(xty).reshape(-1)  # [k,]
+    yty = np.dot(y, y)
+
+    # Calculate the g-prior weighted xTx
+    gprior = np.sqrt(1.0 / (np.asarray(g, dtype=np.dtype(float)).reshape(-1) + 1.0))
+    xtx_gprior = xtx * np.outer(gprior, gprior)
+
+    def _bic(k_included, beta_xty, rate, nonsingular):
+        # SSR = yTy - 2 * beta'xTy + beta'xTx beta, and xTx beta = xTy
+        model_ssr = yty - beta_xty
+
+        if ordinary_least_squares:
+            model_ssr[model_ssr <= 0] = np.finfo(float).eps
+            bic = n * (np.log(model_ssr / n)) + k_included * np.log(n)
+        else:
+            scale_param = (model_ssr + rate) / 2
+            nonsingular &= np.isfinite(scale_param) & (scale_param > 0)
+            bic = _calc_BIC_inverse_gamma(n, k_included, digamma_shape, scale_param)
+
+        bic[~nonsingular] = np.inf
+        return bic
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+
+        # Single predictor models [k,]
+        a = np.diagonal(xtx)
+        beta = xty / a
+        single_bic = _bic(1, beta * xty, beta * beta * np.diagonal(xtx_gprior), np.abs(a) > RANK_TOL)
+
+        # Pairwise predictor models [k x k] where xTx for (i, j) is [[a_i, b_ij], [b_ij, a_j]]
+        a_i, a_j, b = a.reshape(-1, 1), a.reshape(1, -1), xtx
+        u_i, u_j = xty.reshape(-1, 1), xty.reshape(1, -1)
+        det = a_i * a_j - b * b
+
+        beta_i = (a_j * u_i - b * u_j) / det
+        beta_j = (a_i * u_j - b * u_i) / det
+
+        g_ii, g_jj = np.diagonal(xtx_gprior).reshape(-1, 1), np.diagonal(xtx_gprior).reshape(1, -1)
+        rate = beta_i * beta_i * g_ii + 2 * beta_i * beta_j * xtx_gprior + beta_j * beta_j * g_jj
+
+        # The smallest eigenvalue of each symmetric 2x2 xTx
+        eig_min = np.abs((a_i + a_j) / 2 - np.sqrt(((a_i - a_j) / 2) ** 2 + b * b))
+        pair_bic = _bic(2, beta_i * u_i + beta_j * u_j, rate, (np.abs(det) > 0) & (eig_min > RANK_TOL))
+
+    return single_bic, pair_bic
+
+
 def calc_all_expected_BIC(x, y, g, combinations, check_rank=True, ordinary_least_squares=False):
     """
     Calculate BICs for every combination of predictors given in combinations
@@ -168,8 +290,9 @@ def calc_all_expected_BIC(x, y, g, combinations, check_rank=True, ordinary_least
     gprior = np.multiply(gprior, gprior.T)
     bic = np.zeros(c, dtype=np.dtype(float))
 
-    with warnings.catch_warnings():
-        warnings.simplefilter("ignore")
+    # Singular models are caught by explicit rank checks, so only floating point warnings need to be silenced
+    # np.errstate is thread-local, unlike warnings.catch_warnings, so this is safe to call from threaded regression
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
         for i in range(c):
             # Convert the boolean slice into an index
             c_idx = base_regression.bool_to_index(combinations[:, i])
@@ -200,6 +323,171 @@ def calc_all_expected_BIC(x, y, g, combinations, check_rank=True, ordinary_least
     return bic
 
 
+def calc_all_expected_BIC_gray(x, y, g, ordinary_least_squares=False, xtx=None, xty=None):
+    """
+    Calculate BICs for every combination of predictors, in the same order as combo_index. Combinations are visited in
+    Gray-code order so that each differs from the last by one predictor, and the Cholesky factor of xTx is updated
+    by adding or dropping that predictor instead of solving each model from scratch
+    :param x: np.ndarray [n x k]
+        Array of predictor data (or None if xtx and xty are provided)
+    :param y: np.ndarray [n x 1]
+        Array of response data
+    :param g: np.ndarray [k x 1]
+        Weights for predictors
+    :param ordinary_least_squares: bool
+        Calculate BIC from the residual sum of squares instead of with the g-prior
+    :param xtx: np.ndarray [k x k]
+        Precalculated x'x. Calculated from x if None.
+    :param xty: np.ndarray [k,]
+        Precalculated x'y. Calculated from x and y if None.
+    :return: np.ndarray [2^k,]
+        Array of BICs corresponding to each column of combo_index(k). Combinations with a singular xTx are np.inf
+    """
+    y = np.asarray(y, dtype=np.dtype(float)).reshape(-1)
+    n = y.shape[0]
+
+    # Sanity check the data
+    assert x is None or n == x.shape[0]
+
+    # Precalculate xTx, xTy and yTy
+    digamma_shape = scipy.special.digamma(n / 2.0)
+    xtx = np.asarray(np.dot(x.T, x) if xtx is None else xtx, dtype=np.dtype(float))  # [k x k]
+    xty = np.dot(x.T, y) if xty is None else np.asarray(xty).reshape(-1)  # [k,]
+    yty = np.dot(y, y)
+    k = xtx.shape[0]
+
+    # Calculate the g-prior weighted xTx
+    gprior = np.sqrt(1.0 / (np.asarray(g, dtype=np.dtype(float)).reshape(-1) + 1.0))
+    xtx_gprior = xtx * np.outer(gprior, gprior)
+
+    bic = np.full(2 ** k, np.inf, dtype=np.dtype(float))
+    factor = _IncrementalCholesky(xtx, xty)
+
+    # Singular models are caught by the Cholesky pivot check, so only floating point warnings need to be silenced
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        # The null model
+        bic[0] = n * np.log(np.var(y, ddof=1))
+
+        for i in range(1, 2 ** k):
+            # The Gray code changes the lowest set bit of i; bits are ordered with predictor 0 as the highest bit
+            bit = (i & -i).bit_length() - 1
+            code = i ^ (i >> 1)
+
+            if (code >> bit) & 1:
+                factor.add(k - 1 - bit)
+            else:
+                factor.drop(k - 1 - bit)
+
+            if factor.singular:
+                continue
+
+            k_included = len(factor.index)
+            model_beta = factor.solve()
+            model_ssr = max(yty - factor.zz(), 0.)
+
+            if ordinary_least_squares:
+                bic[code] = _calc_BIC_RSS(n, k_included, model_ssr)
+            else:
+                c_idx = factor.index
+                scale_param = (model_ssr + np.dot(model_beta, np.dot(xtx_gprior[np.ix_(c_idx, c_idx)], model_beta))) / 2
+                if np.isfinite(scale_param) and scale_param > 0:
+                    bic[code] = _calc_BIC_inverse_gamma(n, k_included, digamma_shape, scale_param)
+
+    return bic
+
+
+class _IncrementalCholesky:
+    """
+    Upper triangular Cholesky factor R (R'R = xTx[index, index]) and z (R'z = xTy[index]) for an ordered set of
+    predictors which can be added or dropped one at a time.
+
+    A predictor that is a linear combination of the predictors in the factor is held as pending (and the model is
+    singular) until dropping predictors makes it independent again
+    """
+
+    def __init__(self, xtx, xty, tol=CHOLESKY_PIVOT_TOL):
+        k = xtx.shape[0]
+        self.xtx, self.xty, self.tol = xtx, xty, tol
+        self.r = np.zeros((k, k), dtype=np.dtype(float))
+        self.z = np.zeros(k, dtype=np.dtype(float))
+        self.index = []
+        self.pending = []
+
+    @property
+    def singular(self):
+        return len(self.pending) > 0
+
+    def add(self, j):
+        if not self._append(j):
+            self.pending.append(j)
+
+    def drop(self, j):
+        if j in self.pending:
+            self.pending.remove(j)
+            return
+
+        self._remove(self.index.index(j))
+
+        # Pending predictors may no longer be linear combinations of the remaining predictors
+        for p in list(self.pending):
+            if self._append(p):
+                self.pending.remove(p)
+
+    def solve(self):
+        """
+        Solve R beta = z for the model coefficients (in the order of self.index)
+        """
+        m = len(self.index)
+        return scipy.linalg.solve_triangular(self.r[:m, :m], self.z[:m])
+
+    def zz(self):
+        """
+        z'z is the sum of squares explained by the model, so SSR = y'y - z'z
+        """
+        z = self.z[:len(self.index)]
+        return np.dot(z, z)
+
+    def _append(self, j):
+        m = len(self.index)
+
+        # Solve R'w = xTx[index, j] for the new column of R
+        w = scipy.linalg.solve_triangular(self.r[:m, :m], self.xtx[self.index, j], trans='T') if m > 0 else self.z[:0]
+        pivot = self.xtx[j, j] - np.dot(w, w)
+
+        if not pivot > self.tol * self.xtx[j, j]:
+            return False
+
+        self.r[:m, m] = w
+        self.r[m, m] = np.sqrt(pivot)
+        self.z[m] = (self.xty[j] - np.dot(w, self.z[:m])) / self.r[m, m]
+        self.index.append(j)
+        return True
+
+    def _remove(self, p):
+        m = len(self.index)
+        r, z = self.r, self.z
+
+        # Delete column p, which leaves R upper Hessenberg from column p on
+        r[:m, p:m - 1] = r[:m, p + 1:m]
+        r[:m, m - 1] = 0.
+
+        # Restore the upper triangle with Givens rotations (applied to z as well)
+        for i in range(p, m - 1):
+            h = np.hypot(r[i, i], r[i + 1, i])
+            c, s = r[i, i] / h, r[i + 1, i] / h
+
+            row_i, row_j = r[i, i:m - 1].copy(), r[i + 1, i:m - 1].copy()
+            r[i, i:m - 1] = c * row_i + s * row_j
+            r[i + 1, i:m - 1] = c * row_j - s * row_i
+            r[i + 1, i] = 0.
+
+            z[i], z[i + 1] = c * z[i] + s * z[i + 1], c * z[i + 1] - s * z[i]
+
+        r[m - 1, :] = 0.
+        z[m - 1] = 0.
+        del self.index[p]
+
+
 def _calc_BIC_inverse_gamma(n, k, shape, scale):
     return n * (np.log(scale) - shape) + k * np.log(n)
 
@@ -256,7 +544,7 @@ def _best_combo_idx(x, bic, combo):
     raise np.linalg.LinAlgError
 
 
-def _matrix_full_rank(mat, tol=1e-10):
+def _matrix_full_rank(mat, tol=RANK_TOL):
     return np.linalg.matrix_rank(mat, tol=tol) == mat.shape[1]
 
 
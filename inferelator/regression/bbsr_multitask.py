@@ -29,7 +29,8 @@ class BBSRByTaskRegressionWorkflowMixin(_MultitaskRegressionWorkflowMixin, BBSRR
                 priors_data = pd.DataFrame(0, index=priors_data.index, columns=priors_data.columns)
 
             Debug.vprint('Calculating MI, Background MI, and CLR Matrix', level=0)
-            clr_matrix, _ = self.mi_driver().run(Y, X, return_mi=False)
+            clr_matrix = self._calculate_clr(self._task_response[k], self._task_design[k], Y, X,
+                                             self._task_bootstraps[k][bootstrap_idx])
 
             Debug.vprint('Calculating task {k} betas using BBSR'.format(k=k), level=0)
             t_beta, t_br = BBSR(X, Y, clr_matrix, priors_data,
@@ -5,6 +5,7 @@ from inferelator import utils
 from inferelator.regression import bayes_stats
 from inferelator.regression import base_regression
 from inferelator.regression import mi
+from inferelator.regression import mi_cache
 from inferelator.distributed.inferelator_mp import MPControl
 
 # Default number of predictors to include in the model
@@ -20,6 +21,9 @@ DEFAULT_no_prior_weight = 1
 # Throw away the priors which have a CLR that is 0 before the number of predictors is reduced by BIC
 DEFAULT_filter_priors_for_clr = False
 
+# Number of genes to regress in each task when X'X is shared between genes (None regresses one gene per task)
+DEFAULT_batch_size = None
+
 
 class BBSR(base_regression.BaseRegression):
     # Bayseian correlation measurements
@@ -39,15 +43,20 @@ class BBSR(base_regression.BaseRegression):
 
     ols_only = False
 
+    # Number of genes to regress against a shared X'X in each task
+    batch_size = DEFAULT_batch_size  # int
+    _xtx = None  # [K x K] numeric
+    _x_sum = None  # [K] numeric
+
     def __init__(self, X, Y, clr_mat, prior_mat, nS=DEFAULT_nS, prior_weight=DEFAULT_prior_weight,
-                 no_prior_weight=DEFAULT_no_prior_weight, ordinary_least_squares=False):
+                 no_prior_weight=DEFAULT_no_prior_weight, ordinary_least_squares=False, batch_size=DEFAULT_batch_size):
         """
         Create a Regression object for Bayes Best Subset Regression
 
         :param X: Expression or Activity data [N x K]
         :type X: InferelatorData
         :param Y: Response expression data [N x G]
-        :type Y: InferelatorData
+        :type Y: InferelatorData, InferelatorBootstrapView
         :param clr_mat: Calculated CLR between features of X & Y [G x K]
         :type clr_mat: pd.DataFrame
         :param prior_mat: Prior data between features of X & Y [G x K]
@@ -59,12 +68,17 @@ class BBSR(base_regression.BaseRegression):
             Weight of a predictor which does have a prior
         :param no_prior_weight: int
             Weight of a predictor which doesn't have a prior
+        :param batch_size: int
+            Number of genes to regress in each task. If set, X'X is calculated once and shared by every gene, and
+            X'y is calculated for each batch of genes with one matrix multiplication. None regresses one gene
+            at a time.
         """
 
         super(BBSR, self).__init__(X, Y)
 
         self.nS = nS
         self.ols_only = ordinary_least_squares
+        self.batch_size = batch_size
 
         # Calculate the weight matrix
         self.prior_weight = prior_weight
@@ -84,30 +98,102 @@ class BBSR(base_regression.BaseRegression):
         """
         Execute BBSR
 
-        :return: pd.DataFrame [G x K], pd.DataFrame [G x K]
-            Returns the regression betas and beta error reductions for all threads if this is the master thread (rank 0)
-            Returns None, None if it's a subordinate thread
+        :return: iterable
+            Returns regression results that pileup_data can process. Except for dask, results are yielded as each
+            block of genes finishes.
         """
 
         if MPControl.is_dask():
             from inferelator.distributed.dask_functions import bbsr_regress_dask
             return bbsr_regress_dask(self.X, self.Y, self.pp, self.weights_mat, self.G, self.genes, self.nS)
 
-        def regression_maker(j):
-            level = 0 if j % 100 == 0 else 2
-            utils.Debug.allprint(base_regression.PROGRESS_STR.format(gn=self.genes[j], i=j, total=self.G),
-                                 level=level)
+        # Calculate X'X once so it can be shared by every batch
+        if self.batch_size is not None:
+            assert utils.Validator.argument_integer(self.batch_size, low=1)
+            self._get_xtx()
+
+        return self.stream_blocks()
+
+    def gene_blocks(self, block_size=None):
+        """
+        Split the genes into blocks. Uses the batch size if it is set and block_size is None.
+
+        :param block_size: Number of genes in each block
+        :type block_size: int
+        :return: list(range)
+        """
+        block_size = self.batch_size if block_size is None else block_size
+        return super(BBSR, self).gene_blocks(block_size=block_size)
+
+    def gene_costs(self):
+        """
+        Best subset regression tests every combination of the predictors for a gene, so the cost is 2 ^ the number
+        of predictors (which is capped at nS)
+
+        :return: Relative cost [G]
+        :rtype: np.ndarray
+        """
+        return np.power(2., np.minimum(self.pp.sum(axis=1).values, self.nS))
+
+    def regress_block(self, genes):
+        """
+        Execute BBSR on a block of genes. If batch_size is set, X'X is shared by every gene and X'y is calculated
+        for the whole block with one matrix multiplication.
+
+        :param genes: Indices of the genes to regress
+        :type genes: iterable(int)
+        :return: list
+            Returns a list of regression results that pileup_data can process
+        """
+
+        genes = list(genes)
+
+        if len(genes) == 0:
+            return []
 
-            data = bayes_stats.bbsr(self.X.values,
-                                    utils.scale_vector(self.Y.get_gene_data(j, force_dense=True, flatten=True)),
+        level = 0 if genes[0] % 100 == 0 else 2
+        utils.Debug.allprint(base_regression.PROGRESS_STR.format(gn=self.genes[genes[0]], i=genes[0], total=self.G),
+                             level=level)
+
+        if self.batch_size is None:
+            return [self._regress_gene(j) for j in genes]
+
+        x = self.X.values
+        xtx = self._get_xtx()  # [K x K]
+
+        y_block = self.Y.get_gene_data(genes, force_dense=True)
+        y_block = np.column_stack([utils.scale_vector(y_block[:, i]) for i in range(len(genes))])
+        xty_block = np.dot(x.T, y_block)  # [K x batch]
+
+        results = []
+        for i, j in enumerate(genes):
+            data = bayes_stats.bbsr(x,
+                                    y_block[:, i],
                                     self.pp.iloc[j, :].values.flatten(),
                                     self.weights_mat.iloc[j, :].values.flatten(),
                                     self.nS,
-                                    ordinary_least_squares=self.ols_only)
-            data['ind'] = j
-            return data
-
-        return MPControl.map(regression_maker, range(self.G), tell_children=False)
+                                    ordinary_least_squares=self.ols_only,
+                                    xtx=xtx,
+                                    xty=xty_block[:, i],
+                                    x_sum=self._x_sum)
+            results.append(base_regression.compact_result(data, j))
+
+        return results
+
+    def _regress_gene(self, j):
+        data = bayes_stats.bbsr(self.X.values,
+                                utils.scale_vector(self.Y.get_gene_data(j, force_dense=True, flatten=True)),
+                                self.pp.iloc[j, :].values.flatten(),
+                                self.weights_mat.iloc[j, :].values.flatten(),
+                                self.nS,
+                                ordinary_least_squares=self.ols_only)
+        return base_regression.compact_result(data, j)
+
+    def _get_xtx(self):
+        if self._xtx is None:
+            x = self.X.values
+            self._xtx, self._x_sum = np.dot(x.T, x), np.sum(x, axis=0)
+        return self._xtx
 
     def _build_pp_matrix(self):
         """
@@ -170,15 +256,28 @@ class BBSRRegressionWorkflowMixin(base_regression._RegressionWorkflowMixin):
 
     mi_driver = mi.MIDriver
     mi_sync_path = None
+    mi_engine = mi.DEFAULT_MI_ENGINE
+    mi_weighted_bootstraps = False
+    mi_block_size = None
+    mi_memmap_dir = None
+    mi_cache_dir = None
+    mi_cache_size = None
+
+    _mi_cache = None
+
+    _mi_bootstrap_driver = None
 
     prior_weight = DEFAULT_prior_weight
     no_prior_weight = DEFAULT_no_prior_weight
     bsr_feature_num = DEFAULT_nS
     clr_only = False
     ols_only = False
+    bsr_batch_size = DEFAULT_batch_size
 
     def set_regression_parameters(self, prior_weight=None, no_prior_weight=None, bsr_feature_num=None, clr_only=False,
-                                  ordinary_least_squares_only=None):
+                                  ordinary_least_squares_only=None, mi_engine=None, mi_weighted_bootstraps=None,
+                                  mi_block_size=None, mi_memmap_dir=None, mi_cache_dir=None, mi_cache_size=None,
+                                  bsr_batch_size=None):
         """
         Set regression parameters for BBSR
 
@@ -193,6 +292,35 @@ class BBSRRegressionWorkflowMixin(base_regression._RegressionWorkflowMixin):
         :type clr_only: bool
         :param ordinary_least_squares_only: Use OLS instead of Bayesian regression, for testing. Defaults to False.
         :type ordinary_least_squares_only: bool
+        :param mi_engine: The engine used to calculate mutual information. "python" calculates each contingency table
+            separately. "blas" calculates contingency tables for blocks of genes with matrix multiplication, which is
+            much faster but uses more memory. "sparse" calculates contingency tables from the non-zero values of sparse
+            data, so memory use scales with the number of non-zero values. "numba" uses JIT-compiled kernels that
+            run on every core of the node. Defaults to "python", or "numba" if use_numba is set with
+            `set_run_parameters`.
+        :type mi_engine: str
+        :param mi_weighted_bootstraps: Discretize the data for mutual information once, and calculate each bootstrap
+            from contingency tables weighted by the number of times each sample was drawn, instead of discretizing
+            a resampled copy of the data. Bins are set on the full data instead of on each bootstrap, so results will
+            differ slightly from the default. Defaults to False.
+        :type mi_weighted_bootstraps: bool
+        :param mi_block_size: The number of genes to calculate mutual information and CLR for at once. Defaults to
+            None (blocks are sized automatically for MI and CLR is calculated for all genes at once).
+        :type mi_block_size: int
+        :param mi_memmap_dir: A path to write the mutual information and CLR arrays into as memory-mapped files, so
+            that they are not held in memory. Defaults to None.
+        :type mi_memmap_dir: str
+        :param mi_cache_dir: A path to cache mutual information and CLR arrays in. Arrays are keyed by a hash of
+            the discretized data, so runs which only change downstream parameters (like prior_weight) reuse them.
+            Defaults to None (no caching).
+        :type mi_cache_dir: str
+        :param mi_cache_size: The maximum size of the MI cache in bytes. The least recently used arrays are removed
+            when the cache is larger than this. Defaults to 1 GB.
+        :type mi_cache_size: int
+        :param bsr_batch_size: The number of genes to regress in each task. If set, X'X is calculated once for each
+            bootstrap and shared by every gene, and X'y is calculated for each batch of genes with one matrix
+            multiplication. Defaults to None (each gene is regressed separately).
+        :type bsr_batch_size: int
         """
 
         self._set_with_warning("prior_weight", prior_weight)
@@ -200,13 +328,23 @@ class BBSRRegressionWorkflowMixin(base_regression._RegressionWorkflowMixin):
         self._set_with_warning("bsr_feature_num", bsr_feature_num)
         self._set_without_warning("clr_only", clr_only)
         self._set_without_warning("ols_only", ordinary_least_squares_only)
+        self._set_without_warning("mi_engine", mi_engine)
+        self._set_without_warning("mi_weighted_bootstraps", mi_weighted_bootstraps)
+        self._set_without_warning("mi_block_size", mi_block_size)
+        self._set_without_warning("mi_memmap_dir", mi_memmap_dir)
+        self._set_without_warning("mi_cache_dir", mi_cache_dir)
+        self._set_without_warning("mi_cache_size", mi_cache_size)
+        self._set_without_warning("bsr_batch_size", bsr_batch_size)
 
     def run_bootstrap(self, bootstrap):
+        return self._make_bootstrap_regression(bootstrap).run()
+
+    def _make_bootstrap_regression(self, bootstrap, random_state=None):
         X = self.design.get_bootstrap(bootstrap)
-        Y = self.response.get_bootstrap(bootstrap)
+        Y = self.response.get_bootstrap_view(bootstrap)
 
         utils.Debug.vprint('Calculating MI, Background MI, and CLR Matrix', level=0)
-        clr_matrix, _ = self.mi_driver().run(Y, X, return_mi=False)
+        clr_matrix = self._calculate_clr(self.response, self.design, Y, X, bootstrap)
         utils.Debug.vprint('Calculating betas using BBSR', level=0)
 
         # Create a mock prior with no information if clr_only is set
@@ -215,6 +353,75 @@ class BBSRRegressionWorkflowMixin(base_regression._RegressionWorkflowMixin):
         else:
             priors = self.priors_data
 
-        return BBSR(X, Y, clr_matrix, priors, prior_weight=self.prior_weight,
-                    no_prior_weight=self.no_prior_weight, nS=self.bsr_feature_num,
-                    ordinary_least_squares=self.ols_only).run()
+        regression = BBSR(X, Y, clr_matrix, priors, prior_weight=self.prior_weight,
+                          no_prior_weight=self.no_prior_weight, nS=self.bsr_feature_num,
+                          ordinary_least_squares=self.ols_only, batch_size=self.bsr_batch_size)
+
+        # Calculate X'X before the regression is sent to workers so that it isn't calculated by every task
+        if self.bsr_batch_size is not None:
+            regression._get_xtx()
+
+        return regression
+
+    def _prepare_concurrent_bootstraps(self):
+
+        # Discretize the data for weighted bootstraps once, instead of in every bootstrap task
+        if self.mi_weighted_bootstraps:
+            if self._mi_bootstrap_driver is None or self._mi_bootstrap_driver.engine != self._get_mi_engine():
+                self._mi_bootstrap_driver = self._make_mi_driver()
+
+            self._mi_bootstrap_driver.discretize(self.response, self.design)
+
+    def _checkpoint_config(self):
+        config = super(BBSRRegressionWorkflowMixin, self)._checkpoint_config()
+        return "{c}|{pw}|{npw}|{nS}|{clr}|{ols}|{wb}".format(c=config, pw=self.prior_weight,
+                                                            npw=self.no_prior_weight, nS=self.bsr_feature_num,
+                                                            clr=self.clr_only, ols=self.ols_only,
+                                                            wb=self.mi_weighted_bootstraps)
+
+    def _make_mi_driver(self):
+
+        # Keep one cache object so that hits and misses are counted for the whole run
+        if self.mi_cache_dir is not None and (self._mi_cache is None or self._mi_cache.cache_dir != self.mi_cache_dir):
+            self._mi_cache = mi_cache.MICache(self.mi_cache_dir, max_size=self.mi_cache_size)
+
+        return self.mi_driver(engine=self._get_mi_engine(), block_size=self.mi_block_size,
+                              memmap_dir=self.mi_memmap_dir,
+                              cache=self._mi_cache if self.mi_cache_dir is not None else None)
+
+    def _get_mi_engine(self):
+        """
+        Use the numba MI engine if use_numba is set and a MI engine hasn't been explicitly chosen
+        """
+        if self.use_numba and self.mi_engine == mi.DEFAULT_MI_ENGINE:
+            return "numba"
+        else:
+            return self.mi_engine
+
+    def _calculate_clr(self, response, design, boot_response, boot_design, bootstrap):
+        """
+        Calculate the CLR matrix for a bootstrap, either from the resampled data or (if mi_weighted_bootstraps is set)
+        from the full data with bootstrap weights
+
+        :param response: Full response data [N x G]
+        :type response: InferelatorData
+        :param design: Full design data [N x K]
+        :type design: InferelatorData
+        :param boot_response: Resampled response data [N x G]
+        :type boot_response: InferelatorData, InferelatorBootstrapView
+        :param boot_design: Resampled design data [N x K]
+        :type boot_design: InferelatorData
+        :param bootstrap: Resampled sample indices
+        :type bootstrap: list(int)
+        :return clr_matrix: CLR matrix [G x K]
+        :rtype: pd.DataFrame
+        """
+
+        if not self.mi_weighted_bootstraps:
+            return self._make_mi_driver().run(boot_response, boot_design, return_mi=False)[0]
+
+        # Keep one driver so that the discretized data is reused for every bootstrap
+        if self._mi_bootstrap_driver is None or self._mi_bootstrap_driver.engine != self._get_mi_engine():
+            self._mi_bootstrap_driver = self._make_mi_driver()
+
+        return self._mi_bootstrap_driver.run(response, design, return_mi=False, bootstrap=bootstrap)[0]
@@ -0,0 +1,204 @@
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sps
+
+from inferelator.utils import Debug
+from inferelator.utils import Validator as check
+from inferelator.regression.mi_cache import _update_hash
+
+CHECKPOINT_FILE_NAME = "bootstrap_{idx:05d}.npz"
+
+
+class BootstrapCheckpoint:
+    """
+    On-disk checkpoint for completed bootstraps.
+    Each bootstrap's betas and rescaled betas are saved as sparse arrays into one .npz file, tagged with a hash of the
+    workflow configuration, input data, random seed and bootstrap sample. A bootstrap is only loaded if the tag
+    matches, so a restarted workflow can skip bootstraps which have already been finished.
+    """
+
+    checkpoint_dir = None
+
+    loaded = 0
+    saved = 0
+
+    def __init__(self, checkpoint_dir):
+        """
+        Create a bootstrap checkpoint
+
+        :param checkpoint_dir: Path to the checkpoint directory. It will be created if it doesn't exist.
+        :type checkpoint_dir: str
+        """
+
+        assert check.argument_path(checkpoint_dir, create_if_needed=True, access=os.W_OK)
+
+        self.checkpoint_dir = checkpoint_dir
+        self.loaded, self.saved = 0, 0
+
+    def __str__(self):
+        return "Checkpoint {path}: {l} loaded, {s} saved".format(path=self.checkpoint_dir, l=self.loaded, s=self.saved)
+
+    @staticmethod
+    def hash_data(*data):
+        """
+        Hash the regression input data, so that a checkpoint is not reused if the data changes. This only needs to be
+        done once for each run.
+
+        :param data: Input data (e.g. design, response and priors)
+        :type data: InferelatorData, pd.DataFrame, np.ndarray
+        :return: Hex digest
+        :rtype: str
+        """
+
+        h = hashlib.sha256()
+
+        for obj in data:
+            if isinstance(obj, pd.DataFrame):
+                h.update("\x1f".join(map(str, obj.index)).encode())
+                h.update("\x1f".join(map(str, obj.columns)).encode())
+                obj = obj.values
+            elif hasattr(obj, "expression_data"):
+                h.update("\x1f".join(map(str, obj.sample_names)).encode())
+                obj = obj.expression_data
+
+            _update_hash(h, obj)
+            h.update(b"|")
+
+        return h.hexdigest()
+
+    @staticmethod
+    def make_tag(config, random_seed, bootstrap, gene_names, tf_names, data_hash=None):
+        """
+        Hash the bootstrap settings into a checkpoint tag
+
+        :param config: Workflow configuration (any settings which change the regression results)
+        :type config: str
+        :param random_seed: The random seed for this bootstrap
+        :type random_seed: int
+        :param bootstrap: Resampled sample indices
+        :type bootstrap: list(int)
+        :param gene_names: Labels for the response variables [G]
+        :type gene_names: pd.Index
+        :param tf_names: Labels for the predictor variables [K]
+        :type tf_names: pd.Index
+        :param data_hash: Hash of the input data from hash_data
+        :type data_hash: str
+        :return: Hex digest
+        :rtype: str
+        """
+
+        h = hashlib.sha256()
+        h.update("{c}|{s}|{d}|".format(c=config, s=random_seed, d=data_hash).encode())
+
+        _update_hash(h, np.asarray(bootstrap, dtype=np.int64))
+
+        for names in (gene_names, tf_names):
+            h.update("\x1f".join(map(str, names)).encode())
+            h.update(b"|")
+
+        return h.hexdigest()
+
+    def get(self, idx, tag, gene_names, tf_names):
+        """
+        Load the betas and rescaled betas for a bootstrap if it has been checkpointed with the same tag
+
+        :param idx: Bootstrap number
+        :type idx: int
+        :param tag: Checkpoint tag from make_tag
+        :type tag: str
+        :param gene_names: Labels for the response variables [G]
+        :type gene_names: pd.Index
+        :param tf_names: Labels for the predictor variables [K]
+        :type tf_names: pd.Index
+        :return betas, rescaled_betas: Model coefficients and rescaled coefficients [G x K], or None if the bootstrap
+            is not in the checkpoint
+        :rtype: pd.DataFrame, pd.DataFrame
+        """
+
+        file_name = self._file_name(idx)
+
+        if not os.path.exists(file_name):
+            return None
+
+        try:
+            with np.load(file_name) as data:
+                if str(data["tag"]) != tag:
+                    Debug.vprint("Checkpoint {f} does not match this run; ignoring it".format(f=file_name), level=0)
+                    return None
+
+                betas, rescaled_betas = _load_csr(data, "betas"), _load_csr(data, "rescaled_betas")
+        except (OSError, KeyError, ValueError):
+            Debug.vprint("Checkpoint {f} could not be read; ignoring it".format(f=file_name), level=0)
+            return None
+
+        shape = (len(gene_names), len(tf_names))
+        if betas.shape != shape or rescaled_betas.shape != shape:
+            return None
+
+        self.loaded += 1
+        Debug.vprint("Loaded bootstrap {i} from checkpoint ({s})".format(i=idx + 1, s=str(self)), level=0)
+
+        return (pd.DataFrame(betas.A, index=gene_names, columns=tf_names),
+                pd.DataFrame(rescaled_betas.A, index=gene_names, columns=tf_names))
+
+    def put(self, idx, tag, betas, rescaled_betas):
+        """
+        Save the betas and rescaled betas for a bootstrap into the checkpoint
+
+        :param idx: Bootstrap number
+        :type idx: int
+        :param tag: Checkpoint tag from make_tag
+        :type tag: str
+        :param betas: Model coefficients [G x K]
+        :type betas: pd.DataFrame
+        :param rescaled_betas: Rescaled model coefficients [G x K]
+        :type rescaled_betas: pd.DataFrame
+        """
+
+        arrays = dict(tag=np.array(tag))
+        arrays.update(_save_csr(betas, "betas"))
+        arrays.update(_save_csr(rescaled_betas, "rescaled_betas"))
+
+        # Write to a temp file and move it into place so a partial file is never read
+        fh, temp_name = tempfile.mkstemp(suffix=".tmp", dir=self.checkpoint_dir)
+
+        try:
+            with os.fdopen(fh, "wb") as out_fh:
+                np.savez_compressed(out_fh, **arrays)
+            os.replace(temp_name, self._file_name(idx))
+        except BaseException:
+            if os.path.exists(temp_name):
+                os.remove(temp_name)
+            raise
+
+        self.saved += 1
+
+    def _file_name(self, idx):
+        return os.path.join(self.checkpoint_dir, CHECKPOINT_FILE_NAME.format(idx=idx))
+
+
+def _save_csr(data, name):
+    """
+    Convert a dataframe into a dict of CSR arrays for np.savez
+    """
+
+    data = sps.csr_matrix(data.values if isinstance(data, pd.DataFrame) else data, dtype=float)
+    data.eliminate_zeros()
+
+    return {name + "_data": data.data,
+            name + "_indices": data.indices,
+            name + "_indptr": data.indptr,
+            name + "_shape": np.array(data.shape)}
+
+
+def _load_csr(data, name):
+    """
+    Rebuild a CSR matrix from arrays loaded by np.load
+    """
+
+    return sps.csr_matrix((data[name + "_data"], data[name + "_indices"], data[name + "_indptr"]),
+                          shape=tuple(data[name + "_shape"]))
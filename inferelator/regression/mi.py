@@ -1,11 +1,15 @@
 from __future__ import division
 
+import os
+import tempfile
+
 import numpy as np
 import pandas as pd
 import scipy.sparse as sps
 
 from inferelator.distributed.inferelator_mp import MPControl
-from inferelator.utils import Debug, InferelatorData, array_set_diag
+from inferelator.regression.mi_numba import MI_numba
+from inferelator.utils import Debug, InferelatorData, InferelatorBootstrapView, array_set_diag
 from inferelator.utils import Validator as check
 
 # Number of discrete bins for mutual information calculation
@@ -17,19 +21,176 @@ CLR_DDOF = 1
 # Log type for MI calculations. np.log2 gives results in bits; np.log gives results in nats
 DEFAULT_LOG_TYPE = np.log
 
+# Engine for MI calculations. "python" builds one contingency table at a time; "blas" builds contingency tables
+# for a block of genes against every regulator with a single matrix multiplication; "sparse" builds contingency
+# tables from the stored values of sparse matrices and fills in the zeros from counts; "numba" uses JIT-compiled
+# kernels which are parallel across every core on the node (and falls back to "blas" if numba is not installed)
+MI_ENGINES = ("python", "blas", "sparse", "numba")
+DEFAULT_MI_ENGINE = "python"
 
-class MIDriver:
+# Discrete data is stored as np.int16, so this is the largest number of bins that can be used
+MAX_NUM_BINS = np.iinfo(np.int16).max
+
+# Target number of contingency table cells [genes x regulators x bins x bins] to hold at once for the blas engine
+MI_BLOCK_TABLE_CELLS = 2 ** 23
+
+# Maximum number of blocks in flight in the multiprocessing controller when writing MI into an output array
+MI_MAP_BATCH_BLOCKS = 256
+
+# Target number of continuous data cells [samples x genes] to discretize at once for the numba engine
+# (and when data is discretized ahead of time for the other engines)
+MI_NUMBA_BLOCK_CELLS = 2 ** 23
 
-    @staticmethod
-    def run(x, y, bins=DEFAULT_NUM_BINS, logtype=DEFAULT_LOG_TYPE, return_mi=True):
-        return context_likelihood_mi(x, y, bins=bins, logtype=logtype, return_mi=return_mi)
 
+class MIDriver:
 
-def context_likelihood_mi(x, y, bins=DEFAULT_NUM_BINS, logtype=DEFAULT_LOG_TYPE, return_mi=True):
+    engine = DEFAULT_MI_ENGINE
+    block_size = None
+    memmap_dir = None
+    cache = None
+
+    # Discretized data kept between bootstraps, keyed on the ids of the x and y data objects
+    _discrete_cache = None
+
+    def __init__(self, engine=None, block_size=None, memmap_dir=None, cache=None):
+        """
+        Create a MI driver
+
+        :param engine: The MI engine to use ("python", "blas", "sparse", or "numba"). Defaults to "python".
+        :type engine: str
+        :param block_size: The number of genes to calculate MI and CLR for at once. Defaults to None (set MI blocks
+            by the number of regulators and calculate CLR for all genes at once).
+        :type block_size: int
+        :param memmap_dir: A path to write the MI and CLR arrays to as memory-mapped files instead of holding them
+            in memory. Defaults to None.
+        :type memmap_dir: str
+        :param cache: An on-disk cache to check for MI and CLR arrays before calculating them, and to save
+            calculated arrays into. Defaults to None.
+        :type cache: MICache
+        """
+
+        assert check.argument_enum(engine, MI_ENGINES, allow_none=True)
+        assert check.argument_integer(block_size, low=1, allow_none=True)
+        assert check.argument_path(memmap_dir, allow_none=True)
+
+        self.engine = engine if engine is not None else self.engine
+        self.block_size = block_size if block_size is not None else self.block_size
+        self.memmap_dir = memmap_dir if memmap_dir is not None else self.memmap_dir
+        self.cache = cache if cache is not None else self.cache
+        self._discrete_cache = {}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+        # Object ids change when a driver is copied into another process; key the discrete data on the new ids
+        self._discrete_cache = {(id(v[0]), id(v[1]), k[2]): v for k, v in self._discrete_cache.items()}
+
+    def run(self, x, y, bins=DEFAULT_NUM_BINS, logtype=DEFAULT_LOG_TYPE, return_mi=True, bootstrap=None):
+        """
+        Calculate CLR and MI
+
+        :param x: An N x G InferelatorData object or bootstrap view
+        :type x: InferelatorData, InferelatorBootstrapView [N x G]
+        :param y: An N x K InferelatorData object
+        :type y: InferelatorData [N x K]
+        :param bins: Number of bins for discretizing continuous variables
+        :type bins: int
+        :param logtype: The logarithm function to use when calculating information. Defaults to natural log (np.log)
+        :type logtype: np.log func
+        :param return_mi: Boolean for returning a MI object. Defaults to True
+        :type return_mi: bool
+        :param bootstrap: A list of sample indices to resample with replacement. If this is provided, x and y are the
+            full data; they are discretized once (bins are set on the full data) and kept by this driver, and each
+            bootstrap is calculated from contingency tables weighted by how many times each sample was drawn.
+            Defaults to None (calculate on x and y as provided)
+        :type bootstrap: list(int)
+        :return clr, mi: CLR and MI InferelatorData objects. Returns (CLR, None) if return_mi is False.
+        :rtype InferelatorData, InferelatorData:
+        """
+
+        assert check.argument_integer(bins, low=1, high=MAX_NUM_BINS)
+
+        # Discretize the samples drawn into a bootstrap view once each and weight them by the number of draws,
+        # instead of gathering the resampled data (the dask MI path needs the resampled data)
+        if bootstrap is None and isinstance(x, InferelatorBootstrapView) and not MPControl.is_dask():
+            x, y, x_discrete, y_discrete, weights = _discretize_bootstrap_view(x, y, bins, self.engine)
+        elif bootstrap is None and self.cache is None:
+            return context_likelihood_mi(x, y, bins=bins, logtype=logtype, return_mi=return_mi, engine=self.engine,
+                                         block_size=self.block_size, memmap_dir=self.memmap_dir)
+
+        # Discretize first; the discrete data is needed for the cache key
+        elif bootstrap is None:
+            x_discrete = _discretize_blocks(x.expression_data, bins, self.engine)
+            y_discrete = _discretize_for_engine(y.expression_data, bins, self.engine)
+            weights = None
+        else:
+            x_discrete, y_discrete = self._get_discrete(x, y, bins)
+            weights = np.bincount(np.asarray(bootstrap, dtype=int), minlength=x.num_obs)
+
+        if self.cache is None:
+            return context_likelihood_mi(x, y, bins=bins, logtype=logtype, return_mi=return_mi, engine=self.engine,
+                                         weights=weights, x_discrete=x_discrete, y_discrete=y_discrete,
+                                         block_size=self.block_size, memmap_dir=self.memmap_dir)
+
+        key = self.cache.make_key(x_discrete, y_discrete, bins, logtype, x.gene_names, y.gene_names, weights=weights)
+        cached = self.cache.get(key)
+
+        # The dask MI path discretizes x itself, so only pass the continuous data when it would be used
+        if MPControl.is_dask() and weights is None:
+            x_discrete = None
+
+        if cached is not None:
+            clr, mi = (_copy_to_output_array(arr, memmap_dir=self.memmap_dir, prefix=prefix)
+                       for arr, prefix in zip(cached, ("clr_", "mi_")))
+            clr = pd.DataFrame(clr, index=x.gene_names, columns=y.gene_names)
+            mi = pd.DataFrame(mi, index=x.gene_names, columns=y.gene_names)
+        else:
+            clr, mi = context_likelihood_mi(x, y, bins=bins, logtype=logtype, return_mi=True, engine=self.engine,
+                                            weights=weights, x_discrete=x_discrete, y_discrete=y_discrete,
+                                            block_size=self.block_size, memmap_dir=self.memmap_dir)
+            self.cache.put(key, clr.values, mi.values)
+
+        return clr, mi if return_mi else None
+
+    def discretize(self, x, y, bins=DEFAULT_NUM_BINS):
+        """
+        Discretize x and y for bootstraps ahead of time, so that the discrete data is shared by copies of this driver
+
+        :param x: An N x G InferelatorData object
+        :type x: InferelatorData [N x G]
+        :param y: An N x K InferelatorData object
+        :type y: InferelatorData [N x K]
+        :param bins: Number of bins for discretizing continuous variables
+        :type bins: int
+        """
+        assert check.argument_integer(bins, low=1, high=MAX_NUM_BINS)
+        self._get_discrete(x, y, bins)
+
+    def _get_discrete(self, x, y, bins):
+        """
+        Discretize x and y for this driver's engine, or get them from the cache if they've already been discretized
+        """
+
+        key = (id(x), id(y), bins)
+
+        # Check identity as well as the ids, in case the objects have been replaced
+        if key not in self._discrete_cache or self._discrete_cache[key][0] is not x or \
+                self._discrete_cache[key][1] is not y:
+            Debug.vprint("Discretizing data for bootstrap MI", level=1)
+            self._discrete_cache[key] = (x, y,
+                                         _discretize_blocks(x.expression_data, bins, self.engine),
+                                         _discretize_for_engine(y.expression_data, bins, self.engine))
+
+        return self._discrete_cache[key][2:]
+
+
+def context_likelihood_mi(x, y, bins=DEFAULT_NUM_BINS, logtype=DEFAULT_LOG_TYPE, return_mi=True,
+                          engine=DEFAULT_MI_ENGINE, weights=None, x_discrete=None, y_discrete=None, block_size=None,
+                          memmap_dir=None):
     """
     Wrapper to calculate the Context Likelihood of Relatedness and Mutual Information for two data sets that have
     common condition rows. The y argument will be used to calculate background MI for the x & y MI.
-    As an implementation detail, y will be cast to a dense array if it is sparse.
+    As an implementation detail, y will be cast to a dense array if it is sparse (unless the "sparse" engine is used).
     X can be sparse with no internal copy.
 
     This function handles unpacking and packing the InferelatorData.
@@ -44,29 +205,54 @@ def context_likelihood_mi(x, y, bins=DEFAULT_NUM_BINS, logtype=DEFAULT_LOG_TYPE,
     :type bins: int
     :param return_mi: Boolean for returning a MI object. Defaults to True
     :type return_mi: bool
+    :param engine: The MI engine to use ("python", "blas", "sparse", or "numba"). Defaults to "python".
+    :type engine: str
+    :param weights: The number of times each observation should be counted in the contingency tables.
+        Defaults to None (count every observation once)
+    :type weights: np.ndarray [N]
+    :param x_discrete: x which has already been discretized by _discretize_for_engine. Defaults to None.
+    :type x_discrete: np.ndarray, tuple
+    :param y_discrete: y which has already been discretized by _discretize_for_engine. Defaults to None.
+    :type y_discrete: np.ndarray, tuple
+    :param block_size: The number of x variables to calculate MI and CLR for at once. Defaults to None.
+    :type block_size: int
+    :param memmap_dir: A path to create memory-mapped MI and CLR arrays in. Defaults to None (arrays are in memory).
+    :type memmap_dir: str
     :return clr, mi: CLR and MI InferelatorData objects. Returns (CLR, None) if return_mi is False.
     :rtype InferelatorData, InferelatorData:
     """
 
-    assert check.argument_integer(bins, allow_none=True)
+    assert check.argument_integer(bins, low=1, high=MAX_NUM_BINS, allow_none=True)
+    assert check.argument_enum(engine, MI_ENGINES)
     assert min(x.shape) > 0
     assert min(y.shape) > 0
     assert check.indexes_align((x.sample_names, y.sample_names))
+    assert weights is None or weights.shape == (x.num_obs, )
 
     # Create dense output matrix and copy the inputs
     mi_r = x.gene_names
     mi_c = y.gene_names
 
+    # Discretize y once; it is used for both the MI and the background MI
+    if y_discrete is None:
+        y_discrete = _discretize_for_engine(y.expression_data, bins, engine)
+
     # Build a [G x K] mutual information array
-    mi = mutual_information(x.expression_data, y.expression_data, bins, logtype=logtype)
+    # Blocks of genes are written into a preallocated (or memory-mapped) array
+    mi = mutual_information(x.expression_data if x_discrete is None else x_discrete, y_discrete, bins,
+                            logtype=logtype, engine=engine, y_is_discrete=True,
+                            x_is_discrete=x_discrete is not None, weights=weights, block_size=block_size,
+                            out=_make_output_array((len(mi_r), len(mi_c)), memmap_dir=memmap_dir, prefix="mi_"))
     array_set_diag(mi, 0., mi_r, mi_c)
 
     # Build a [K x K] mutual information array
-    mi_bg = mutual_information(y.expression_data, y.expression_data, bins, logtype=logtype)
+    # This is symmetric so only the upper triangle is calculated
+    mi_bg = background_mutual_information(y_discrete, bins, logtype=logtype, engine=engine, weights=weights)
     array_set_diag(mi_bg, 0., mi_c, mi_c)
 
     # Calculate CLR
-    clr = calc_mixed_clr(mi, mi_bg)
+    clr = calc_mixed_clr(mi, mi_bg, block_size=block_size,
+                         out=_make_output_array(mi.shape, memmap_dir=memmap_dir, prefix="clr_"))
 
     mi = pd.DataFrame(mi, index=mi_r, columns=mi_c)
     clr = pd.DataFrame(clr, index=mi_r, columns=mi_c)
@@ -74,7 +260,8 @@ def context_likelihood_mi(x, y, bins=DEFAULT_NUM_BINS, logtype=DEFAULT_LOG_TYPE,
     return clr, mi if return_mi else None
 
 
-def mutual_information(x, y, bins, logtype=DEFAULT_LOG_TYPE):
+def mutual_information(x, y, bins, logtype=DEFAULT_LOG_TYPE, engine=DEFAULT_MI_ENGINE, y_is_discrete=False,
+                       x_is_discrete=False, weights=None, block_size=None, out=None):
     """
     Calculate the mutual information matrix between two data matrices, where the columns are equivalent conditions
 
@@ -86,29 +273,96 @@ def mutual_information(x, y, bins, logtype=DEFAULT_LOG_TYPE):
         Number of bins to discretize continuous data into for the generation of a contingency table
     :param logtype: np.log func
         Which type of log function should be used (log2 results in MI bits, log results in MI nats, log10... is weird)
+    :param engine: str
+        The MI engine to use ("python", "blas", "sparse", or "numba")
+    :param y_is_discrete: bool
+        y has already been discretized into bins for this engine and should be used as-is
+    :param x_is_discrete: bool
+        x has already been discretized into bins for this engine and should be used as-is
+    :param weights: np.ndarray (n, )
+        The number of times each condition should be counted. None counts each condition once.
+    :param block_size: int
+        The number of x variables to process at once for the blocked engines. None sets it automatically.
+    :param out: np.ndarray (m1 x m2)
+        An array (or np.memmap) to write the mutual information into. None allocates a new array.
 
     :return mi: pd.DataFrame (m1 x m2)
         The mutual information between variables m1 and m2
     """
 
+    assert check.argument_integer(bins, low=1, high=MAX_NUM_BINS)
+
     # Discretize the input matrix y
-    y = y.A if sps.isspmatrix(y) else y
-    y = _make_array_discrete(y, bins, axis=0)
+    if not y_is_discrete:
+        y = _discretize_for_engine(y, bins, engine)
+
+    if MPControl.is_dask() and engine not in ("sparse", "numba") and (weights is not None or x_is_discrete):
+        Debug.vprint("Dask MI needs continuous, unweighted data; calculating MI with the {e} engine "
+                     "in this process".format(e=engine), level=1)
 
     # Build the MI matrix
-    if MPControl.is_dask():
+    if engine == "sparse":
+        return build_mi_array_sparse(x, y, bins, logtype=logtype, block_size=block_size, x_is_discrete=x_is_discrete,
+                                     weights=weights, out=out)
+    elif engine == "numba":
+        return build_mi_array_numba(x, y, bins, logtype=logtype, block_size=block_size, x_is_discrete=x_is_discrete,
+                                    weights=weights, out=out)
+    elif MPControl.is_dask() and weights is None and not x_is_discrete:
+        from inferelator.distributed.dask_functions import build_mi_array_dask
+        mi = build_mi_array_dask(x, y, bins, logtype=logtype)
+        if out is not None:
+            out[:] = mi
+        return mi if out is None else out
+    elif engine == "blas":
+        return build_mi_array_blas(x, y, bins, logtype=logtype, block_size=block_size, x_is_discrete=x_is_discrete,
+                                   weights=weights, out=out)
+    else:
+        return build_mi_array(x, y, bins, logtype=logtype, x_is_discrete=x_is_discrete, weights=weights, out=out)
+
+
+def background_mutual_information(y, bins, logtype=DEFAULT_LOG_TYPE, engine=DEFAULT_MI_ENGINE, weights=None):
+    """
+    Calculate the symmetric mutual information matrix between every pair of variables in a discrete data matrix.
+    Only the upper triangle is calculated; the diagonal is set to 0.
+
+    :param y: np.ndarray (n x m)
+        Discrete array of bins (or a sparse indicator matrix from _make_sparse_onehot for the "sparse" engine)
+    :param bins: int
+        The total number of bins that were used to make the array discrete
+    :param logtype: np.log func
+        Which type of log function should be used (log2 results in MI bits, log results in MI nats, log10... is weird)
+    :param engine: str
+        The MI engine to use ("python", "blas", "sparse", or "numba")
+    :param weights: np.ndarray (n, )
+        The number of times each condition should be counted. None counts each condition once.
+
+    :return mi: np.ndarray (m x m)
+        The mutual information between each pair of variables
+    """
+
+    if engine == "sparse":
+        return build_mi_array_symmetric_sparse(y, bins, logtype=logtype, weights=weights)
+    elif engine == "numba":
+        return build_mi_array_symmetric_numba(y, bins, logtype=logtype, weights=weights)
+
+    # The dask path has no symmetric implementation; calculate the full array
+    elif MPControl.is_dask() and weights is None:
         from inferelator.distributed.dask_functions import build_mi_array_dask
-        return build_mi_array_dask(x, y, bins, logtype=logtype)
+        mi = build_mi_array_dask(y, y, bins, logtype=logtype)
+        np.fill_diagonal(mi, 0.)
+        return mi
+    elif engine == "blas":
+        return build_mi_array_symmetric_blas(y, bins, logtype=logtype, weights=weights)
     else:
-        return build_mi_array(x, y, bins, logtype=logtype)
+        return build_mi_array_symmetric(y, bins, logtype=logtype, weights=weights)
 
 
-def build_mi_array(X, Y, bins, logtype=DEFAULT_LOG_TYPE, temp_dir=None):
+def build_mi_array(X, Y, bins, logtype=DEFAULT_LOG_TYPE, temp_dir=None, x_is_discrete=False, weights=None, out=None):
     """
     Calculate MI into an array
 
     :param X: np.ndarray (n x m1)
-        Discrete array of bins
+        Continuous data (this will be discretized by column unless x_is_discrete is set)
     :param Y: np.ndarray (n x m2)
         Discrete array of bins
     :param bins: int
@@ -117,6 +371,12 @@ def build_mi_array(X, Y, bins, logtype=DEFAULT_LOG_TYPE, temp_dir=None):
         Which log function to use (log2 gives bits, ln gives nats)
     :param temp_dir: path
         Path to write temp files for multiprocessing
+    :param x_is_discrete: bool
+        X is already a discrete array of bins
+    :param weights: np.ndarray (n, )
+        The number of times each condition should be counted. None counts each condition once.
+    :param out: np.ndarray (m1 x m2)
+        An array to write the mutual information into. None allocates a new array.
     :return mi: np.ndarray (m1 x m2)
         Returns the mutual information array
     """
@@ -128,20 +388,345 @@ def build_mi_array(X, Y, bins, logtype=DEFAULT_LOG_TYPE, temp_dir=None):
         level = 2 if i % 1000 == 0 else 3
         Debug.allprint("Mutual Information Calculation [{i} / {total}]".format(i=i, total=m1), level=level)
 
-        discrete_X = _make_discrete(X[:, i].A.flatten() if sps.isspmatrix(X) else X[:, i].flatten(), bins)
-        return [_calc_mi(_make_table(discrete_X, Y[:, j], bins), logtype=logtype) for j in range(m2)]
+        if x_is_discrete:
+            discrete_X = X[:, i]
+        else:
+            discrete_X = _make_discrete(X[:, i].A.flatten() if sps.isspmatrix(X) else X[:, i].flatten(), bins)
+
+        return [_calc_mi(_make_table(discrete_X, Y[:, j], bins, weights=weights), logtype=logtype)
+                for j in range(m2)]
+
+    # Send the MI build to the multiprocessing controller and write each row into the array
+    return _map_blocks_into(mi_make, m1, 1, _check_output_array(out, (m1, m2)), temp_dir=temp_dir)
+
+
+def build_mi_array_symmetric(Y, bins, logtype=DEFAULT_LOG_TYPE, temp_dir=None, weights=None):
+    """
+    Calculate MI between every pair of variables in Y into a symmetric array
+
+    :param Y: np.ndarray (n x m)
+        Discrete array of bins
+    :param bins: int
+        The total number of bins that were used to make the array discrete
+    :param logtype: np.log func
+        Which log function to use (log2 gives bits, ln gives nats)
+    :param temp_dir: path
+        Path to write temp files for multiprocessing
+    :param weights: np.ndarray (n, )
+        The number of times each condition should be counted. None counts each condition once.
+    :return mi: np.ndarray (m x m)
+        Returns the mutual information array with a diagonal of 0
+    """
+
+    m = Y.shape[1]
+
+    # Define the function which calculates MI for each variable in Y against every variable after it
+    def mi_make(i):
+        level = 2 if i % 1000 == 0 else 3
+        Debug.allprint("Background Mutual Information Calculation [{i} / {total}]".format(i=i, total=m), level=level)
+        return [_calc_mi(_make_table(Y[:, i], Y[:, j], bins, weights=weights), logtype=logtype)
+                for j in range(i + 1, m)]
 
     # Send the MI build to the multiprocessing controller
-    mi_list = MPControl.map(mi_make, range(m1), tmp_file_path=temp_dir)
+    mi_list = MPControl.map(mi_make, range(m), tmp_file_path=temp_dir)
+
+    # Fill the upper triangle and mirror it
+    mi = np.zeros((m, m), dtype=np.dtype(float))
+    for i, mi_row in enumerate(mi_list):
+        mi[i, i + 1:] = mi_row
+
+    return mi + mi.T
+
+
+def build_mi_array_blas(X, Y, bins, logtype=DEFAULT_LOG_TYPE, temp_dir=None, block_size=None, x_is_discrete=False,
+                        weights=None, out=None):
+    """
+    Calculate MI into an array by building one-hot indicator matrices and calculating the contingency tables for a
+    block of X variables against every Y variable with a single matrix multiplication
+
+    :param X: np.ndarray (n x m1)
+        Continuous data (this will be discretized in blocks unless x_is_discrete is set)
+    :param Y: np.ndarray (n x m2)
+        Discrete array of bins
+    :param bins: int
+        The total number of bins that were used to make the arrays discrete
+    :param logtype: np.log func
+        Which log function to use (log2 gives bits, ln gives nats)
+    :param temp_dir: path
+        Path to write temp files for multiprocessing
+    :param block_size: int
+        The number of X variables to process at once. Will be set based on the size of Y if None.
+    :param x_is_discrete: bool
+        X is already a discrete array of bins
+    :param weights: np.ndarray (n, )
+        The number of times each condition should be counted. None counts each condition once.
+    :param out: np.ndarray (m1 x m2)
+        An array (or np.memmap) to write the mutual information into. None allocates a new array.
+    :return mi: np.ndarray (m1 x m2)
+        Returns the mutual information array
+    """
+
+    m1, m2 = X.shape[1], Y.shape[1]
+
+    block_size = _mi_block_size(m2, bins) if block_size is None else block_size
+    assert check.argument_integer(block_size, low=1)
+
+    # Build the Y indicator matrix once; it's shared by every block
+    # Weighting the rows of one indicator matrix turns the products into weighted counts
+    y_onehot = _weight_onehot(_make_onehot(Y, bins), weights)
+
+    def mi_block_make(i):
+        start, stop = i * block_size, min((i + 1) * block_size, m1)
+        Debug.allprint("Mutual Information Calculation [{i} / {total}]".format(i=start, total=m1), level=2)
+
+        x = X[:, start:stop]
+        if not x_is_discrete:
+            x = _make_array_discrete(x.A if sps.isspmatrix(x) else x, bins, axis=0)
+        return _calc_mi_block(_make_onehot_tables(_make_onehot(x, bins), y_onehot, bins), logtype=logtype)
+
+    # Send the MI build to the multiprocessing controller and write each block into the array
+    return _map_blocks_into(mi_block_make, m1, block_size, _check_output_array(out, (m1, m2)), temp_dir=temp_dir)
+
+
+def build_mi_array_symmetric_blas(Y, bins, logtype=DEFAULT_LOG_TYPE, temp_dir=None, block_size=None, weights=None):
+    """
+    Calculate MI between every pair of variables in Y into a symmetric array with one-hot matrix multiplication.
+    Each block of variables is only compared to itself and the variables after it.
+
+    :param Y: np.ndarray (n x m)
+        Discrete array of bins
+    :param bins: int
+        The total number of bins that were used to make the array discrete
+    :param logtype: np.log func
+        Which log function to use (log2 gives bits, ln gives nats)
+    :param temp_dir: path
+        Path to write temp files for multiprocessing
+    :param block_size: int
+        The number of variables to process at once. Will be set based on the size of Y if None.
+    :param weights: np.ndarray (n, )
+        The number of times each condition should be counted. None counts each condition once.
+    :return mi: np.ndarray (m x m)
+        Returns the mutual information array with a diagonal of 0
+    """
+
+    m = Y.shape[1]
+
+    block_size = _mi_block_size(m, bins) if block_size is None else block_size
+    assert check.argument_integer(block_size, low=1)
+    n_blocks = int(np.ceil(m / block_size))
+
+    y_onehot = _make_onehot(Y, bins)
+    y_weighted = _weight_onehot(y_onehot, weights)
 
-    # Convert the list of lists to an array
-    mi = np.array(mi_list)
-    assert (m1, m2) == mi.shape, "Array {sh} produced [({m1}, {m2}) expected]".format(sh=mi.shape, m1=m1, m2=m2)
+    def mi_block_make(i):
+        start, stop = i * block_size, min((i + 1) * block_size, m)
+        Debug.allprint("Background Mutual Information Calculation [{i} / {total}]".format(i=start, total=m), level=2)
 
-    return mi
+        return _calc_mi_block(_make_onehot_tables(y_weighted[:, start * bins:stop * bins],
+                                                  y_onehot[:, start * bins:],
+                                                  bins),
+                              logtype=logtype)
 
+    # Send the MI build to the multiprocessing controller and fill the upper triangle as blocks finish
+    mi = np.zeros((m, m), dtype=np.dtype(float))
+    for i, mi_block in MPControl.as_completed(mi_block_make, range(n_blocks), tmp_file_path=temp_dir):
+        start = i * block_size
+        mi[start:start + mi_block.shape[0], start:] = mi_block
 
-def calc_mixed_clr(mi, mi_bg):
+    mi = np.triu(mi, k=1)
+    return mi + mi.T
+
+
+def build_mi_array_sparse(X, Y, bins, logtype=DEFAULT_LOG_TYPE, temp_dir=None, block_size=None, x_is_discrete=False,
+                          weights=None, out=None):
+    """
+    Calculate MI into an array without densifying sparse data. Contingency tables are built for a block of X
+    variables from the stored values only; the counts for implicit zeros (which are all in a known bin) are filled
+    in from the totals
+
+    :param X: np.ndarray, sp.spmatrix (n x m1)
+        Continuous data (this will be discretized in blocks unless x_is_discrete is set, in which case it is
+        the tuple from _make_sparse_onehot)
+    :param Y: tuple
+        Sparse indicator matrix (n x (m2 * bins)), zero bins (m2, ), and stored value counts (m2 x bins)
+        from _make_sparse_onehot
+    :param bins: int
+        The total number of bins that were used to make the arrays discrete
+    :param logtype: np.log func
+        Which log function to use (log2 gives bits, ln gives nats)
+    :param temp_dir: path
+        Path to write temp files for multiprocessing
+    :param block_size: int
+        The number of X variables to process at once. Will be set based on the size of Y if None.
+    :param x_is_discrete: bool
+        X is already the tuple from _make_sparse_onehot
+    :param weights: np.ndarray (n, )
+        The number of times each condition should be counted. None counts each condition once.
+    :param out: np.ndarray (m1 x m2)
+        An array (or np.memmap) to write the mutual information into. None allocates a new array.
+    :return mi: np.ndarray (m1 x m2)
+        Returns the mutual information array
+    """
+
+    X = X if x_is_discrete else sps.csc_matrix(X)
+    m1, m2 = X[1].shape[0] if x_is_discrete else X.shape[1], Y[1].shape[0]
+
+    block_size = _mi_block_size(m2, bins) if block_size is None else block_size
+    assert check.argument_integer(block_size, low=1)
+
+    def mi_block_make(i):
+        start, stop = i * block_size, min((i + 1) * block_size, m1)
+        Debug.allprint("Mutual Information Calculation [{i} / {total}]".format(i=start, total=m1), level=2)
+
+        if x_is_discrete:
+            x = _slice_sparse_onehot(X, start, stop, bins)
+        else:
+            x = _make_sparse_onehot(X[:, start:stop], bins)
+
+        tables = _make_sparse_onehot_tables(x, Y, bins, weights=weights)
+        return _calc_mi_block(tables, logtype=logtype)
+
+    # Send the MI build to the multiprocessing controller and write each block into the array
+    return _map_blocks_into(mi_block_make, m1, block_size, _check_output_array(out, (m1, m2)), temp_dir=temp_dir)
+
+
+def build_mi_array_symmetric_sparse(Y, bins, logtype=DEFAULT_LOG_TYPE, temp_dir=None, block_size=None, weights=None):
+    """
+    Calculate MI between every pair of variables in Y into a symmetric array without densifying sparse data.
+    Each block of variables is only compared to itself and the variables after it.
+
+    :param Y: tuple
+        Sparse indicator matrix (n x (m * bins)), zero bins (m, ), and stored value counts (m x bins)
+        from _make_sparse_onehot
+    :param bins: int
+        The total number of bins that were used to make the array discrete
+    :param logtype: np.log func
+        Which log function to use (log2 gives bits, ln gives nats)
+    :param temp_dir: path
+        Path to write temp files for multiprocessing
+    :param block_size: int
+        The number of variables to process at once. Will be set based on the size of Y if None.
+    :param weights: np.ndarray (n, )
+        The number of times each condition should be counted. None counts each condition once.
+    :return mi: np.ndarray (m x m)
+        Returns the mutual information array with a diagonal of 0
+    """
+
+    m = Y[1].shape[0]
+
+    block_size = _mi_block_size(m, bins) if block_size is None else block_size
+    assert check.argument_integer(block_size, low=1)
+    n_blocks = int(np.ceil(m / block_size))
+
+    def mi_block_make(i):
+        start, stop = i * block_size, min((i + 1) * block_size, m)
+        Debug.allprint("Background Mutual Information Calculation [{i} / {total}]".format(i=start, total=m), level=2)
+
+        tables = _make_sparse_onehot_tables(_slice_sparse_onehot(Y, start, stop, bins),
+                                            _slice_sparse_onehot(Y, start, m, bins),
+                                            bins, weights=weights)
+        return _calc_mi_block(tables, logtype=logtype)
+
+    # Send the MI build to the multiprocessing controller and fill the upper triangle as blocks finish
+    mi = np.zeros((m, m), dtype=np.dtype(float))
+    for i, mi_block in MPControl.as_completed(mi_block_make, range(n_blocks), tmp_file_path=temp_dir):
+        start = i * block_size
+        mi[start:start + mi_block.shape[0], start:] = mi_block
+
+    mi = np.triu(mi, k=1)
+    return mi + mi.T
+
+
+def build_mi_array_numba(X, Y, bins, logtype=DEFAULT_LOG_TYPE, block_size=None, x_is_discrete=False, weights=None,
+                         out=None):
+    """
+    Calculate MI into an array with JIT-compiled kernels that run in parallel in this process.
+    Falls back to build_mi_array_blas if numba is not available.
+
+    :param X: np.ndarray (n x m1)
+        Continuous data (this will be discretized in blocks unless x_is_discrete is set)
+    :param Y: np.ndarray (n x m2)
+        Discrete array of bins
+    :param bins: int
+        The total number of bins that were used to make the arrays discrete
+    :param logtype: np.log func
+        Which log function to use (log2 gives bits, ln gives nats)
+    :param block_size: int
+        The number of X variables to discretize at once. Will be set based on the number of observations if None.
+    :param x_is_discrete: bool
+        X is already a discrete array of bins
+    :param weights: np.ndarray (n, )
+        The number of times each condition should be counted. None counts each condition once.
+    :param out: np.ndarray (m1 x m2)
+        An array (or np.memmap) to write the mutual information into. None allocates a new array.
+    :return mi: np.ndarray (m1 x m2)
+        Returns the mutual information array
+    """
+
+    MI_numba.set_numba()
+
+    if not MI_numba.available:
+        return build_mi_array_blas(X, Y, bins, logtype=logtype, block_size=block_size, x_is_discrete=x_is_discrete,
+                                   weights=weights, out=out)
+
+    (n, m1), m2 = X.shape, Y.shape[1]
+
+    block_size = max(1, int(MI_NUMBA_BLOCK_CELLS / max(n, 1))) if block_size is None else block_size
+    assert check.argument_integer(block_size, low=1)
+
+    out = _check_output_array(out, (m1, m2))
+    y = np.asfortranarray(Y, dtype=np.int16)
+    weights = np.ones(n, dtype=float) if weights is None else np.asarray(weights, dtype=float)
+
+    # The kernel calculates MI in nats; log_b(e) converts it to the logtype base
+    log_scale = logtype(np.e)
+
+    for start in range(0, m1, block_size):
+        stop = min(start + block_size, m1)
+        Debug.allprint("Mutual Information Calculation [{i} / {total}]".format(i=start, total=m1), level=2)
+
+        x = X[:, start:stop]
+
+        if x_is_discrete:
+            x = np.asfortranarray(x, dtype=np.int16)
+        else:
+            x = _make_array_discrete_numba(x.A if sps.isspmatrix(x) else x, bins)
+
+        out[start:stop, :] = MI_numba.mi_array(x, y, bins, weights, False) * log_scale
+
+    return out
+
+
+def build_mi_array_symmetric_numba(Y, bins, logtype=DEFAULT_LOG_TYPE, weights=None):
+    """
+    Calculate MI between every pair of variables in Y into a symmetric array with JIT-compiled kernels.
+    Falls back to build_mi_array_symmetric_blas if numba is not available.
+
+    :param Y: np.ndarray (n x m)
+        Discrete array of bins
+    :param bins: int
+        The total number of bins that were used to make the array discrete
+    :param logtype: np.log func
+        Which log function to use (log2 gives bits, ln gives nats)
+    :param weights: np.ndarray (n, )
+        The number of times each condition should be counted. None counts each condition once.
+    :return mi: np.ndarray (m x m)
+        Returns the mutual information array with a diagonal of 0
+    """
+
+    MI_numba.set_numba()
+
+    if not MI_numba.available:
+        return build_mi_array_symmetric_blas(Y, bins, logtype=logtype, weights=weights)
+
+    y = np.asfortranarray(Y, dtype=np.int16)
+    weights = np.ones(Y.shape[0], dtype=float) if weights is None else np.asarray(weights, dtype=float)
+
+    mi = MI_numba.mi_array(y, y, bins, weights, True) * logtype(np.e)
+    return mi + mi.T
+
+
+def calc_mixed_clr(mi, mi_bg, block_size=None, out=None):
     """
     Calculate the context liklihood of relatedness from mutual information and the background mutual information
 
@@ -149,27 +734,46 @@ def calc_mixed_clr(mi, mi_bg):
     :type mi: np.ndarray
     :param mi_bg: Background mutual information array [m2 x m2]
     :type mi_bg: np.ndarray
+    :param block_size: The number of rows of mi to calculate CLR for at once. The column means and standard deviations
+        are calculated first, so only one block of z-scores is held at a time. Defaults to None (all rows at once).
+    :type block_size: int
+    :param out: An array (or np.memmap) to write CLR into [m1 x m2]. Defaults to None (a new array is allocated).
+    :type out: np.ndarray
     :return clr: Context liklihood of relateness array [m1 x m2]
     :rtype: np.ndarray
     """
 
-    with np.errstate(invalid='ignore'):
+    assert check.argument_integer(block_size, low=1, allow_none=True)
 
-        # Calculate the zscore for the dynamic CLR
-        z_dyn = np.round(mi, 10)  # Rounding so that float precision differences don't turn into huge CLR differences
-        z_dyn = np.subtract(z_dyn, np.mean(mi, axis=0))
-        z_dyn = np.divide(z_dyn, np.std(mi, axis=0, ddof=CLR_DDOF))
+    m1 = mi.shape[0]
+    block_size = max(m1, 1) if block_size is None else block_size
+    out = _check_output_array(out, mi.shape)
 
-        # Calculate the zscore for the static CLR
-        z_stat = np.round(mi, 10)  # Rounding so that float precision differences don't turn into huge CLR differences
-        z_stat = np.subtract(z_stat, np.mean(mi_bg, axis=0))
-        z_stat = np.divide(z_stat, np.std(mi_bg, axis=0, ddof=CLR_DDOF))
+    # Column statistics for the dynamic and static z-scores
+    mi_mean, mi_std = _column_mean_std(mi, block_size)
+    bg_mean, bg_std = _column_mean_std(mi_bg, max(mi_bg.shape[0], 1))
 
-        z_dyn[z_dyn < 0] = 0
-        z_stat[z_stat < 0] = 0
+    for start in range(0, m1, block_size):
+        stop = min(start + block_size, m1)
 
-    # Calculate CLR
-    return np.sqrt(np.square(z_dyn) + np.square(z_stat))
+        # Rounding so that float precision differences don't turn into huge CLR differences
+        mi_block = np.round(mi[start:stop, :], 10)
+
+        with np.errstate(invalid='ignore'):
+
+            # Calculate the zscore for the dynamic CLR
+            z_dyn = np.divide(np.subtract(mi_block, mi_mean), mi_std)
+
+            # Calculate the zscore for the static CLR
+            z_stat = np.divide(np.subtract(mi_block, bg_mean), bg_std)
+
+            z_dyn[z_dyn < 0] = 0
+            z_stat[z_stat < 0] = 0
+
+        # Calculate CLR
+        out[start:stop, :] = np.sqrt(np.square(z_dyn) + np.square(z_stat))
+
+    return out
 
 
 def _make_array_discrete(array, num_bins, axis=0):
@@ -207,7 +811,24 @@ def _make_discrete(arr_vec, num_bins):
                     out=np.zeros(shape=arr_vec.shape, dtype=np.int16), casting='unsafe')
 
 
-def _make_table(x, y, num_bins):
+def _make_array_discrete_numba(array, num_bins):
+    """
+    Discretize each column of a 2d array with the numba kernel. This is identical to _make_array_discrete.
+    """
+
+    array = np.asarray(array, dtype=float)
+
+    arr_min, arr_max = np.min(array, axis=0), np.max(array, axis=0)
+    arr_range = arr_max - arr_min
+    arr_range = arr_range + np.spacing(arr_range)
+
+    # Constant columns are flagged with a range of 0 and are put into bin 0
+    arr_range[arr_min == arr_max] = 0
+
+    return MI_numba.discretize(array, arr_min, arr_range, num_bins)
+
+
+def _make_table(x, y, num_bins, weights=None):
     """
     Takes two variable vectors which have been made into discrete integer bins and constructs a contingency table
     :param x: np.ndarray
@@ -216,6 +837,8 @@ def _make_table(x, y, num_bins):
         1d array of discrete data
     :param num_bins: int
         Number of bins for data
+    :param weights: np.ndarray
+        1d array of the number of times to count each observation. None counts each observation once.
     :return ctable: np.ndarray (num_bins x num_bins)
         Contingency table of variables X and Y
     """
@@ -224,9 +847,405 @@ def _make_table(x, y, num_bins):
     assert len(y.shape) == 1
 
     # The only fast way to do this is by reindexing the table as an index array
-    reindex = x * num_bins + y
+    # The discrete data is np.int16, which would overflow here for more than 181 bins
+    reindex = x.astype(np.intp) * num_bins + y
     # Then piling everything up with bincount and reshaping it back into the table
-    return np.bincount(reindex, minlength=num_bins ** 2).reshape(num_bins, num_bins).astype(np.dtype(float))
+    ctable = np.bincount(reindex, weights=weights, minlength=num_bins ** 2)
+    return ctable.reshape(num_bins, num_bins).astype(np.dtype(float))
+
+
+def _column_mean_std(arr, block_size):
+    """
+    Calculate the mean and standard deviation (with CLR_DDOF) of each column of an array, reading blocks of rows
+    so that no temporary array larger than a block is created
+
+    :param arr: np.ndarray (n x m)
+        Array (or np.memmap)
+    :param block_size: int
+        The number of rows to read at once
+    :return mean, std: np.ndarray (m, ), np.ndarray (m, )
+    """
+
+    n = arr.shape[0]
+
+    if block_size >= n:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.mean(arr, axis=0), np.std(arr, axis=0, ddof=CLR_DDOF)
+
+    col_sum = np.zeros(arr.shape[1], dtype=float)
+    for start in range(0, n, block_size):
+        col_sum += np.sum(arr[start:start + block_size, :], axis=0)
+
+    mean = col_sum / n
+
+    col_ss = np.zeros(arr.shape[1], dtype=float)
+    for start in range(0, n, block_size):
+        col_ss += np.sum(np.square(arr[start:start + block_size, :] - mean), axis=0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return mean, np.sqrt(col_ss / (n - CLR_DDOF))
+
+
+def _make_output_array(shape, memmap_dir=None, prefix=None):
+    """
+    Allocate a float array, or create a memory-mapped float array in a temporary file if memmap_dir is set.
+    The temporary file is unlinked once it is mapped where the OS allows it, so it does not outlive the array.
+    """
+
+    if memmap_dir is None:
+        return np.zeros(shape, dtype=np.dtype(float))
+
+    fh, file_name = tempfile.mkstemp(suffix=".dat", prefix=prefix, dir=memmap_dir)
+    os.close(fh)
+
+    arr = np.memmap(file_name, dtype=np.dtype(float), mode="w+", shape=shape)
+
+    try:
+        os.remove(file_name)
+    except OSError:
+        pass
+
+    return arr
+
+
+def _copy_to_output_array(arr, memmap_dir=None, prefix=None):
+    """
+    Copy an array into a memory-mapped file if memmap_dir is set; otherwise return it unchanged
+    """
+
+    if memmap_dir is None:
+        return arr
+
+    out = _make_output_array(arr.shape, memmap_dir=memmap_dir, prefix=prefix)
+    out[:] = arr
+    return out
+
+
+def _check_output_array(out, shape):
+    """
+    Allocate an output array if out is None; otherwise make sure that out has the right shape
+    """
+
+    if out is None:
+        return np.zeros(shape, dtype=np.dtype(float))
+    elif out.shape != shape:
+        raise ValueError("Output array {sh} provided; ({m1}, {m2}) expected".format(sh=out.shape, m1=shape[0],
+                                                                                    m2=shape[1]))
+    else:
+        return out
+
+
+def _map_blocks_into(block_make, n, block_size, out, temp_dir=None):
+    """
+    Map a function that calculates a block of rows over [0, n) with the multiprocessing controller, and write each
+    block into the output array as it finishes. At most MI_MAP_BATCH_BLOCKS blocks are in flight at a time.
+
+    :param block_make: Function that takes a block index and returns the rows [i * block_size, (i + 1) * block_size)
+    :type block_make: callable
+    :param n: The number of rows
+    :type n: int
+    :param block_size: The number of rows in each block
+    :type block_size: int
+    :param out: Output array
+    :type out: np.ndarray
+    :param temp_dir: Path to write temp files for multiprocessing
+    :type temp_dir: str
+    :return out: Output array
+    :rtype: np.ndarray
+    """
+
+    n_blocks = int(np.ceil(n / block_size))
+
+    for i, block in MPControl.as_completed(block_make, range(n_blocks), max_in_flight=MI_MAP_BATCH_BLOCKS,
+                                           tmp_file_path=temp_dir):
+        start = i * block_size
+        block = np.asarray(block).reshape(-1, out.shape[1])
+        out[start:start + block.shape[0], :] = block
+
+    return out
+
+
+def _mi_block_size(m2, num_bins):
+    """
+    Choose the number of variables per block so that the contingency tables for a block stay near
+    MI_BLOCK_TABLE_CELLS
+    """
+    return max(1, int(MI_BLOCK_TABLE_CELLS / (m2 * num_bins ** 2)))
+
+
+def _make_onehot(arr, num_bins):
+    """
+    Takes a 2d array which has been made into discrete integer bins and constructs an indicator matrix
+    :param arr: np.ndarray (n x m)
+        2d array of discrete data
+    :param num_bins: int
+        Number of bins for data
+    :return onehot: np.ndarray (n x (m * num_bins))
+        Indicator matrix where column (j * num_bins + b) is 1 if variable j is in bin b
+    """
+
+    n, m = arr.shape
+
+    # Counts are exact in float32 as long as they stay below 2^24
+    dtype = np.float32 if n < 2 ** 24 else np.float64
+
+    onehot = np.zeros((n, m * num_bins), dtype=dtype)
+    onehot[np.arange(n).reshape(-1, 1), arr.astype(np.intp) + np.arange(m) * num_bins] = 1
+    return onehot
+
+
+def _weight_onehot(onehot, weights):
+    """
+    Scale the rows of an indicator matrix by observation weights
+    """
+    return onehot if weights is None else onehot * weights.astype(onehot.dtype)[:, None]
+
+
+def _discretize_for_engine(arr, num_bins, engine):
+    """
+    Discretize a data matrix into the representation used by a MI engine
+    :param arr: np.ndarray, sp.spmatrix (n x m)
+        Continuous data
+    :param num_bins: int
+        Number of bins for data
+    :param engine: str
+        The MI engine which will use the discrete data
+    :return: np.ndarray (n x m) or the tuple from _make_sparse_onehot for the "sparse" engine
+    """
+
+    if engine == "sparse":
+        return _make_sparse_onehot(arr, num_bins)
+    else:
+        return _make_array_discrete(arr.A if sps.isspmatrix(arr) else arr, num_bins, axis=0)
+
+
+def _discretize_bootstrap_view(x, y, bins, engine):
+    """
+    Discretize a bootstrap view without gathering the resampled expression data. Each sample that was drawn is
+    discretized once and weighted by the number of times it was drawn. The resampled data has the same minimum
+    and maximum as the samples that were drawn, so the bins are the same as they are for the resampled data.
+
+    :param x: Resampled data [N x G]
+    :type x: InferelatorBootstrapView
+    :param y: Resampled data [N x K], with rows in the same order as x
+    :type y: InferelatorData
+    :param bins: Number of bins for data
+    :type bins: int
+    :param engine: The MI engine which will use the discrete data
+    :type engine: str
+    :return x, y, x_discrete, y_discrete, weights: The drawn samples of x and y, their discrete data, and the
+        number of times each was drawn [N_drawn]
+    """
+
+    drawn, first, weights = np.unique(np.asarray(x.sample_index, dtype=int), return_index=True, return_counts=True)
+
+    x = x.parent.get_bootstrap_view(drawn)
+    y = y.get_bootstrap(first)
+
+    return (x, y, _discretize_blocks(x.parent.values, bins, engine, rows=drawn),
+            _discretize_for_engine(y.expression_data, bins, engine), weights)
+
+
+def _discretize_blocks(arr, num_bins, engine, rows=None):
+    """
+    Discretize a data matrix into the representation used by a MI engine. Blocks of columns are made dense and
+    discretized one at a time, so that a dense copy of the entire continuous matrix is never made.
+
+    :param arr: np.ndarray, sp.spmatrix (n x m)
+        Continuous data
+    :param num_bins: int
+        Number of bins for data
+    :param engine: str
+        The MI engine which will use the discrete data
+    :param rows: np.ndarray
+        Indices of the rows to discretize. None discretizes every row.
+    :return: np.ndarray (n x m) or the tuple from _make_sparse_onehot for the "sparse" engine
+    """
+
+    if engine == "sparse":
+        return _discretize_for_engine(arr if rows is None else arr[rows, :], num_bins, engine)
+
+    # Columns are sliced out of sparse data in blocks
+    arr = arr.tocsc() if sps.isspmatrix(arr) else arr
+
+    n, m = arr.shape[0] if rows is None else len(rows), arr.shape[1]
+    block_size = max(1, int(MI_NUMBA_BLOCK_CELLS / max(n, 1)))
+    discrete = np.zeros((n, m), dtype=np.int16)
+
+    for start in range(0, m, block_size):
+        block = arr[:, start:min(start + block_size, m)]
+        discrete[:, start:start + block.shape[1]] = _discretize_for_engine(block if rows is None else block[rows, :],
+                                                                           num_bins, engine)
+
+    return discrete
+
+
+def _make_sparse_onehot(arr, num_bins):
+    """
+    Discretize the stored values of a sparse matrix into bins and construct an indicator matrix for them.
+    Implicit zeros are not stored in the indicator matrix; the bin that zero is in is returned for each variable.
+    The bins are identical to the bins from _make_array_discrete on the dense array.
+
+    :param arr: np.ndarray, sp.spmatrix (n x m)
+        2d array of continuous data
+    :param num_bins: int
+        Number of bins for data
+    :return onehot, zero_bins, bin_counts: sp.csr_matrix (n x (m * num_bins)), np.ndarray (m, ),
+        np.ndarray (m x num_bins)
+        Indicator matrix for the stored values, the bin that contains zero for each variable, and the number of stored
+        values in each bin for each variable
+    """
+
+    arr = sps.csc_matrix(arr)
+    n, m = arr.shape
+
+    # Get the min and max for each column (including implicit zeros)
+    arr_min = arr.min(axis=0).A.flatten().astype(float)
+    arr_max = arr.max(axis=0).A.flatten().astype(float)
+    arr_range = arr_max - arr_min
+    arr_range += np.spacing(arr_range)
+
+    # Continuous values to discrete bins [0, num_bins)
+    col_idx = np.repeat(np.arange(m), np.diff(arr.indptr))
+    with np.errstate(over='ignore', invalid='ignore'):
+        bins = np.floor((arr.data - arr_min[col_idx]) / arr_range[col_idx] * num_bins,
+                        out=np.zeros(shape=arr.data.shape, dtype=np.int16), casting='unsafe')
+        zero_bins = np.floor((0 - arr_min) / arr_range * num_bins,
+                             out=np.zeros(shape=(m,), dtype=np.int16), casting='unsafe')
+
+    # Short circuit if the variance is 0
+    constant = arr_min == arr_max
+    bins[constant[col_idx]] = 0
+    zero_bins[constant] = 0
+
+    # Build the indicator matrix; counts are exact in float32 as long as they stay below 2^24
+    dtype = np.float32 if n < 2 ** 24 else np.float64
+    onehot_cols = col_idx * num_bins + bins
+    onehot = sps.csr_matrix((np.ones(onehot_cols.shape, dtype=dtype), (arr.indices, onehot_cols)),
+                            shape=(n, m * num_bins))
+
+    bin_counts = np.bincount(onehot_cols, minlength=m * num_bins).reshape(m, num_bins)
+
+    return onehot, zero_bins, bin_counts
+
+
+def _slice_sparse_onehot(sparse_onehot, start, stop, num_bins):
+    """
+    Take a slice of variables [start, stop) from the tuple produced by _make_sparse_onehot
+    """
+    onehot, zero_bins, bin_counts = sparse_onehot
+    return onehot[:, start * num_bins:stop * num_bins], zero_bins[start:stop], bin_counts[start:stop, :]
+
+
+def _make_sparse_onehot_tables(x_sparse_onehot, y_sparse_onehot, num_bins, weights=None):
+    """
+    Multiply two sparse indicator matrices to get the contingency tables for stored values, and then add the
+    counts for observations where one or both variables are implicit zeros
+
+    :param x_sparse_onehot: tuple
+        Indicator matrix, zero bins, and bin counts from _make_sparse_onehot
+    :param y_sparse_onehot: tuple
+        Indicator matrix, zero bins, and bin counts from _make_sparse_onehot
+    :param num_bins: int
+        Number of bins for data
+    :param weights: np.ndarray (n, )
+        The number of times each observation should be counted. None counts each observation once.
+    :return ctables: np.ndarray (m1 x num_bins x m2 x num_bins)
+        Contingency tables where ctables[i, :, j, :] is the table for variables x_i and y_j
+    """
+
+    x_onehot, x_zero_bins, x_counts = x_sparse_onehot
+    y_onehot, y_zero_bins, y_counts = y_sparse_onehot
+
+    m1, m2 = x_zero_bins.shape[0], y_zero_bins.shape[0]
+
+    if weights is None:
+        n = x_onehot.shape[0]
+    else:
+        # Weight the y indicator matrix and replace the stored value counts with weighted counts
+        n = np.sum(weights)
+        y_onehot = sps.diags(weights.astype(y_onehot.dtype)).dot(y_onehot)
+        x_counts = x_onehot.T.dot(weights).reshape(m1, num_bins)
+        y_counts = y_onehot.sum(axis=0).A.reshape(m2, num_bins)
+
+    # Observations where both variables have stored values
+    tables = x_onehot.T.dot(y_onehot).toarray().astype(np.dtype(float)).reshape(m1, num_bins, m2, num_bins)
+
+    x_both = np.sum(tables, axis=3)
+    y_both = np.sum(tables, axis=1)
+    both = np.sum(x_both, axis=1)
+
+    x_idx, y_idx = np.arange(m1), np.arange(m2)
+
+    # Observations where only x is stored go into the y zero bin [m1 x n x m2]
+    tables[:, :, y_idx, y_zero_bins] += x_counts[:, :, None] - x_both
+
+    # Observations where only y is stored go into the x zero bin [m1 x m2 x n]
+    tables[x_idx, x_zero_bins, :, :] += y_counts[None, :, :] - y_both
+
+    # Observations where neither is stored go into both zero bins [m1 x m2]
+    neither = n - np.sum(x_counts, axis=1)[:, None] - np.sum(y_counts, axis=1)[None, :] + both
+    tables[x_idx[:, None], x_zero_bins[:, None], y_idx[None, :], y_zero_bins[None, :]] += neither
+
+    return tables
+
+
+def _make_onehot_tables(x_onehot, y_onehot, num_bins):
+    """
+    Multiply two indicator matrices to get every contingency table between the variables of x and y
+    :param x_onehot: np.ndarray (n x (m1 * num_bins))
+        Indicator matrix from _make_onehot
+    :param y_onehot: np.ndarray (n x (m2 * num_bins))
+        Indicator matrix from _make_onehot
+    :param num_bins: int
+        Number of bins for data
+    :return ctables: np.ndarray (m1 x num_bins x m2 x num_bins)
+        Contingency tables where ctables[i, :, j, :] is the table for variables x_i and y_j
+    """
+
+    m1, m2 = int(x_onehot.shape[1] / num_bins), int(y_onehot.shape[1] / num_bins)
+    tables = np.dot(x_onehot.T, y_onehot).astype(np.dtype(float))
+    return tables.reshape(m1, num_bins, m2, num_bins)
+
+
+def _calc_mi_block(tables, logtype=DEFAULT_LOG_TYPE):
+    """
+    Calculate Mutual Information for a block of contingency tables
+    This is the vectorized equivalent of _calc_mi
+
+    :param tables: np.ndarray (m1 x num_bins x m2 x num_bins)
+        Contingency tables from _make_onehot_tables
+    :param logtype: np.log func
+        Log function to use
+    :return: np.ndarray (m1 x m2)
+        Mutual information between each pair of variables
+    """
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+
+        # Marginal counts for x [m1 x n x m2 x 1] and y [m1 x 1 x m2 x n]
+        x_counts = np.sum(tables, axis=3, keepdims=True)
+        y_counts = np.sum(tables, axis=1, keepdims=True)
+        total = np.sum(x_counts, axis=1, keepdims=True)
+
+        # (PxPy) [m1 x n x m2 x n]
+        mi_val = np.multiply(x_counts / total, y_counts / total)
+
+        # (Pxy) [m1 x n x m2 x n]
+        tables = np.divide(tables, total)
+
+        # (Pxy)/(PxPy) [m1 x n x m2 x n]
+        mi_val = np.divide(tables, mi_val, out=mi_val)
+
+        # log[(Pxy)/(PxPy)] [m1 x n x m2 x n]
+        mi_val = logtype(mi_val)
+
+        # Pxy(log[(Pxy)/(PxPy)]) [m1 x n x m2 x n]
+        mi_val = np.multiply(tables, mi_val, out=mi_val)
+        mi_val[np.isnan(mi_val)] = 0
+
+        # Summation
+        return np.sum(mi_val, axis=(1, 3))
 
 
 def _calc_mi(table, logtype=DEFAULT_LOG_TYPE):
@@ -0,0 +1,194 @@
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+import scipy.sparse as sps
+
+from inferelator.utils import Debug
+from inferelator.utils import Validator as check
+
+# Default maximum size of the cache directory in bytes
+DEFAULT_MI_CACHE_SIZE = 2 ** 30
+
+MI_CACHE_SUFFIX = ".mi.npz"
+
+
+class MICache:
+    """
+    Content-addressed on-disk cache for MI and CLR arrays.
+    Entries are keyed by a hash of the discretized inputs, labels, bins, log type and bootstrap weights, and are
+    stored as compressed .npz files. When the directory grows past max_size, the least recently used entries
+    are removed.
+    """
+
+    cache_dir = None
+    max_size = DEFAULT_MI_CACHE_SIZE
+
+    hits = 0
+    misses = 0
+
+    def __init__(self, cache_dir, max_size=None):
+        """
+        Create a MI cache
+
+        :param cache_dir: Path to the cache directory. It will be created if it doesn't exist.
+        :type cache_dir: str
+        :param max_size: The maximum total size of cache files in bytes. None uses DEFAULT_MI_CACHE_SIZE (1 GB).
+        :type max_size: int
+        """
+
+        assert check.argument_path(cache_dir, create_if_needed=True, access=os.W_OK)
+        assert check.argument_integer(max_size, low=0, allow_none=True)
+
+        self.cache_dir = cache_dir
+        self.max_size = max_size if max_size is not None else self.max_size
+        self.hits, self.misses = 0, 0
+
+    def __str__(self):
+        return "MI cache {path}: {h} hits, {m} misses".format(path=self.cache_dir, h=self.hits, m=self.misses)
+
+    @staticmethod
+    def make_key(x_discrete, y_discrete, bins, logtype, x_names, y_names, weights=None):
+        """
+        Hash the MI inputs into a cache key
+
+        :param x_discrete: Discretized x data from mi._discretize_for_engine
+        :type x_discrete: np.ndarray, tuple
+        :param y_discrete: Discretized y data from mi._discretize_for_engine
+        :type y_discrete: np.ndarray, tuple
+        :param bins: Number of bins
+        :type bins: int
+        :param logtype: Log function
+        :type logtype: np.log func
+        :param x_names: Labels for x variables
+        :type x_names: pd.Index
+        :param y_names: Labels for y variables
+        :type y_names: pd.Index
+        :param weights: Bootstrap weights
+        :type weights: np.ndarray
+        :return: Hex digest
+        :rtype: str
+        """
+
+        h = hashlib.sha256()
+        h.update("{b}|{log}|".format(b=bins, log=getattr(logtype, "__name__", str(logtype))).encode())
+
+        for obj in (x_discrete, y_discrete, weights):
+            _update_hash(h, obj)
+
+        for names in (x_names, y_names):
+            h.update("\x1f".join(map(str, names)).encode())
+            h.update(b"|")
+
+        return h.hexdigest()
+
+    def get(self, key):
+        """
+        Load the CLR and MI arrays for a key if they are in the cache
+
+        :param key: Cache key from make_key
+        :type key: str
+        :return clr, mi: CLR and MI arrays, or None if the key is not in the cache
+        :rtype: np.ndarray, np.ndarray
+        """
+
+        file_name = self._file_name(key)
+
+        try:
+            with np.load(file_name) as data:
+                clr, mi = data["clr"], data["mi"]
+        except (OSError, KeyError, ValueError):
+            self.misses += 1
+            Debug.vprint("MI cache miss ({s})".format(s=str(self)), level=1)
+            return None
+
+        # Touch the file so that it's the most recently used
+        try:
+            os.utime(file_name)
+        except OSError:
+            pass
+
+        self.hits += 1
+        Debug.vprint("MI cache hit ({s})".format(s=str(self)), level=1)
+        return clr, mi
+
+    def put(self, key, clr, mi):
+        """
+        Save CLR and MI arrays into the cache and evict old entries if the cache is over max_size
+
+        :param key: Cache key from make_key
+        :type key: str
+        :param clr: CLR array
+        :type clr: np.ndarray
+        :param mi: MI array
+        :type mi: np.ndarray
+        """
+
+        # Write to a temp file and move it into place so a partial file is never read
+        fh, temp_name = tempfile.mkstemp(suffix=".tmp", dir=self.cache_dir)
+
+        try:
+            with os.fdopen(fh, "wb") as out_fh:
+                np.savez_compressed(out_fh, clr=np.asarray(clr), mi=np.asarray(mi))
+            os.replace(temp_name, self._file_name(key))
+        except BaseException:
+            if os.path.exists(temp_name):
+                os.remove(temp_name)
+            raise
+
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache is no larger than max_size
+        """
+
+        entries = []
+        for file_name in os.listdir(self.cache_dir):
+            if not file_name.endswith(MI_CACHE_SUFFIX):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, file_name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, file_name))
+
+        total_size = sum(e[1] for e in entries)
+
+        for _, size, file_name in sorted(entries):
+            if total_size <= self.max_size:
+                break
+
+            try:
+                os.remove(os.path.join(self.cache_dir, file_name))
+                total_size -= size
+                Debug.vprint("MI cache evicted {f}".format(f=file_name), level=2)
+            except OSError:
+                pass
+
+    def _file_name(self, key):
+        return os.path.join(self.cache_dir, key + MI_CACHE_SUFFIX)
+
+
+def _update_hash(h, obj):
+    """
+    Add an array, sparse matrix, or tuple of them to a hash object
+    """
+
+    if obj is None:
+        h.update(b"None|")
+    elif isinstance(obj, tuple):
+        h.update("tuple{n}|".format(n=len(obj)).encode())
+        for o in obj:
+            _update_hash(h, o)
+    elif sps.isspmatrix(obj):
+        obj = obj.tocsr()
+        obj.sort_indices()
+        h.update("sparse{sh}|".format(sh=obj.shape).encode())
+        for arr in (obj.indptr, obj.indices, obj.data):
+            _update_hash(h, arr)
+    else:
+        obj = np.ascontiguousarray(obj)
+        h.update("{dt}{sh}|".format(dt=obj.dtype.str, sh=obj.shape).encode())
+        h.update(obj.tobytes())
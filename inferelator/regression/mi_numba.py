@@ -0,0 +1,126 @@
+import numpy as np
+
+from inferelator.utils import Debug
+
+
+class MI_numba:
+    """
+    JIT-compiled mutual information kernels. These are parallelized across variables with numba.prange,
+    so they use every core on a node without going through the multiprocessing controller.
+
+    set_numba() must be called first; if numba can't be imported, available is False and the kernels are None.
+    """
+
+    _numba = False
+    available = False
+
+    discretize = None
+    mi_array = None
+
+    @classmethod
+    def set_numba(cls):
+
+        # If this has already been called, skip
+        if cls._numba:
+            return
+
+        # If we can't import numba, skip (and set a flag so we don't try again)
+        try:
+            import numba
+
+        except ImportError:
+            Debug.vprint("Unable to import numba; using python-native functions for MI instead", level=0)
+            cls._numba = True
+            return
+
+        Debug.vprint("Using numba functions for mutual information", level=0)
+
+        discretize, mi_array = _make_kernels(numba)
+
+        cls.discretize = staticmethod(discretize)
+        cls.mi_array = staticmethod(mi_array)
+        cls.available = True
+        cls._numba = True
+
+
+def _make_kernels(numba):
+    """
+    Build the JIT-compiled kernels
+
+    :param numba: The numba module
+    :return discretize, mi_array: Compiled functions
+    """
+
+    @numba.njit(parallel=True)
+    def discretize(arr, arr_min, arr_range, num_bins):
+        """
+        Discretize each column of arr into [0, num_bins) bins. This is identical to mi._make_discrete.
+
+        :param arr: np.ndarray [n x m] of floats
+        :param arr_min: np.ndarray [m] column minimums
+        :param arr_range: np.ndarray [m] column ranges (plus np.spacing); 0 for constant columns
+        :param num_bins: int; no more than mi.MAX_NUM_BINS, so that every bin fits in int16
+        :return: np.ndarray [n x m] of int16, Fortran ordered
+        """
+
+        n, m = arr.shape
+        out = np.zeros((m, n), dtype=np.int16)
+
+        for j in numba.prange(m):
+            if arr_range[j] == 0:
+                continue
+
+            for i in range(n):
+                out[j, i] = np.int16(np.floor((arr[i, j] - arr_min[j]) / arr_range[j] * num_bins))
+
+        return out.T
+
+    @numba.njit(parallel=True)
+    def mi_array(x, y, num_bins, weights, symmetric):
+        """
+        Build contingency tables and calculate mutual information (in nats) for each column of x against each
+        column of y. This is identical to mi._calc_mi(mi._make_table(...)).
+
+        :param x: np.ndarray [n x m1] of discrete bins; Fortran ordered arrays are fastest
+        :param y: np.ndarray [n x m2] of discrete bins; Fortran ordered arrays are fastest
+        :param num_bins: int
+        :param weights: np.ndarray [n] number of times to count each observation
+        :param symmetric: bool; only calculate the upper triangle (x and y must be the same array)
+        :return: np.ndarray [m1 x m2]
+        """
+
+        n, m1 = x.shape
+        m2 = y.shape[1]
+        out = np.zeros((m1, m2), dtype=np.float64)
+
+        for i in numba.prange(m1):
+            table = np.zeros((num_bins, num_bins), dtype=np.float64)
+            x_marginal = np.zeros(num_bins, dtype=np.float64)
+            y_marginal = np.zeros(num_bins, dtype=np.float64)
+
+            for j in range(i + 1 if symmetric else 0, m2):
+                table[:, :] = 0.
+
+                for k in range(n):
+                    table[x[k, i], y[k, j]] += weights[k]
+
+                total = np.sum(table)
+                if total == 0:
+                    continue
+
+                for a in range(num_bins):
+                    x_marginal[a] = np.sum(table[a, :]) / total
+                    y_marginal[a] = np.sum(table[:, a]) / total
+
+                mi_val = 0.
+                for a in range(num_bins):
+                    for b in range(num_bins):
+                        if table[a, b] > 0:
+                            p_xy = table[a, b] / total
+                            mi_val += p_xy * np.log(p_xy / (x_marginal[a] * y_marginal[b]))
+
+                out[i, j] = mi_val
+
+        return out
+
+    return discretize, mi_array
@@ -78,26 +78,42 @@ class SKLearnRegression(base_regression.BaseRegression):
         """
         Execute Elastic Net
 
-        :return: list
-            Returns a list of regression results that base_regression's pileup_data can process
+        :return: iterable
+            Returns regression results that base_regression's pileup_data can process. Except for dask, results are
+            yielded as each block of genes finishes.
         """
 
         if MPControl.is_dask():
             from inferelator.distributed.dask_functions import sklearn_regress_dask
             return sklearn_regress_dask(self.X, self.Y, self.model, self.G, self.genes, self.min_coef)
 
-        def regression_maker(j):
-            level = 0 if j % 100 == 0 else 2
-            utils.Debug.allprint(base_regression.PROGRESS_STR.format(gn=self.genes[j], i=j, total=self.G), level=level)
+        return self.stream_blocks()
+
+    def regress_block(self, genes):
+        """
+        Execute the scikit-learn model on a block of genes
+
+        :param genes: Indices of the genes to regress
+        :type genes: iterable(int)
+        :return: list
+            Returns a list of regression results that base_regression's pileup_data can process
+        """
+
+        genes = list(genes)
 
-            data = sklearn_gene(self.X.values,
-                                utils.scale_vector(self.Y.get_gene_data(j, force_dense=True, flatten=True)),
-                                copy.copy(self.model),
-                                min_coef=self.min_coef)
-            data['ind'] = j
-            return data
+        if len(genes) > 0:
+            level = 0 if genes[0] % 100 == 0 else 2
+            utils.Debug.allprint(base_regression.PROGRESS_STR.format(gn=self.genes[genes[0]], i=genes[0],
+                                                                     total=self.G), level=level)
 
-        return MPControl.map(regression_maker, range(self.G), tell_children=False)
+        return [self._regress_gene(j) for j in genes]
+
+    def _regress_gene(self, j):
+        data = sklearn_gene(self.X.values,
+                            utils.scale_vector(self.Y.get_gene_data(j, force_dense=True, flatten=True)),
+                            copy.copy(self.model),
+                            min_coef=self.min_coef)
+        return base_regression.compact_result(data, j)
 
 
 class SKLearnWorkflowMixin(base_regression._RegressionWorkflowMixin):
@@ -133,15 +149,29 @@ class SKLearnWorkflowMixin(base_regression._RegressionWorkflowMixin):
         self._sklearn_model_params.update(kwargs)
 
     def run_bootstrap(self, bootstrap):
+        return self._make_bootstrap_regression(bootstrap).run()
+
+    def _make_bootstrap_regression(self, bootstrap, random_state=None):
         x = self.design.get_bootstrap(bootstrap)
-        y = self.response.get_bootstrap(bootstrap)
+        y = self.response.get_bootstrap_view(bootstrap)
         utils.Debug.vprint('Calculating betas using SKLearn model {m}'.format(m=self._sklearn_model.__name__), level=0)
 
+        if not self._sklearn_add_random_state:
+            random_state = None
+        elif random_state is None:
+            random_state = self.random_seed
+
         return SKLearnRegression(x,
                                  y,
                                  self._sklearn_model,
-                                 random_state=self.random_seed if self._sklearn_add_random_state else None,
-                                 **self._sklearn_model_params).run()
+                                 random_state=random_state,
+                                 **self._sklearn_model_params)
+
+    def _checkpoint_config(self):
+        return "{c}|{m}|{rs}|{p}".format(c=super(SKLearnWorkflowMixin, self)._checkpoint_config(),
+                                         m=getattr(self._sklearn_model, "__name__", self._sklearn_model),
+                                         rs=self._sklearn_add_random_state,
+                                         p=sorted(self._sklearn_model_params.items()))
 
 
 class SKLearnByTaskMixin(_MultitaskRegressionWorkflowMixin, SKLearnWorkflowMixin):
@@ -5,6 +5,7 @@ import pandas.api.types as pat
 from sklearn.linear_model import LinearRegression as _LinearRegression, Lasso as _Lasso, Ridge as _Ridge
 
 from inferelator.regression import base_regression
+from inferelator.regression.checkpoint import BootstrapCheckpoint
 from inferelator.distributed.inferelator_mp import MPControl
 from inferelator import utils
 
@@ -164,8 +165,9 @@ class StARS(base_regression.BaseRegression):
         """
         Execute StARS
 
-        :return: list
-            Returns a list of regression results that base_regression's pileup_data can process
+        :return: iterable
+            Returns regression results that base_regression's pileup_data can process. Except for dask, results are
+            yielded as each block of genes finishes.
         """
 
         if MPControl.is_dask():
@@ -173,21 +175,36 @@ class StARS(base_regression.BaseRegression):
             return lasso_stars_regress_dask(self.X, self.Y, self.alphas, self.num_subsamples, self.random_seed,
                                             self.method, self.params, self.G, self.genes)
 
-        def regression_maker(j):
-            level = 0 if j % 100 == 0 else 2
-            utils.Debug.allprint(base_regression.PROGRESS_STR.format(gn=self.genes[j], i=j, total=self.G), level=level)
+        return self.stream_blocks()
+
+    def regress_block(self, genes):
+        """
+        Execute StARS on a block of genes
+
+        :param genes: Indices of the genes to regress
+        :type genes: iterable(int)
+        :return: list
+            Returns a list of regression results that base_regression's pileup_data can process
+        """
+
+        genes = list(genes)
 
-            data = stars_model_select(self.X.values,
-                                      utils.scale_vector(self.Y.get_gene_data(j, force_dense=True, flatten=True)),
-                                      self.alphas,
-                                      method=self.method,
-                                      num_subsamples=self.num_subsamples,
-                                      random_seed=self.random_seed,
-                                      **self.params)
-            data['ind'] = j
-            return data
+        if len(genes) > 0:
+            level = 0 if genes[0] % 100 == 0 else 2
+            utils.Debug.allprint(base_regression.PROGRESS_STR.format(gn=self.genes[genes[0]], i=genes[0],
+                                                                     total=self.G), level=level)
 
-        return MPControl.map(regression_maker, range(self.G), tell_children=False)
+        return [self._regress_gene(j) for j in genes]
+
+    def _regress_gene(self, j):
+        data = stars_model_select(self.X.values,
+                                  utils.scale_vector(self.Y.get_gene_data(j, force_dense=True, flatten=True)),
+                                  self.alphas,
+                                  method=self.method,
+                                  num_subsamples=self.num_subsamples,
+                                  random_seed=self.random_seed,
+                                  **self.params)
+        return base_regression.compact_result(data, j)
 
 
 class StARSWorkflowMixin(base_regression._RegressionWorkflowMixin):
@@ -230,13 +247,41 @@ class StARSWorkflowMixin(base_regression._RegressionWorkflowMixin):
 
     def run_regression(self):
 
-        betas, resc_betas = StARS(self.design, self.response, self.random_seed, alphas=self.alphas,
-                                  method=self.regress_method,
-                                  num_subsamples=self.num_subsamples,
-                                  parameters=self.sklearn_params).run()
+        if self.concurrent_bootstraps:
+            raise ValueError("StARS regresses all of the samples once instead of bootstrapping; "
+                             "concurrent_bootstraps is not supported")
+
+        checkpoint = BootstrapCheckpoint(self.checkpoint_dir) if self.checkpoint_dir is not None else None
+
+        # StARS regresses every sample once instead of bootstrapping; checkpoint it as one bootstrap of all samples
+        if checkpoint is not None:
+            tag = checkpoint.make_tag(self._checkpoint_config(), self.random_seed, np.arange(self.response.num_obs),
+                                      self.response.gene_names, self.design.gene_names,
+                                      data_hash=self._checkpoint_data_hash())
+            current = checkpoint.get(0, tag, self.response.gene_names, self.design.gene_names)
+        else:
+            current = None
 
+        if current is None:
+            current = self._run_stars()
+
+            if checkpoint is not None:
+                checkpoint.put(0, tag, *current)
+
+        betas, resc_betas = current
         return [betas], [resc_betas]
 
+    def _run_stars(self):
+        return StARS(self.design, self.response, self.random_seed, alphas=self.alphas,
+                     method=self.regress_method,
+                     num_subsamples=self.num_subsamples,
+                     parameters=self.sklearn_params).run()
+
+    def _checkpoint_config(self):
+        return "{c}|{a}|{n}|{m}|{p}".format(c=super(StARSWorkflowMixin, self)._checkpoint_config(),
+                                           a=list(np.asarray(self.alphas, dtype=float)), n=self.num_subsamples,
+                                           m=self.regress_method, p=sorted(self.sklearn_params.items()))
+
 
 class StARSWorkflowByTaskMixin(base_regression._MultitaskRegressionWorkflowMixin, StARSWorkflowMixin):
     """
@@ -35,3 +35,88 @@ class TestBaseRegression(unittest.TestCase):
         error_reduction = base_regression.predict_error_reduction(x, y, betas)
         np.testing.assert_array_almost_equal(error_reduction, np.array([-133.333, -133.333, -133.333]), 2)
 
+    def test_predict_error_reduction_leave_one_out(self):
+        rng = np.random.default_rng(42)
+        x = rng.normal(size=(30, 5))
+        y = (np.dot(x, np.array([1., 0.5, 0., 2., 0.1])) + rng.normal(size=30)).reshape(-1, 1)
+        betas = base_regression.recalculate_betas_from_selected(x, y)
+
+        error_reduction = base_regression.predict_error_reduction(x, y, betas)
+
+        ss_all = base_regression.sigma_squared(x, y, betas)
+        error_reduction_solve = base_regression._predict_error_reduction_solve(x, y, list(range(5)), ss_all,
+                                                                               np.zeros(5))
+        np.testing.assert_array_almost_equal(error_reduction, error_reduction_solve)
+
+    def test_predict_error_reduction_gram(self):
+        rng = np.random.default_rng(42)
+        x = rng.normal(size=(30, 5)) + 1
+        y = (np.dot(x, np.array([1., 0.5, 0., 2., 0.1])) + rng.normal(size=30)).reshape(-1, 1)
+        xtx, xty = np.dot(x.T, x), np.dot(x.T, y).reshape(-1)
+
+        betas = base_regression.recalculate_betas_from_gram(xtx, xty)
+        np.testing.assert_array_almost_equal(betas, base_regression.recalculate_betas_from_selected(x, y))
+
+        np.testing.assert_array_almost_equal(base_regression.predict_error_reduction_gram(xtx, xty, y, betas,
+                                                                                          x_sum=x.sum(axis=0)),
+                                             base_regression.predict_error_reduction(x, y, betas))
+
+        # Check the single predictor and singular fallback paths
+        x[:, 1] = x[:, 0]
+        xtx, xty = np.dot(x.T, x), np.dot(x.T, y).reshape(-1)
+
+        for betas in (np.array([0., 0., 1., 0., 0.]), np.array([1., 1., 0., 1., 0.])):
+            np.testing.assert_array_almost_equal(base_regression.predict_error_reduction_gram(xtx, xty, y, betas,
+                                                                                              x_sum=x.sum(axis=0)),
+                                                 base_regression.predict_error_reduction(x, y, betas))
+
+    def test_leave_one_out_betas_singular(self):
+        x = np.array([[0, 0, 0], [1, 1, 1], [2, 2, 2], [3, 3, 3], [4, 4, 4]])
+        self.assertIsNone(base_regression._leave_one_out_betas(np.dot(x.T, x), np.ones(3)))
+
+
+    def test_compact_result(self):
+        data = dict(pp=np.array([True, False, True, True]), betas=np.array([0.5, 0., 1.]),
+                    betas_resc=np.array([0.25, 0., 0.]))
+        result = base_regression.compact_result(data, 3)
+
+        self.assertEqual(result['ind'], 3)
+        np.testing.assert_array_equal(result['pp'], np.array([0, 3]))
+        np.testing.assert_array_almost_equal(result['betas'], np.array([0.5, 1.]))
+        np.testing.assert_array_almost_equal(result['betas_resc'], np.array([0.25, 0.]))
+        self.assertEqual(result['pp'].dtype, np.int32)
+        self.assertEqual(result['betas'].dtype, np.float32)
+
+    def test_compact_result_null_model(self):
+        data = dict(pp=np.repeat(True, 4).tolist(), betas=np.zeros(4), betas_resc=np.zeros(4))
+        result = base_regression.compact_result(data, 0)
+        self.assertEqual(len(result['pp']), 0)
+        self.assertEqual(len(result['betas']), 0)
+
+    def test_pack_results(self):
+        results = [base_regression.compact_result(dict(pp=np.array([True, False, True]), betas=np.array([0.5, 1.]),
+                                                       betas_resc=np.array([0.25, 0.5])), 4),
+                   base_regression.compact_result(dict(pp=np.zeros(3, dtype=bool), betas=np.zeros(0),
+                                                       betas_resc=np.zeros(0)), 1),
+                   base_regression.compact_result(dict(pp=np.array([False, True, False]), betas=np.array([2.]),
+                                                       betas_resc=np.array([1.])), 0)]
+
+        packed = base_regression.pack_results(results)
+        np.testing.assert_array_equal(packed['ind'], np.array([4, 1, 0]))
+        np.testing.assert_array_equal(packed['indptr'], np.array([0, 2, 2, 3]))
+
+        unpacked = base_regression.unpack_results(packed)
+        self.assertEqual(len(unpacked), 3)
+
+        for r, u in zip(results, unpacked):
+            self.assertEqual(r['ind'], u['ind'])
+            for k in ('pp', 'betas', 'betas_resc'):
+                np.testing.assert_array_equal(r[k], u[k])
+
+        self.assertListEqual(base_regression.unpack_results(base_regression.pack_results([])), [])
+
+    def test_consume_results(self):
+        run_data = [1, 2, 3]
+        self.assertListEqual(list(base_regression._consume_results(run_data)), [1, 2, 3])
+        self.assertListEqual(run_data, [None, None, None])
+        self.assertListEqual(list(base_regression._consume_results(iter([1, 2]))), [1, 2])
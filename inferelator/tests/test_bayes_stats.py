@@ -1,4 +1,5 @@
 import unittest
+import warnings
 from inferelator.regression import bayes_stats
 import numpy as np
 import scipy.stats
@@ -88,6 +89,24 @@ class TestBayesStats(unittest.TestCase):
         np.testing.assert_array_almost_equal(result['betas'], result_2['betas'])
         np.testing.assert_array_almost_equal(result['betas_resc'], result_2['betas_resc'])
 
+    def test_bbsr_xtx(self):
+        rng = np.random.default_rng(42)
+        x = rng.normal(size=(40, 8))
+        y = np.dot(x, np.array([1., 0., 0.5, 0., 0., 2., 0., 0.])) + rng.normal(size=40)
+        y = scipy.stats.zscore(y)
+
+        pp = np.ones(8, dtype=bool)
+        weights = np.ones(8)
+
+        result = bayes_stats.bbsr(x, y.copy(), pp.copy(), weights, 4)
+
+        # X is not used if xtx and xty are provided
+        result_xtx = bayes_stats.bbsr(None, y.copy(), pp.copy(), weights, 4, xtx=np.dot(x.T, x), xty=np.dot(x.T, y),
+                                      x_sum=x.sum(axis=0))
+
+        for component in ('pp', 'betas', 'betas_resc'):
+            np.testing.assert_array_almost_equal(result[component], result_xtx[component])
+
     def test_bbsr_2(self):
         # test when pp.sum() == 0
         X = np.array([[1, 0, 0], [2, 1, 0], [1, 1, 1], [0, 0, 1], [2, 1, 2]]).T
@@ -161,6 +180,74 @@ class TestBayesStats(unittest.TestCase):
         result = bayes_stats.calc_all_expected_BIC(x, y, g, combinations)
         np.testing.assert_array_almost_equal(result, np.array([12.9965, 8.1682, 11.387, 9.7776]), 4)
 
+    def test_calc_single_pair_BIC(self):
+        rng = np.random.default_rng(42)
+        x = rng.normal(size=(20, 6))
+        x[:, 1] = 2 * x[:, 0]
+        y = rng.normal(size=20)
+        g = rng.uniform(0, 5, size=(6, 1))
+
+        combos = np.hstack((np.diag(np.repeat(True, 6)), bayes_stats.select_index(6)))
+        i, j = np.triu_indices(6, 1)
+
+        for ols in (False, True):
+            bic = bayes_stats.calc_all_expected_BIC(x, y, g, combos, ordinary_least_squares=ols)
+            single_bic, pair_bic = bayes_stats.calc_single_pair_BIC(x, y, g, ordinary_least_squares=ols)
+            np.testing.assert_array_almost_equal(bic, np.concatenate((single_bic, pair_bic[i, j])))
+            np.testing.assert_array_almost_equal(pair_bic, pair_bic.T)
+
+    def test_reduce_predictors_singular(self):
+        rng = np.random.default_rng(42)
+        x = rng.normal(size=(20, 6))
+        x[:, 1] = 2 * x[:, 0]
+        y = x[:, 3] + rng.normal(size=20)
+        g = np.ones((6, 1))
+
+        # A singular pair makes every summed BIC NaN, so the first max_k predictors are kept
+        result = bayes_stats.reduce_predictors(x, y, g, 3)
+        np.testing.assert_array_equal(result, np.array([True, True, True, False, False, False]))
+
+    def test_calc_all_expected_BIC_gray(self):
+        rng = np.random.default_rng(42)
+        x = rng.normal(size=(20, 5))
+        y = rng.normal(size=20)
+        g = rng.uniform(0, 5, size=(5, 1))
+
+        for ols in (False, True):
+            bic = bayes_stats.calc_all_expected_BIC(x, y, g, bayes_stats.combo_index(5), ordinary_least_squares=ols)
+            bic_gray = bayes_stats.calc_all_expected_BIC_gray(x, y, g, ordinary_least_squares=ols)
+            np.testing.assert_array_almost_equal(bic, bic_gray)
+
+    def test_calc_all_expected_BIC_gray_singular(self):
+        rng = np.random.default_rng(42)
+        x = rng.normal(size=(20, 4))
+        x[:, 2] = x[:, 0] + x[:, 1]
+        y = rng.normal(size=20)
+        g = np.ones((4, 1))
+
+        combos = bayes_stats.combo_index(4)
+        bic = bayes_stats.calc_all_expected_BIC(x, y, g, combos)
+        bic_gray = bayes_stats.calc_all_expected_BIC_gray(x, y, g)
+
+        singular = combos[0, :] & combos[1, :] & combos[2, :]
+        self.assertTrue(np.all(np.isinf(bic_gray[singular])))
+        np.testing.assert_array_equal(np.isinf(bic), np.isinf(bic_gray))
+        np.testing.assert_array_almost_equal(bic[~singular], bic_gray[~singular])
+
+    def test_calc_all_expected_BIC_gray_no_warnings(self):
+        # A constant response has no variance, so the null model BIC is log(0)
+        x = PREDICTORS_Z.copy()
+        y = np.ones(x.shape[0])
+        g = np.ones((3, 1))
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            filters = list(warnings.filters)
+            bic = bayes_stats.calc_all_expected_BIC_gray(x, y, g)
+            self.assertListEqual(filters, warnings.filters)
+
+        self.assertTrue(np.isneginf(bic[0]))
+
     def test_calc_rate(self):
         x = np.array([[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 1, 0], [0, 0, 0, 1]])
         y = np.array([[1, 2, 3], [0, 1, 1], [1, 1, 1], [1, 0, 1]])
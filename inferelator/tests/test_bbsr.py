@@ -181,3 +181,9 @@ class TestBBSRrunnerPython(unittest.TestCase):
                                                    columns=['gene1', 'gene2']).astype(float))
         pdt.assert_frame_equal(resc, pd.DataFrame([[0, 1], [1, 0]], index=['gene1', 'gene2'],
                                                   columns=['gene1', 'gene2']).astype(float))
+
+
+class TestBBSRrunnerPythonBatched(TestBBSRrunnerPython):
+
+    def run_bbsr(self):
+        return self.brd(self.X, self.Y, self.clr, self.priors, batch_size=2).run()
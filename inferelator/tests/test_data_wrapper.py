@@ -415,6 +415,28 @@ class TestSampling(TestWrapperSetup):
         new_adata = self.adata.get_random_samples(11, with_replacement=True, fix_names=False, inplace=True)
         self.assertEqual(id(new_adata), id(self.adata))
 
+    def test_bootstrap_view(self):
+
+        bootstrap = np.random.default_rng(10).integers(self.adata.num_obs, size=(self.adata.num_obs, ))
+
+        for data in (self.adata, self.adata_sparse):
+            view = data.get_bootstrap_view(bootstrap)
+            boot_data = data.get_bootstrap(bootstrap)
+
+            self.assertEqual(view.shape, boot_data.shape)
+            pdt.assert_index_equal(view.gene_names, boot_data.gene_names)
+            pdt.assert_index_equal(view.sample_names, boot_data.sample_names)
+
+            npt.assert_array_almost_equal(view.gene_means, boot_data.gene_means)
+            npt.assert_array_almost_equal(view.gene_stdev, boot_data.gene_stdev)
+
+            npt.assert_array_equal(view.get_gene_data(3, force_dense=True, flatten=True),
+                                   boot_data.get_gene_data(3, force_dense=True, flatten=True))
+            npt.assert_array_equal(view.get_gene_data([1, 2], force_dense=True),
+                                   boot_data.get_gene_data([1, 2], force_dense=True))
+            pdt.assert_frame_equal(view.get_gene_data([0, 2], to_df=True),
+                                   boot_data.get_gene_data([0, 2], to_df=True))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,9 +1,14 @@
 import unittest
+import tempfile
+import shutil
+import os
 import pandas as pd
+import pandas.testing as pdt
 import numpy as np
 import scipy.sparse as sps
 from inferelator.regression import mi
-from inferelator.utils import InferelatorData
+from inferelator.regression import mi_cache
+from inferelator.utils import InferelatorData, InferelatorBootstrapView
 
 L = InferelatorData(expression_data=np.array([[1, 2], [3, 4]]), transpose_expression=True)
 L_sparse = InferelatorData(expression_data=sps.csr_matrix([[1, 2], [3, 4]]), transpose_expression=True)
@@ -81,3 +86,476 @@ class Test2By3(unittest.TestCase):
         self.clr_matrix, self.mi_matrix = mi.context_likelihood_mi(self.x_dataframe, self.y_dataframe)
         expected = np.array([[0, 1], [1, 0]])
         np.testing.assert_almost_equal(self.clr_matrix.values, expected)
+
+
+class TestMIEngines(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.x = rng.normal(size=(100, 25))
+        self.y = rng.normal(size=(100, 8))
+
+        # Include constant variables
+        self.x[:, 3] = 1.
+        self.y[:, 2] = 0.
+
+        self.y_discrete = mi._make_array_discrete(self.y, mi.DEFAULT_NUM_BINS)
+        self.mi_python = mi.build_mi_array(self.x, self.y_discrete, mi.DEFAULT_NUM_BINS)
+
+    def test_blas_engine(self):
+        mi_blas = mi.build_mi_array_blas(self.x, self.y_discrete, mi.DEFAULT_NUM_BINS)
+        np.testing.assert_array_almost_equal(self.mi_python, mi_blas)
+
+    def test_blas_engine_blocks(self):
+        mi_blas = mi.build_mi_array_blas(self.x, self.y_discrete, mi.DEFAULT_NUM_BINS, block_size=4)
+        np.testing.assert_array_almost_equal(self.mi_python, mi_blas)
+
+    def test_blas_engine_sparse(self):
+        mi_blas = mi.build_mi_array_blas(sps.csc_matrix(self.x), self.y_discrete, mi.DEFAULT_NUM_BINS, block_size=6)
+        np.testing.assert_array_almost_equal(self.mi_python, mi_blas)
+
+    def test_blas_engine_log2(self):
+        mi_python = mi.build_mi_array(self.x, self.y_discrete, mi.DEFAULT_NUM_BINS, logtype=np.log2)
+        mi_blas = mi.build_mi_array_blas(self.x, self.y_discrete, mi.DEFAULT_NUM_BINS, logtype=np.log2)
+        np.testing.assert_array_almost_equal(mi_python, mi_blas)
+
+    def test_blas_clr(self):
+        x = InferelatorData(expression_data=self.x)
+        y = InferelatorData(expression_data=self.y)
+
+        clr_python, mi_python = mi.MIDriver().run(x, y)
+        clr_blas, mi_blas = mi.MIDriver(engine="blas").run(x, y)
+
+        np.testing.assert_array_almost_equal(mi_python.values, mi_blas.values)
+        np.testing.assert_array_almost_equal(clr_python.values, clr_blas.values)
+
+    def test_bad_engine(self):
+        with self.assertRaises(ValueError):
+            mi.MIDriver(engine="V8")
+
+    def test_make_table_many_bins(self):
+        # The flat table index for int16 bins overflows int16 with more than 181 bins
+        x = np.array([199, 0, 199], dtype=np.int16)
+        y = np.array([199, 199, 199], dtype=np.int16)
+
+        ctable = mi._make_table(x, y, 200)
+        self.assertEqual(ctable.shape, (200, 200))
+        self.assertEqual(ctable[199, 199], 2)
+        self.assertEqual(ctable[0, 199], 1)
+
+    def test_many_bins(self):
+        y_discrete = mi._make_array_discrete(self.y, 200)
+        mi_python = mi.build_mi_array(self.x, y_discrete, 200)
+        mi_blas = mi.build_mi_array_blas(self.x, y_discrete, 200)
+
+        self.assertTrue(np.all(np.isfinite(mi_python)))
+        np.testing.assert_array_almost_equal(mi_python, mi_blas)
+
+    def test_too_many_bins(self):
+        x = InferelatorData(expression_data=self.x)
+        y = InferelatorData(expression_data=self.y)
+
+        with self.assertRaises(ValueError):
+            mi.MIDriver().run(x, y, bins=mi.MAX_NUM_BINS + 1)
+
+        with self.assertRaises(ValueError):
+            mi.context_likelihood_mi(x, y, bins=mi.MAX_NUM_BINS + 1)
+
+    def test_symmetric_background(self):
+        mi_full = mi.build_mi_array(self.y, self.y_discrete, mi.DEFAULT_NUM_BINS)
+        np.fill_diagonal(mi_full, 0.)
+
+        mi_sym = mi.build_mi_array_symmetric(self.y_discrete, mi.DEFAULT_NUM_BINS)
+        np.testing.assert_array_almost_equal(mi_full, mi_sym)
+        np.testing.assert_array_equal(mi_sym, mi_sym.T)
+
+    def test_symmetric_background_blas(self):
+        mi_full = mi.build_mi_array(self.y, self.y_discrete, mi.DEFAULT_NUM_BINS)
+        np.fill_diagonal(mi_full, 0.)
+
+        mi_sym = mi.build_mi_array_symmetric_blas(self.y_discrete, mi.DEFAULT_NUM_BINS, block_size=3)
+        np.testing.assert_array_almost_equal(mi_full, mi_sym)
+        np.testing.assert_array_equal(mi_sym, mi_sym.T)
+
+
+class TestMISparseEngine(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.x = rng.poisson(0.5, size=(200, 25)).astype(float)
+        self.y = rng.poisson(1., size=(200, 8)).astype(float)
+
+        # Include constant variables and variables where zero is not the minimum
+        self.x[:, 3] = 0.
+        self.x[:, 4] = 2.
+        self.x[:, 5] = -self.x[:, 5]
+        self.y[:, 2] = 0.
+        self.y[:, 6] = self.y[:, 6] - 1.
+
+        self.y_discrete = mi._make_array_discrete(self.y, mi.DEFAULT_NUM_BINS)
+        self.y_sparse = mi._make_sparse_onehot(sps.csr_matrix(self.y), mi.DEFAULT_NUM_BINS)
+        self.mi_python = mi.build_mi_array(self.x, self.y_discrete, mi.DEFAULT_NUM_BINS)
+
+    def test_sparse_onehot_bins(self):
+        onehot, zero_bins, bin_counts = self.y_sparse
+        dense_onehot = mi._make_onehot(self.y_discrete, mi.DEFAULT_NUM_BINS).reshape(200, 8, mi.DEFAULT_NUM_BINS)
+        dense_counts = dense_onehot.sum(axis=0)
+
+        self.assertEqual(onehot.nnz, np.sum(self.y != 0))
+        np.testing.assert_array_equal(zero_bins, [mi._make_discrete(np.append(self.y[:, i], 0.), 10)[-1]
+                                                  for i in range(8)])
+        zero_counts = np.eye(mi.DEFAULT_NUM_BINS)[zero_bins] * np.sum(self.y == 0, axis=0)[:, None]
+        np.testing.assert_array_equal(bin_counts + zero_counts, dense_counts)
+
+    def test_sparse_engine(self):
+        mi_sparse = mi.build_mi_array_sparse(sps.csc_matrix(self.x), self.y_sparse, mi.DEFAULT_NUM_BINS)
+        np.testing.assert_array_almost_equal(self.mi_python, mi_sparse)
+
+    def test_sparse_engine_blocks(self):
+        mi_sparse = mi.build_mi_array_sparse(sps.csr_matrix(self.x), self.y_sparse, mi.DEFAULT_NUM_BINS, block_size=4)
+        np.testing.assert_array_almost_equal(self.mi_python, mi_sparse)
+
+    def test_sparse_engine_dense(self):
+        mi_sparse = mi.build_mi_array_sparse(self.x, mi._make_sparse_onehot(self.y, mi.DEFAULT_NUM_BINS),
+                                             mi.DEFAULT_NUM_BINS)
+        np.testing.assert_array_almost_equal(self.mi_python, mi_sparse)
+
+    def test_symmetric_background_sparse(self):
+        mi_full = mi.build_mi_array(self.y, self.y_discrete, mi.DEFAULT_NUM_BINS)
+        np.fill_diagonal(mi_full, 0.)
+
+        mi_sym = mi.build_mi_array_symmetric_sparse(self.y_sparse, mi.DEFAULT_NUM_BINS, block_size=3)
+        np.testing.assert_array_almost_equal(mi_full, mi_sym)
+        np.testing.assert_array_equal(mi_sym, mi_sym.T)
+
+    def test_sparse_clr(self):
+        x = InferelatorData(expression_data=sps.csr_matrix(self.x))
+        y = InferelatorData(expression_data=sps.csr_matrix(self.y))
+
+        clr_python, mi_python = mi.MIDriver().run(x, y)
+        clr_sparse, mi_sparse = mi.MIDriver(engine="sparse").run(x, y)
+
+        np.testing.assert_array_almost_equal(mi_python.values, mi_sparse.values)
+        np.testing.assert_array_almost_equal(clr_python.values, clr_sparse.values)
+
+
+class TestMIWeightedBootstraps(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.x = rng.poisson(0.5, size=(100, 25)).astype(float)
+        self.y = rng.poisson(1., size=(100, 8)).astype(float)
+        self.x[:, 3] = 1.
+
+        self.bootstrap = rng.choice(100, size=100).tolist()
+
+        # Bins are set on the full data, and then the discrete data is resampled
+        x_discrete = mi._make_array_discrete(self.x, mi.DEFAULT_NUM_BINS)[self.bootstrap, :]
+        y_discrete = mi._make_array_discrete(self.y, mi.DEFAULT_NUM_BINS)[self.bootstrap, :]
+
+        self.mi = mi.build_mi_array(x_discrete, y_discrete, mi.DEFAULT_NUM_BINS, x_is_discrete=True)
+        self.mi_bg = mi.build_mi_array_symmetric(y_discrete, mi.DEFAULT_NUM_BINS)
+        self.clr = mi.calc_mixed_clr(self.mi, self.mi_bg)
+
+    def _check_engine(self, engine, x, y):
+        x = InferelatorData(expression_data=x, gene_names=["X" + str(i) for i in range(25)])
+        y = InferelatorData(expression_data=y, gene_names=["Y" + str(i) for i in range(8)])
+
+        driver = mi.MIDriver(engine=engine)
+        clr, mi_arr = driver.run(x, y, bootstrap=self.bootstrap)
+
+        np.testing.assert_array_almost_equal(self.mi, mi_arr.values)
+        np.testing.assert_array_almost_equal(self.clr, clr.values)
+
+        # The discretized data should be reused for the next bootstrap
+        driver.run(x, y, bootstrap=self.bootstrap)
+        self.assertEqual(len(driver._discrete_cache), 1)
+
+    def test_python_engine(self):
+        self._check_engine("python", self.x, self.y)
+
+    def test_blas_engine(self):
+        self._check_engine("blas", self.x, self.y)
+
+    def test_sparse_engine(self):
+        self._check_engine("sparse", sps.csr_matrix(self.x), sps.csr_matrix(self.y))
+
+    def test_symmetric_weights(self):
+        weights = np.bincount(self.bootstrap, minlength=100)
+        y_discrete = mi._make_array_discrete(self.y, mi.DEFAULT_NUM_BINS)
+
+        mi_python = mi.build_mi_array_symmetric(y_discrete, mi.DEFAULT_NUM_BINS, weights=weights)
+        mi_blas = mi.build_mi_array_symmetric_blas(y_discrete, mi.DEFAULT_NUM_BINS, weights=weights, block_size=3)
+        mi_sparse = mi.build_mi_array_symmetric_sparse(mi._make_sparse_onehot(self.y, mi.DEFAULT_NUM_BINS),
+                                                       mi.DEFAULT_NUM_BINS, weights=weights, block_size=3)
+
+        np.testing.assert_array_almost_equal(self.mi_bg, mi_python)
+        np.testing.assert_array_almost_equal(self.mi_bg, mi_blas)
+        np.testing.assert_array_almost_equal(self.mi_bg, mi_sparse)
+
+
+class TestMIBootstrapView(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.x = rng.poisson(0.5, size=(100, 25)).astype(float)
+        self.y = rng.poisson(1., size=(100, 8)).astype(float)
+        self.x[:, 3] = 1.
+
+        self.bootstrap = rng.choice(100, size=100)
+
+    def _check_engine(self, engine, x, y):
+        x = InferelatorData(expression_data=x, gene_names=["X" + str(i) for i in range(25)])
+        y = InferelatorData(expression_data=y, gene_names=["Y" + str(i) for i in range(8)])
+
+        # Bins are set on the resampled data
+        clr, mi_arr = mi.MIDriver(engine=engine).run(x.get_bootstrap(self.bootstrap), y.get_bootstrap(self.bootstrap))
+
+        # The view should not be gathered into a resampled copy
+        x_view = NoGatherView(x, self.bootstrap)
+        clr_view, mi_view = mi.MIDriver(engine=engine).run(x_view, y.get_bootstrap(self.bootstrap))
+
+        np.testing.assert_array_almost_equal(mi_arr.values, mi_view.values)
+        np.testing.assert_array_almost_equal(clr.values, clr_view.values)
+        pdt.assert_index_equal(clr.index, clr_view.index)
+
+    def test_python_engine(self):
+        self._check_engine("python", self.x, self.y)
+
+    def test_blas_engine(self):
+        self._check_engine("blas", self.x, self.y)
+
+    def test_numba_engine(self):
+        self._check_engine("numba", self.x, self.y)
+
+    def test_sparse_engine(self):
+        self._check_engine("sparse", sps.csr_matrix(self.x), sps.csr_matrix(self.y))
+
+
+def _is_memmap(arr):
+    while arr is not None:
+        if isinstance(arr, np.memmap):
+            return True
+        arr = arr.base
+    return False
+
+
+class NoGatherView(InferelatorBootstrapView):
+
+    @property
+    def expression_data(self):
+        raise AssertionError("Bootstrap view was gathered")
+
+
+class TestMIBlockedOutput(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.x = InferelatorData(expression_data=rng.normal(size=(50, 40)),
+                                 gene_names=["X" + str(i) for i in range(40)])
+        self.y = InferelatorData(expression_data=rng.normal(size=(50, 6)),
+                                 gene_names=["Y" + str(i) for i in range(6)])
+        self.clr, self.mi = mi.MIDriver().run(self.x, self.y)
+
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_blocked_clr(self):
+        mi_bg = mi.build_mi_array_symmetric(mi._make_array_discrete(self.y.expression_data, mi.DEFAULT_NUM_BINS),
+                                            mi.DEFAULT_NUM_BINS)
+
+        clr = mi.calc_mixed_clr(self.mi.values, mi_bg)
+        clr_blocked = mi.calc_mixed_clr(self.mi.values, mi_bg, block_size=7)
+
+        np.testing.assert_array_almost_equal(self.clr.values, clr)
+        np.testing.assert_array_almost_equal(clr, clr_blocked)
+
+    def test_output_array(self):
+        out = np.zeros((40, 6))
+        mi_blas = mi.build_mi_array_blas(self.x.expression_data,
+                                         mi._make_array_discrete(self.y.expression_data, mi.DEFAULT_NUM_BINS),
+                                         mi.DEFAULT_NUM_BINS, block_size=3, out=out)
+
+        self.assertIs(mi_blas, out)
+        np.testing.assert_array_almost_equal(self.mi.values, out)
+
+        with self.assertRaises(ValueError):
+            mi.build_mi_array_blas(self.x.expression_data,
+                                   mi._make_array_discrete(self.y.expression_data, mi.DEFAULT_NUM_BINS),
+                                   mi.DEFAULT_NUM_BINS, out=np.zeros((6, 40)))
+
+    def test_memmap(self):
+        for engine in mi.MI_ENGINES:
+            clr, mi_arr = mi.MIDriver(engine=engine, block_size=9, memmap_dir=self.temp_dir).run(self.x, self.y)
+
+            np.testing.assert_array_almost_equal(self.mi.values, mi_arr.values)
+            np.testing.assert_array_almost_equal(self.clr.values, clr.values)
+
+
+class TestMICache(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.x = InferelatorData(expression_data=rng.normal(size=(50, 20)),
+                                 gene_names=["X" + str(i) for i in range(20)])
+        self.y = InferelatorData(expression_data=rng.normal(size=(50, 6)),
+                                 gene_names=["Y" + str(i) for i in range(6)])
+        self.clr, self.mi = mi.MIDriver().run(self.x, self.y)
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache = mi_cache.MICache(self.temp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_hit_and_miss(self):
+        driver = mi.MIDriver(cache=self.cache)
+
+        clr, mi_arr = driver.run(self.x, self.y)
+        self.assertEqual(self.cache.misses, 1)
+        self.assertEqual(self.cache.hits, 0)
+
+        clr_cached, mi_cached = driver.run(self.x, self.y)
+        self.assertEqual(self.cache.misses, 1)
+        self.assertEqual(self.cache.hits, 1)
+
+        pdt.assert_frame_equal(clr, clr_cached)
+        pdt.assert_frame_equal(mi_arr, mi_cached)
+        np.testing.assert_array_almost_equal(self.clr.values, clr_cached.values)
+
+        self.assertIsNone(driver.run(self.x, self.y, return_mi=False)[1])
+        self.assertEqual(self.cache.hits, 2)
+
+    def test_memmap_hit(self):
+        memmap_dir = tempfile.mkdtemp()
+
+        try:
+            driver = mi.MIDriver(cache=self.cache, memmap_dir=memmap_dir)
+            driver.run(self.x, self.y)
+            clr_cached, mi_cached = driver.run(self.x, self.y)
+        finally:
+            shutil.rmtree(memmap_dir)
+
+        self.assertEqual(self.cache.hits, 1)
+
+        # Cached arrays are copied into memory-mapped files the same way calculated arrays are
+        for arr in (clr_cached, mi_cached):
+            self.assertTrue(_is_memmap(arr.values))
+
+        np.testing.assert_array_almost_equal(self.clr.values, clr_cached.values)
+        np.testing.assert_array_almost_equal(self.mi.values, mi_cached.values)
+
+    def test_sparse_blocks(self):
+        x_sparse = InferelatorData(expression_data=sps.csr_matrix(np.maximum(self.x.expression_data, 0)),
+                                   gene_names=self.x.gene_names)
+        clr, mi_arr = mi.MIDriver().run(x_sparse, self.y)
+
+        # Discretize the sparse data a few columns at a time for the cache key
+        block_cells = mi.MI_NUMBA_BLOCK_CELLS
+        mi.MI_NUMBA_BLOCK_CELLS = 150
+
+        try:
+            clr_cached, mi_cached = mi.MIDriver(engine="blas", cache=self.cache).run(x_sparse, self.y)
+        finally:
+            mi.MI_NUMBA_BLOCK_CELLS = block_cells
+
+        np.testing.assert_array_almost_equal(clr.values, clr_cached.values)
+        np.testing.assert_array_almost_equal(mi_arr.values, mi_cached.values)
+
+    def test_key_changes(self):
+        driver = mi.MIDriver(cache=self.cache)
+        driver.run(self.x, self.y)
+        driver.run(self.x, self.y, bins=5)
+        driver.run(self.x, self.y, logtype=np.log2)
+        driver.run(self.x, self.y, bootstrap=list(range(25)) * 2)
+        self.assertEqual(self.cache.misses, 4)
+        self.assertEqual(self.cache.hits, 0)
+
+    def test_eviction(self):
+        self.cache.max_size = 0
+        driver = mi.MIDriver(cache=self.cache)
+        driver.run(self.x, self.y)
+        driver.run(self.x, self.y)
+
+        self.assertEqual(self.cache.hits, 0)
+        self.assertEqual(self.cache.misses, 2)
+        self.assertEqual(len(os.listdir(self.temp_dir)), 0)
+
+    def test_lru_eviction(self):
+        self.cache.put("a", self.clr.values, self.mi.values)
+        entry_size = os.path.getsize(os.path.join(self.temp_dir, "a" + mi_cache.MI_CACHE_SUFFIX))
+        os.utime(os.path.join(self.temp_dir, "a" + mi_cache.MI_CACHE_SUFFIX), (0, 0))
+
+        self.cache.put("b", self.clr.values, self.mi.values)
+        os.utime(os.path.join(self.temp_dir, "b" + mi_cache.MI_CACHE_SUFFIX), (1, 1))
+
+        # Reading a makes it the most recently used
+        self.assertIsNotNone(self.cache.get("a"))
+
+        self.cache.max_size = entry_size * 2
+        self.cache.put("c", self.clr.values, self.mi.values)
+
+        self.assertIsNotNone(self.cache.get("a"))
+        self.assertIsNone(self.cache.get("b"))
+        self.assertIsNotNone(self.cache.get("c"))
+
+
+class TestMINumba(TestMIEngines):
+
+    def test_numba_engine(self):
+        mi_numba = mi.build_mi_array_numba(self.x, self.y_discrete, mi.DEFAULT_NUM_BINS)
+        np.testing.assert_array_almost_equal(self.mi_python, mi_numba)
+
+    def test_numba_engine_blocks(self):
+        mi_numba = mi.build_mi_array_numba(sps.csc_matrix(self.x), self.y_discrete, mi.DEFAULT_NUM_BINS,
+                                           block_size=4, logtype=np.log2)
+        mi_python = mi.build_mi_array(self.x, self.y_discrete, mi.DEFAULT_NUM_BINS, logtype=np.log2)
+        np.testing.assert_array_almost_equal(mi_python, mi_numba)
+
+    def test_numba_weights(self):
+        weights = np.random.default_rng(10).poisson(1., size=100)
+        mi_python = mi.build_mi_array(self.x, self.y_discrete, mi.DEFAULT_NUM_BINS, weights=weights)
+        mi_numba = mi.build_mi_array_numba(self.x, self.y_discrete, mi.DEFAULT_NUM_BINS, weights=weights)
+        np.testing.assert_array_almost_equal(mi_python, mi_numba)
+
+    def test_numba_discretize(self):
+        mi.MI_numba.set_numba()
+
+        if not mi.MI_numba.available:
+            self.skipTest("numba is not installed")
+
+        np.testing.assert_array_equal(mi._make_array_discrete(self.x, mi.DEFAULT_NUM_BINS),
+                                      mi._make_array_discrete_numba(self.x, mi.DEFAULT_NUM_BINS))
+
+    def test_numba_many_bins(self):
+        mi.MI_numba.set_numba()
+
+        if not mi.MI_numba.available:
+            self.skipTest("numba is not installed")
+
+        np.testing.assert_array_equal(mi._make_array_discrete(self.x, 200),
+                                      mi._make_array_discrete_numba(self.x, 200))
+
+        y_discrete = mi._make_array_discrete(self.y, 200)
+        np.testing.assert_array_almost_equal(mi.build_mi_array(self.x, y_discrete, 200),
+                                             mi.build_mi_array_numba(self.x, y_discrete, 200))
+
+    def test_symmetric_background_numba(self):
+        mi_full = mi.build_mi_array(self.y, self.y_discrete, mi.DEFAULT_NUM_BINS)
+        np.fill_diagonal(mi_full, 0.)
+
+        mi_sym = mi.build_mi_array_symmetric_numba(self.y_discrete, mi.DEFAULT_NUM_BINS)
+        np.testing.assert_array_almost_equal(mi_full, mi_sym)
+        np.testing.assert_array_equal(mi_sym, mi_sym.T)
+
+    def test_numba_clr(self):
+        x = InferelatorData(expression_data=self.x)
+        y = InferelatorData(expression_data=self.y)
+
+        clr_python, mi_python = mi.MIDriver().run(x, y)
+        clr_numba, mi_numba = mi.MIDriver(engine="numba").run(x, y)
+
+        np.testing.assert_array_almost_equal(mi_python.values, mi_numba.values)
+        np.testing.assert_array_almost_equal(clr_python.values, clr_numba.values)
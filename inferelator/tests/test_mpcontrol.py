@@ -3,7 +3,11 @@ import tempfile
 import shutil
 import types
 import os
-from inferelator.distributed.inferelator_mp import MPControl
+import time
+import json
+import pandas as pd
+from inferelator.distributed.inferelator_mp import MPControl, SerialTask, cost_chunks, _in_serial_task
+from inferelator.distributed import fault_tolerant_controller, shared_memory_controller, telemetry
 
 # Run tests only when the associated packages are installed
 try:
@@ -37,6 +41,111 @@ def math_function(x, y, z):
     return x + y ** 2 - z
 
 
+def nested_map(x):
+    """
+    Call MPControl from inside a task and report whether it was run serially
+    """
+    return _in_serial_task(), MPControl.is_dask(), list(MPControl.imap(math_function, [x] * 3, range(3), [0] * 3))
+
+
+def fail_once(x, flag_dir, how):
+    """
+    Fail the first time this is called for each x (by raising, killing the worker, or hanging)
+    """
+    flag_file = os.path.join(flag_dir, str(x))
+
+    if not os.path.exists(flag_file):
+        open(flag_file, "w").close()
+
+        if how == "raise":
+            raise ValueError("Failed")
+        elif how == "exit":
+            os._exit(1)
+        elif how == "hang":
+            time.sleep(60)
+
+    return x * 2
+
+
+class ImapTests:
+
+    def test_imap(self):
+        test_result = MPControl.imap(math_function, *self.map_test_data)
+        self.assertListEqual(list(test_result), self.map_test_expect)
+
+    def test_imap_bounded(self):
+        test_result = MPControl.imap(math_function, range(20), range(20), [1] * 20, max_in_flight=3)
+        self.assertListEqual(list(test_result), [x + x ** 2 - 1 for x in range(20)])
+
+    def test_imap_bad_in_flight(self):
+        with self.assertRaises(ValueError):
+            MPControl.imap(math_function, *self.map_test_data, max_in_flight=0)
+
+    def test_as_completed(self):
+        test_result = MPControl.as_completed(math_function, range(20), range(20), [1] * 20, max_in_flight=5)
+        self.assertListEqual(sorted(test_result), [(x, x + x ** 2 - 1) for x in range(20)])
+
+    def test_as_completed_cost(self):
+        test_result = MPControl.as_completed(math_function, range(20), range(20), [1] * 20, cost=range(20),
+                                             max_in_flight=5)
+        self.assertListEqual(sorted(test_result), [(x, x + x ** 2 - 1) for x in range(20)])
+
+    def test_as_completed_bad_cost(self):
+        with self.assertRaises(ValueError):
+            MPControl.as_completed(math_function, *self.map_test_data, cost=[1, 2])
+
+    def test_serial_task(self):
+        test_result = MPControl.map(SerialTask(nested_map), range(5))
+        self.assertListEqual(test_result, [(True, False, [x + y ** 2 for y in range(3)]) for x in range(5)])
+        self.assertFalse(_in_serial_task())
+
+
+class TelemetryTests:
+
+    def setUp(self):
+        MPControl.enable_telemetry()
+
+    def tearDown(self):
+        MPControl.disable_telemetry()
+
+    def test_telemetry_map(self):
+        test_result = MPControl.map(math_function, *self.map_test_data, stage="math", labels=["a", "b", "c"])
+        self.assertListEqual(test_result, self.map_test_expect)
+
+        [summary] = MPControl.telemetry.summarize()
+        self.assertEqual(summary["name"], "math")
+        self.assertEqual(summary["n_tasks"], 3)
+        self.assertListEqual(sorted(t["label"] for t in summary["slowest"]), ["a", "b", "c"])
+        self.assertGreaterEqual(summary["latency_p99"], summary["latency_p50"])
+
+    def test_telemetry_cost_map(self):
+        test_result = MPControl.map(math_function, range(20), range(20), [1] * 20, cost=range(20))
+        self.assertListEqual(test_result, [x + x ** 2 - 1 for x in range(20)])
+        self.assertListEqual(sorted(MPControl.telemetry.to_dataframe()["index"]), list(range(20)))
+
+    def test_telemetry_imap(self):
+        test_result = MPControl.imap(math_function, *self.map_test_data)
+        self.assertListEqual(list(test_result), self.map_test_expect)
+        self.assertEqual(MPControl.telemetry.summarize()[0]["n_tasks"], 3)
+
+    def test_telemetry_report(self):
+        temp_dir = tempfile.mkdtemp()
+
+        try:
+            MPControl.map(math_function, *self.map_test_data)
+            MPControl.map(math_function, *self.map_test_data)
+            MPControl.telemetry.write_report(temp_dir)
+
+            tasks = pd.read_csv(os.path.join(temp_dir, telemetry.TASK_REPORT_FILE_NAME), sep="\t")
+            self.assertListEqual(tasks.columns.tolist(), telemetry.TASK_REPORT_COLUMNS)
+            self.assertEqual(tasks.shape[0], 6)
+
+            with open(os.path.join(temp_dir, telemetry.STAGE_REPORT_FILE_NAME)) as fh:
+                self.assertEqual(len(json.load(fh)), 2)
+        finally:
+            shutil.rmtree(temp_dir)
+
+
 class TestMPControl(unittest.TestCase):
     name = "local"
     map_test_data = [[1] * 3, list(range(3)), [0, 2, 4]]
@@ -71,6 +180,10 @@ class TestNoController(TestMPControl):
         with self.assertRaises(RuntimeError):
             MPControl.map(math_function, *self.map_test_data)
 
+    def test_imap(self):
+        with self.assertRaises(RuntimeError):
+            MPControl.imap(math_function, *self.map_test_data)
+
     def test_name(self):
         with self.assertRaises(NameError):
             MPControl.name()
@@ -84,7 +197,7 @@ class TestNoController(TestMPControl):
             MPControl.set_multiprocess_engine(unittest.TestCase)
 
 
-class TestLocalController(TestMPControl):
+class TestLocalController(ImapTests, TestMPControl):
     name = "local"
 
     def test_local_connect(self):
@@ -101,8 +214,45 @@ class TestLocalController(TestMPControl):
     def test_local_name(self):
         self.assertEqual(MPControl.name(), self.name)
 
+    def test_local_map_cost(self):
+        test_result = MPControl.map(math_function, *self.map_test_data, cost=[1, 10, 100])
+        self.assertListEqual(test_result, self.map_test_expect)
+
+
+class TestCostChunks(unittest.TestCase):
+
+    def test_chunks_lpt(self):
+        chunks = cost_chunks([1, 1, 8, 1, 4, 1], 4)
+        self.assertListEqual(chunks, [[2], [4], [0, 1, 3, 5]])
+
+    def test_chunks_cover(self):
+        cost = list(range(50))
+        chunks = cost_chunks(cost, 7)
+        self.assertListEqual(sorted(i for c in chunks for i in c), list(range(50)))
+        self.assertListEqual(chunks[0], [49, 48, 47, 46])
+
+    def test_chunks_uniform_fallback(self):
+        self.assertListEqual(cost_chunks([0, 0, 0, 0], 2), [[0, 1], [2, 3]])
+        self.assertListEqual(cost_chunks([1, float("nan")], 2), [[0], [1]])
+
+class TestLocalTelemetry(TelemetryTests, TestMPControl):
+    name = "local"
+
+
+class TestThreadTelemetry(TelemetryTests, TestMPControl):
+    name = "threads"
+
+
+class TestSharedMemoryTelemetry(TelemetryTests, TestMPControl):
+    name = "shared-memory"
+
+
+class TestFaultTolerantTelemetry(TelemetryTests, TestMPControl):
+    name = "fault-tolerant"
+
+
 @unittest.skipIf(not TEST_PATHOS, "Pathos not installed")
-class TestMultiprocessingMPController(TestMPControl):
+class TestMultiprocessingMPController(ImapTests, TestMPControl):
     name = "multiprocessing"
 
     @classmethod
@@ -126,6 +276,136 @@ class TestMultiprocessingMPController(TestMPControl):
         self.assertListEqual(test_result, self.map_test_expect)
 
 
+class TestSharedMemoryMPController(ImapTests, TestMPControl):
+    name = "shared-memory"
+
+    def test_shm_connect(self):
+        self.assertTrue(MPControl.is_initialized)
+
+    def test_shm_name(self):
+        self.assertEqual(MPControl.name(), self.name)
+
+    def test_shm_map(self):
+        test_result = MPControl.map(math_function, *self.map_test_data)
+        self.assertListEqual(test_result, self.map_test_expect)
+
+    def test_shm_map_closure(self):
+        big_array = list(range(1000))
+        test_result = MPControl.map(lambda i: big_array[i] * 2, range(0, 1000, 100))
+        self.assertListEqual(test_result, list(range(0, 2000, 200)))
+
+    def test_shm_map_cost(self):
+        test_result = MPControl.map(math_function, range(20), range(20), [1] * 20, cost=range(20))
+        self.assertListEqual(test_result, [x + x ** 2 - 1 for x in range(20)])
+
+    def test_shm_map_empty(self):
+        self.assertListEqual(MPControl.map(math_function, [], [], []), [])
+
+    def test_shm_map_error(self):
+        with self.assertRaises(ZeroDivisionError):
+            MPControl.map(lambda x: 1 / x, [1, 0])
+
+
+    def test_shm_imap_unfinished(self):
+        # A generator which is not finished must not make later calls run serially in the parent process
+        unfinished = MPControl.imap(math_function, *self.map_test_data)
+        self.assertEqual(next(unfinished), self.map_test_expect[0])
+        self.assertIsNone(shared_memory_controller._MAP_FUNC)
+
+        pids = MPControl.map(lambda x: os.getpid(), range(4))
+        self.assertNotIn(os.getpid(), pids)
+
+        unfinished.close()
+
+
+class TestThreadMPController(ImapTests, TestMPControl):
+    name = "threads"
+
+    def test_threads_connect(self):
+        self.assertTrue(MPControl.is_initialized)
+
+    def test_threads_name(self):
+        self.assertEqual(MPControl.name(), self.name)
+
+    def test_threads_map(self):
+        test_result = MPControl.map(math_function, *self.map_test_data)
+        self.assertListEqual(test_result, self.map_test_expect)
+
+    def test_threads_map_cost(self):
+        test_result = MPControl.map(math_function, range(20), range(20), [1] * 20, cost=range(20))
+        self.assertListEqual(test_result, [x + x ** 2 - 1 for x in range(20)])
+
+    def test_threads_nested_map(self):
+        test_result = MPControl.map(lambda x: sum(MPControl.map(lambda y: x * y, range(3))), range(10))
+        self.assertListEqual(test_result, [3 * x for x in range(10)])
+
+
+class TestFaultTolerantMPController(ImapTests, TestMPControl):
+    name = "fault-tolerant"
+
+    def setUp(self):
+        self.flag_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.flag_dir)
+        MPControl.client.max_retries = 2
+        MPControl.client.task_timeout = None
+
+    def test_ft_name(self):
+        self.assertEqual(MPControl.name(), self.name)
+
+    def test_ft_map(self):
+        test_result = MPControl.map(math_function, *self.map_test_data)
+        self.assertListEqual(test_result, self.map_test_expect)
+
+    def test_ft_map_cost(self):
+        test_result = MPControl.map(math_function, range(20), range(20), [1] * 20, cost=range(20))
+        self.assertListEqual(test_result, [x + x ** 2 - 1 for x in range(20)])
+
+    def _fail_once(self, how):
+        return MPControl.map(fail_once, range(6), [self.flag_dir] * 6, [how] * 6)
+
+    def test_ft_retry_error(self):
+        self.assertListEqual(self._fail_once("raise"), [x * 2 for x in range(6)])
+
+    def test_ft_retry_dead_worker(self):
+        self.assertListEqual(self._fail_once("exit"), [x * 2 for x in range(6)])
+
+    def test_ft_retry_timeout(self):
+        MPControl.client.set_task_parameters(task_timeout=0.5)
+        self.assertListEqual(self._fail_once("hang"), [x * 2 for x in range(6)])
+
+    def test_ft_too_many_failures(self):
+        MPControl.client.set_task_parameters(max_retries=0)
+
+        with self.assertRaises(fault_tolerant_controller.TaskFailedError) as err:
+            MPControl.map(fail_once, [0, 1], [self.flag_dir] * 2, ["raise", "none"])
+
+        self.assertIsNone(err.exception.results[0])
+
+    def test_ft_bad_task_parameters(self):
+        with self.assertRaises(ValueError):
+            MPControl.client.set_task_parameters(max_retries=-1)
+
+        with self.assertRaises(ValueError):
+            MPControl.client.set_task_parameters(task_timeout=-1)
+
+        self.assertEqual(MPControl.client.max_retries, 2)
+        self.assertIsNone(MPControl.client.task_timeout)
+
+    def test_ft_imap_retry(self):
+        test_result = MPControl.imap(fail_once, range(6), [self.flag_dir] * 6, ["raise"] * 6)
+        self.assertListEqual(list(test_result), [x * 2 for x in range(6)])
+
+    def test_ft_imap_retry_bounded(self):
+        # Tasks which are being retried must still run when the buffered results fill max_in_flight
+        test_result = MPControl.imap(fail_once, range(6), [self.flag_dir] * 6, ["raise"] * 6, max_in_flight=1)
+        self.assertListEqual(list(test_result), [x * 2 for x in range(6)])
+
+        test_result = MPControl.imap(math_function, range(20), range(20), [1] * 20, max_in_flight=2)
+        self.assertListEqual(list(test_result), [x + x ** 2 - 1 for x in range(20)])
+
+
 @unittest.skipIf(not TEST_DASK_LOCAL, "Dask not installed")
 class TestDaskLocalMPController(TestMPControl):
     name = "dask-local"
@@ -1,7 +1,10 @@
 import warnings
 import unittest
 import tempfile
+import os
+import json
 import pandas as pd
+import pandas.testing as pdt
 import shutil
 import numpy as np
 from sklearn.linear_model import LinearRegression
@@ -19,6 +22,8 @@ from inferelator.preprocessing.metadata_parser import MetadataHandler
 from dask import distributed
 from inferelator.distributed import dask_local_controller
 from inferelator.distributed import dask_functions
+from inferelator.regression import mi as mi_module
+from inferelator.regression import mi_cache
 
 """
 These are full-stack integration tests covering the post-loading regression workflows
@@ -101,6 +106,186 @@ class TestSingleTaskRegressionFactory(SetUpDenseData):
         self.workflow.run()
         self.assertEqual(self.workflow.results.score, 1)
 
+    def test_bbsr_weighted_bootstraps(self):
+        self.workflow = create_puppet_workflow(base_class="tfa", regression_class="bbsr")
+        self.workflow = self.workflow(self.data, self.prior, self.gold_standard)
+        self.workflow.set_regression_parameters(mi_weighted_bootstraps=True)
+        self.workflow.tf_names = self.tf_names
+        self.workflow.run()
+        self.assertEqual(self.workflow.results.score, 1)
+
+    def test_bbsr_numba(self):
+        self.workflow = create_puppet_workflow(base_class="tfa", regression_class="bbsr")
+        self.workflow = self.workflow(self.data, self.prior, self.gold_standard)
+        self.workflow.set_run_parameters(use_numba=True)
+        self.workflow.tf_names = self.tf_names
+        self.assertEqual(self.workflow._get_mi_engine(), "numba")
+        self.workflow.run()
+        self.assertEqual(self.workflow.results.score, 1)
+
+    def test_bbsr_batched(self):
+        self.workflow = create_puppet_workflow(base_class="tfa", regression_class="bbsr")
+        self.workflow = self.workflow(self.data, self.prior, self.gold_standard)
+        self.workflow.set_regression_parameters(bsr_batch_size=3)
+        self.workflow.tf_names = self.tf_names
+        self.workflow.run()
+        self.assertEqual(self.workflow.results.score, 1)
+
+    def test_bbsr_mi_cache(self):
+        temp_dir = tempfile.mkdtemp()
+
+        try:
+            for _ in range(2):
+                self.workflow = create_puppet_workflow(base_class="tfa", regression_class="bbsr")
+                self.workflow = self.workflow(self.data, self.prior, self.gold_standard)
+                self.workflow.set_regression_parameters(mi_cache_dir=temp_dir)
+                self.workflow.tf_names = self.tf_names
+                self.workflow.run()
+                self.assertEqual(self.workflow.results.score, 1)
+
+            self.assertEqual(self.workflow._mi_cache.misses, 0)
+            self.assertGreater(self.workflow._mi_cache.hits, 0)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_bbsr_telemetry(self):
+        temp_dir = tempfile.mkdtemp()
+
+        try:
+            # Record a stage before the workflow starts, which should not be in the report
+            MPControl.enable_telemetry()
+            MPControl.map(abs, [-1], stage="stale")
+
+            self.workflow = create_puppet_workflow(base_class="tfa", regression_class="bbsr")
+            self.workflow = self.workflow(self.data, self.prior, self.gold_standard)
+            self.workflow.set_run_parameters(task_telemetry=True)
+            self.workflow.output_dir = temp_dir
+            self.workflow.tf_names = self.tf_names
+            self.workflow.run()
+            self.assertEqual(self.workflow.results.score, 1)
+
+            # Telemetry is only recorded while the workflow is running
+            self.assertIsNone(MPControl.telemetry)
+
+            tasks = pd.read_csv(os.path.join(temp_dir, "task_telemetry.tsv"), sep="\t")
+            # Genes are regressed in blocks, which are labeled with the first gene in the block
+            genes = self.workflow.response.gene_names
+            self.assertIn(genes[0], tasks["label"].values)
+            self.assertTrue(tasks["label"].isin(genes).any())
+            self.assertTrue((tasks["seconds"] >= 0).all())
+
+            with open(os.path.join(temp_dir, "stage_telemetry.json")) as fh:
+                stages = json.load(fh)
+
+            self.assertFalse(any(s["name"] == "stale" for s in stages))
+            self.assertEqual(sum(s["n_tasks"] for s in stages), tasks.shape[0])
+            self.assertTrue(all(s["latency_p50"] <= s["latency_p99"] for s in stages))
+        finally:
+            MPControl.disable_telemetry()
+            shutil.rmtree(temp_dir)
+
+    def test_bbsr_checkpoint(self):
+        temp_dir = tempfile.mkdtemp()
+
+        try:
+            self.workflow = create_puppet_workflow(base_class="tfa", regression_class="bbsr")
+            self.workflow = self.workflow(self.data, self.prior, self.gold_standard)
+            self.workflow.set_run_parameters(checkpoint_dir=temp_dir)
+            self.workflow.tf_names = self.tf_names
+            self.workflow.run()
+            self.assertEqual(len(os.listdir(temp_dir)), self.workflow.num_bootstraps)
+            betas = self.workflow.results.betas
+
+            # Restart the workflow and make sure the bootstraps are loaded instead of run
+            self.workflow = create_puppet_workflow(base_class="tfa", regression_class="bbsr")
+            self.workflow = self.workflow(self.data, self.prior, self.gold_standard)
+            self.workflow.set_run_parameters(checkpoint_dir=temp_dir)
+            self.workflow.tf_names = self.tf_names
+            self.workflow.run_bootstrap = lambda x: self.fail("Bootstrap was not loaded from checkpoint")
+            self.workflow.run()
+            self.assertEqual(self.workflow.results.score, 1)
+
+            for b1, b2 in zip(betas, self.workflow.results.betas):
+                pdt.assert_frame_equal(b1, b2)
+
+            # Change the priors and make sure the checkpoint isn't reused
+            prior = self.prior.copy()
+            prior.iloc[0, :] = 0
+
+            self.workflow = create_puppet_workflow(base_class="tfa", regression_class="bbsr")
+            self.workflow = self.workflow(self.data, prior, self.gold_standard)
+            self.workflow.set_run_parameters(checkpoint_dir=temp_dir)
+            self.workflow.tf_names = self.tf_names
+            self._count_bootstraps(self.workflow)
+            self.workflow.run()
+            self.assertEqual(self.workflow.bootstraps_run, self.workflow.num_bootstraps)
+
+            # Change a regression setting and make sure the checkpoint isn't reused
+            self.workflow = create_puppet_workflow(base_class="tfa", regression_class="bbsr")
+            self.workflow = self.workflow(self.data, self.prior, self.gold_standard)
+            self.workflow.set_run_parameters(checkpoint_dir=temp_dir)
+            self.workflow.set_regression_parameters(prior_weight=2)
+            self.workflow.tf_names = self.tf_names
+            self._count_bootstraps(self.workflow)
+            self.workflow.run()
+            self.assertEqual(self.workflow.results.score, 1)
+            self.assertEqual(self.workflow.bootstraps_run, self.workflow.num_bootstraps)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    @staticmethod
+    def _count_bootstraps(wkf):
+        wkf.bootstraps_run = 0
+        run_bootstrap = wkf.run_bootstrap
+
+        def _counted(bootstrap):
+            wkf.bootstraps_run += 1
+            return run_bootstrap(bootstrap)
+
+        wkf.run_bootstrap = _counted
+
+    def test_bbsr_concurrent(self):
+        self.workflow = create_puppet_workflow(base_class="tfa", regression_class="bbsr")
+        self.workflow = self.workflow(self.data, self.prior, self.gold_standard)
+        self.workflow.set_run_parameters(num_bootstraps=3)
+        self.workflow.tf_names = self.tf_names
+        self.workflow.run()
+        betas = self.workflow.results.betas
+
+        for batch_size, window in ((None, None), (2, 1), (2, 3)):
+            self.workflow = create_puppet_workflow(base_class="tfa", regression_class="bbsr")
+            self.workflow = self.workflow(self.data, self.prior, self.gold_standard)
+            self.workflow.set_run_parameters(concurrent_bootstraps=True, concurrent_bootstrap_window=window,
+                                             num_bootstraps=3)
+            self.workflow.set_regression_parameters(bsr_batch_size=batch_size)
+            self.workflow.tf_names = self.tf_names
+            self.workflow.run()
+            self.assertEqual(self.workflow.results.score, 1)
+            self.assertEqual(len(self.workflow.results.betas), 3)
+
+            for b1, b2 in zip(betas, self.workflow.results.betas):
+                pdt.assert_frame_equal(b1, b2)
+
+    def test_sklearn_concurrent(self):
+        def _run(concurrent):
+            wkf = create_puppet_workflow(base_class="tfa", regression_class="elasticnet")
+            wkf = wkf(self.data, self.prior, self.gold_standard)
+            wkf.set_run_parameters(concurrent_bootstraps=concurrent, num_bootstraps=3)
+            wkf.tf_names = self.tf_names
+
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                wkf.run()
+
+            return wkf.results.betas
+
+        # Each bootstrap has its own random state, so results are reproducible
+        betas = _run(True)
+        self.assertEqual(len(betas), 3)
+
+        for b1, b2 in zip(betas, _run(True)):
+            pdt.assert_frame_equal(b1, b2)
+
     def test_elasticnet(self):
         self.workflow = create_puppet_workflow(base_class="tfa", regression_class="elasticnet")
         self.workflow = self.workflow(self.data, self.prior, self.gold_standard)
@@ -140,6 +325,59 @@ class TestSingleTaskRegressionFactory(SetUpDenseData):
         self.workflow.run()
         self.assertAlmostEqual(self.workflow.results.score, 0.32222, places=4)
 
+    def test_stars_concurrent(self):
+        self.workflow = create_puppet_workflow(base_class="tfa", regression_class="stars")
+        self.workflow = self.workflow(self.data, self.prior, self.gold_standard)
+        self.workflow.set_run_parameters(concurrent_bootstraps=True)
+        self.workflow.tf_names = self.tf_names
+
+        with self.assertRaises(ValueError):
+            self.workflow.run()
+
+    def test_stars_checkpoint(self):
+        temp_dir = tempfile.mkdtemp()
+
+        def _stars_workflow(**kwargs):
+            wkf = create_puppet_workflow(base_class="tfa", regression_class="stars")
+            wkf = wkf(self.data, self.prior, self.gold_standard)
+            wkf.set_run_parameters(checkpoint_dir=temp_dir)
+            kwargs["num_subsamples"] = kwargs.get("num_subsamples", 5)
+            wkf.set_regression_parameters(**kwargs)
+            wkf.tf_names = self.tf_names
+            return wkf
+
+        try:
+            self.workflow = _stars_workflow()
+            self.workflow.run()
+            self.assertEqual(len(os.listdir(temp_dir)), 1)
+            betas = self.workflow.results.betas
+
+            # Restart the workflow and make sure the regression is loaded instead of run
+            self.workflow = _stars_workflow()
+            self.workflow._run_stars = lambda: self.fail("StARS was not loaded from checkpoint")
+            self.workflow.run()
+            pdt.assert_frame_equal(betas[0], self.workflow.results.betas[0])
+
+            # Change a regression setting and make sure the checkpoint isn't reused
+            for kwargs in (dict(num_subsamples=4), dict(alphas=[0., 0.1, 1.]), dict(max_iter=100)):
+                self.workflow = _stars_workflow(**kwargs)
+                self._count_stars(self.workflow)
+                self.workflow.run()
+                self.assertEqual(self.workflow.stars_run, 1)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    @staticmethod
+    def _count_stars(wkf):
+        wkf.stars_run = 0
+        run_stars = wkf._run_stars
+
+        def _counted():
+            wkf.stars_run += 1
+            return run_stars()
+
+        wkf._run_stars = _counted
+
 
 class TestSingleTaskRegressionFactorySparse(SetUpSparseData, TestSingleTaskRegressionFactory):
 
@@ -187,6 +425,14 @@ class TestMultitaskFactory(SetUpDenseDataMTL):
         self.workflow.run()
         self.assertEqual(self.workflow.results.score, 1)
 
+    def test_mtl_bbsr_weighted_bootstraps(self):
+        self.workflow = workflow.inferelator_workflow(workflow="multitask", regression="bbsr")
+        self.workflow.set_regression_parameters(prior_weight=1., mi_weighted_bootstraps=True)
+        self.reset_workflow()
+
+        self.workflow.run()
+        self.assertEqual(self.workflow.results.score, 1)
+
     def test_mtl_elasticnet(self):
         self.workflow = workflow.inferelator_workflow(workflow="multitask", regression="elasticnet")
         self.workflow.set_regression_parameters(copy_X=True)
@@ -206,6 +452,14 @@ class TestMultitaskFactory(SetUpDenseDataMTL):
         self.workflow.run()
         self.assertAlmostEqual(self.workflow.results.score, 0.32222, places=4)
 
+    def test_mtl_checkpoint_warning(self):
+        self.workflow = workflow.inferelator_workflow(workflow="multitask", regression="bbsr")
+        self.reset_workflow()
+        self.workflow.set_run_parameters(checkpoint_dir=tempfile.gettempdir())
+
+        with self.assertWarns(UserWarning):
+            self.workflow.run()
+
 
 class TestMultitaskFactorySparse(SetUpSparseDataMTL, TestMultitaskFactory):
     pass
@@ -242,14 +496,184 @@ class TestSTLDask(SwitchToDask, TestSingleTaskRegressionFactory):
         expected = np.array([[0.63651417, 0.63651417], [0.63651417, 1.09861229]])
         np.testing.assert_almost_equal(mi, expected)
 
+    def test_dask_function_mi_blocks(self):
+        x = np.random.default_rng(12).normal(size=(50, 11))
+        y = mi_module._make_array_discrete(np.random.default_rng(13).normal(size=(50, 6)), 10)
+
+        mi_python = mi_module.build_mi_array(x, y, 10, logtype=np.log)
+
+        for block_size in (None, 1, 3, 20):
+            mi = dask_functions.build_mi_array_dask(x, y, 10, np.log, block_size=block_size)
+            np.testing.assert_almost_equal(mi, mi_python)
+
+    def test_dask_mi_cache(self):
+        rng = np.random.default_rng(15)
+        x = InferelatorData(pd.DataFrame(rng.normal(size=(30, 11))))
+        y = InferelatorData(pd.DataFrame(rng.normal(size=(30, 4))))
+
+        dask_calls, build_mi_array_dask = [], dask_functions.build_mi_array_dask
+
+        def _count_dask_mi(*args, **kwargs):
+            dask_calls.append(1)
+            return build_mi_array_dask(*args, **kwargs)
+
+        dask_functions.build_mi_array_dask = _count_dask_mi
+        cache_dir = tempfile.mkdtemp()
 
-class TestSTLDask(SwitchToDask, TestSingleTaskRegressionFactorySparse):
+        try:
+            clr, mi = mi_module.MIDriver().run(x, y)
+            n_calls = len(dask_calls)
+
+            # Checking the cache should not change the MI path from dask to a local engine
+            clr_cached, mi_cached = mi_module.MIDriver(cache=mi_cache.MICache(cache_dir)).run(x, y)
+            self.assertEqual(len(dask_calls), n_calls * 2)
+        finally:
+            dask_functions.build_mi_array_dask = build_mi_array_dask
+            shutil.rmtree(cache_dir)
+
+        self.assertGreater(n_calls, 0)
+        np.testing.assert_array_almost_equal(clr.values, clr_cached.values)
+        np.testing.assert_array_almost_equal(mi.values, mi_cached.values)
+
+    def test_dask_imap(self):
+        self.assertListEqual(list(MPControl.imap(lambda x, y: x * y, range(10), range(10), max_in_flight=3)),
+                             [x * x for x in range(10)])
+        self.assertListEqual(sorted(MPControl.as_completed(lambda x: x + 1, range(10))),
+                             [(x, x + 1) for x in range(10)])
+
+    def test_dask_function_bbsr_blocks(self):
+        rng = np.random.default_rng(14)
+        x = InferelatorData(pd.DataFrame(rng.normal(size=(30, 4))))
+        y = InferelatorData(pd.DataFrame(rng.normal(size=(30, 7))))
+        pp = pd.DataFrame(rng.random((7, 4)) > 0.3)
+        weights = pd.DataFrame(np.ones((7, 4)))
+
+        expected = dask_functions.bbsr_regress_dask(x, y, pp, weights, 7, y.gene_names, 10, block_size=1)
+        self.assertListEqual([r['ind'] for r in expected], list(range(7)))
+
+        for block_size in (None, 3, 20):
+            results = dask_functions.bbsr_regress_dask(x, y, pp, weights, 7, y.gene_names, 10, block_size=block_size)
+            self.assertListEqual([r['ind'] for r in results], list(range(7)))
+
+            for r, e in zip(results, expected):
+                np.testing.assert_array_equal(r['pp'], e['pp'])
+                np.testing.assert_array_almost_equal(r['betas'], e['betas'])
+                np.testing.assert_array_almost_equal(r['betas_resc'], e['betas_resc'])
+
+
+class TestSTLSparseDask(SwitchToDask, TestSingleTaskRegressionFactorySparse):
     pass
 
 
 class TestMTLDask(SwitchToDask, TestMultitaskFactory):
-    pass
+
+    def test_dask_worker_memory_hygiene(self):
+        self.assertListEqual(dask_functions.worker_memory_hygiene(), [])
+        self.assertListEqual(dask_functions.worker_memory_hygiene(restart_memory_fraction=1e6), [])
+
+    def test_dask_worker_memory_restart(self):
+        controller, client = MPControl.client, MPControl.client.client
+        controller.client = StubRestartClient({"w1": (90, 100), "w2": (40, 100), "w3": (95, None), "w4": (51, 100)})
+
+        try:
+            restarted = dask_functions.worker_memory_hygiene(restart_memory_fraction=0.5)
+        finally:
+            stub, controller.client = controller.client, client
+
+        self.assertListEqual(sorted(restarted), ["w1", "w4"])
+        self.assertListEqual(sorted(stub.restarted), ["w1", "w4"])
+
+    def test_dask_restart_memory_fraction_setting(self):
+        self.assertIsNone(MPControl.client.restart_memory_fraction)
+
+        MPControl.set_restart_memory_fraction(0.8)
+        try:
+            self.assertEqual(MPControl.client.restart_memory_fraction, 0.8)
+        finally:
+            MPControl.set_restart_memory_fraction(None)
+
+        self.assertIsNone(MPControl.client.restart_memory_fraction)
+
+        with self.assertRaises(ValueError):
+            MPControl.set_restart_memory_fraction(0)
+
+
+class StubRestartClient(object):
+    """
+    Stand-in for a dask client which reports fixed worker memory (RSS, limit) and records restarted workers
+    """
+
+    def __init__(self, worker_memory):
+        self.worker_memory = worker_memory
+        self.restarted = []
+
+    def run(self, func):
+        return self.worker_memory
+
+    def restart_workers(self, workers):
+        self.restarted.extend(workers)
 
 
 class TestMTLSparseDask(SwitchToDask, TestMultitaskFactorySparse):
     pass
+
+
+class SwitchToSharedMemory(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        MPControl.shutdown()
+        MPControl.set_multiprocess_engine("shared-memory", processes=2)
+        MPControl.connect()
+
+    @classmethod
+    def tearDownClass(cls):
+        MPControl.shutdown()
+        MPControl.set_multiprocess_engine("local")
+        MPControl.connect()
+
+
+class TestSTLSharedMemory(SwitchToSharedMemory, TestSingleTaskRegressionFactory):
+    pass
+
+
+class SwitchToThreads(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        MPControl.shutdown()
+        MPControl.set_multiprocess_engine("threads", processes=2)
+        MPControl.connect()
+
+    @classmethod
+    def tearDownClass(cls):
+        MPControl.shutdown()
+        MPControl.set_multiprocess_engine("local")
+        MPControl.connect()
+
+
+class TestSTLThreads(SwitchToThreads, TestSingleTaskRegressionFactory):
+    pass
+
+
+class TestMTLThreads(SwitchToThreads, TestMultitaskFactory):
+    pass
+
+
+class SwitchToFaultTolerant(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        MPControl.shutdown()
+        MPControl.set_multiprocess_engine("fault-tolerant", processes=2)
+        MPControl.connect()
+
+    @classmethod
+    def tearDownClass(cls):
+        MPControl.shutdown()
+        MPControl.set_multiprocess_engine("local")
+        MPControl.connect()
+
+
+class TestSTLFaultTolerant(SwitchToFaultTolerant, TestSingleTaskRegressionFactory):
+    pass
@@ -5,9 +5,10 @@ from inferelator import utils
 from inferelator.postprocessing import GOLD_STANDARD_COLUMN, CONFIDENCE_COLUMN, TARGET_COLUMN, REGULATOR_COLUMN
 from inferelator.postprocessing import results_processor
 from inferelator.postprocessing import results_processor_mtl
-from inferelator.postprocessing import MetricHandler, RankSummingMetric
+from inferelator.postprocessing import MetricHandler, RankSummingMetric, BetaStack
 import pandas as pd
 import pandas.testing as pdt
+import numpy.testing as npt
 import numpy as np
 import os
 import tempfile
@@ -117,6 +118,50 @@ class TestResultsProcessor(TestResults):
         np.testing.assert_equal(median, np.array([[1.5, 1.5], [1.5, 1.5]]))
 
 
+class TestBetaStack(TestResults):
+
+    def setUp(self):
+        super(TestBetaStack, self).setUp()
+        rng = np.random.default_rng(42)
+        genes, tfs = ['gene' + str(i) for i in range(8)], ['tf' + str(i) for i in range(6)]
+
+        def _sparse_beta():
+            b = rng.normal(size=(8, 6))
+            b[rng.random(size=(8, 6)) < 0.6] = 0
+            b[0, :3] = 0.5
+            return pd.DataFrame(b, index=genes, columns=tfs)
+
+        self.betas = [_sparse_beta() for _ in range(4)]
+        self.stack = BetaStack.from_dataframes(self.betas)
+
+    def test_stack_shape(self):
+        self.assertEqual(len(self.stack), 4)
+        self.assertEqual(self.stack.shape, (8, 6))
+        pdt.assert_frame_equal(self.stack[2], self.betas[2])
+
+    def test_stack_summarize(self):
+        sign, nonzero = results_processor.ResultsProcessor.summarize(self.betas)
+        stack_sign, stack_nonzero = results_processor.ResultsProcessor.summarize(self.stack)
+        pdt.assert_frame_equal(sign, stack_sign)
+        pdt.assert_frame_equal(nonzero, stack_nonzero)
+
+    def test_stack_mean_and_median(self):
+        mean, median = results_processor.ResultsProcessor.mean_and_median(self.betas)
+        stack_mean, stack_median = results_processor.ResultsProcessor.mean_and_median(self.stack)
+        npt.assert_array_almost_equal(mean, stack_mean)
+        npt.assert_array_almost_equal(median, stack_median)
+
+    def test_stack_median_odd(self):
+        self.stack.append(self.betas[0].iloc[::-1, :])
+        _, median = results_processor.ResultsProcessor.mean_and_median(self.betas + [self.betas[0]])
+        _, stack_median = results_processor.ResultsProcessor.mean_and_median(self.stack)
+        npt.assert_array_almost_equal(median, stack_median)
+
+    def test_stack_rank_sum(self):
+        pdt.assert_frame_equal(RankSummingMetric.compute_combined_confidences(self.betas),
+                               RankSummingMetric.compute_combined_confidences(self.stack))
+
+
 class TestNetworkCreator(TestResults):
 
     def setUp(self):
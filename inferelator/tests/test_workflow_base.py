@@ -438,6 +438,37 @@ class TestWorkflowFunctions(unittest.TestCase):
         os.rmdir(self.workflow.output_dir)
         os.rmdir(temp_dir)
 
+    def test_run_telemetry(self):
+        # Any workflow which uses the base run writes the task telemetry report
+        class StubWorkflow(workflow.WorkflowBase):
+
+            def startup_run(self):
+                pass
+
+            def startup_finish(self):
+                pass
+
+            def run_regression(self):
+                return MPControl.map(abs, [-1, -2], stage="stub"), None
+
+            def emit_results(self, betas, rescaled_betas, gold_standard, priors):
+                return betas
+
+        temp_dir = tempfile.mkdtemp()
+
+        try:
+            stub = StubWorkflow()
+            stub.set_run_parameters(task_telemetry=True)
+            stub.output_dir = temp_dir
+
+            self.assertListEqual(stub.run(), [1, 2])
+            self.assertIsNone(MPControl.telemetry)
+            self.assertTrue(os.path.exists(os.path.join(temp_dir, "task_telemetry.tsv")))
+            self.assertTrue(os.path.exists(os.path.join(temp_dir, "stage_telemetry.json")))
+        finally:
+            MPControl.disable_telemetry()
+            shutil.rmtree(temp_dir)
+
     def test_shuffle_prior_labels(self):
         self.workflow.shuffle_prior_axis = 0
         np.testing.assert_array_almost_equal_nulp(self.workflow.priors_data.values, self.workflow.gold_standard.values)
@@ -4,7 +4,6 @@ This workflow also has a design driver which will incorporate timecourse data.
 This is the standard workflow for most applications.
 """
 
-import numpy as np
 from inferelator import workflow
 from inferelator.preprocessing import design_response_translation
 from inferelator.preprocessing.tfa import TFA, NoTFA
@@ -107,23 +106,6 @@ class TFAWorkFlow(workflow.WorkflowBase):
         self._set_file_name("_tfa_input_file", tfa_input_file)
         self._set_without_warning("_tfa_input_file_type", tfa_input_file_type)
 
-    def run(self):
-        """
-        Execute workflow, after all configuration.
-        """
-
-        # Set the random seed (for bootstrap selection)
-        np.random.seed(self.random_seed)
-
-        # Call the startup workflow
-        self.startup()
-
-        # Run regression after startup
-        betas, rescaled_betas = self.run_regression()
-
-        # Write the results out to a file
-        return self.emit_results(betas, rescaled_betas, self.gold_standard, self.priors_data)
-
     def startup_run(self):
         self.get_data()
         self.process_priors_and_gold_standard()
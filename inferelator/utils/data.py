@@ -616,6 +616,16 @@ class InferelatorData(object):
         return InferelatorData(expression_data=self._adata.X[sample_bootstrap_index, :].copy(),
                                gene_names=self.gene_names)
 
+    def get_bootstrap_view(self, sample_bootstrap_index):
+        """
+        Get a resampled view of this data which does not copy the expression data
+
+        :param sample_bootstrap_index: Resampled sample indices
+        :type sample_bootstrap_index: list(int), np.ndarray
+        :return: InferelatorBootstrapView
+        """
+        return InferelatorBootstrapView(self, sample_bootstrap_index)
+
     def get_random_samples(self, num_obs, with_replacement=False, random_seed=None, random_gen=None, inplace=False,
                            fix_names=True):
         """
@@ -859,3 +869,128 @@ class InferelatorData(object):
     def _make_idx_str(df):
         df.index = df.index.astype(str) if not pat.is_string_dtype(df.index.dtype) else df.index
         df.columns = df.columns.astype(str) if not pat.is_string_dtype(df.columns.dtype) else df.columns
+
+
+class InferelatorBootstrapView(object):
+    """
+    A resampled view of an InferelatorData object. The parent expression data is not copied; the view keeps the
+    resampled sample indices and gathers the rows for only the genes that are requested. Gene means and standard
+    deviations are calculated from the parent data weighted by the number of times each sample was resampled.
+    """
+
+    parent = None
+    sample_index = None
+    name = None
+
+    @property
+    def multiplicity(self):
+        """
+        Number of times each sample in the parent data appears in the bootstrap [N_parent]
+        """
+        return np.bincount(self.sample_index, minlength=self.parent.num_obs)
+
+    @property
+    def expression_data(self):
+        # Some operations (like discretization for MI) need the entire resampled matrix
+        return self.parent.values[self.sample_index, :]
+
+    @property
+    def values(self):
+        return self.expression_data
+
+    @property
+    def gene_names(self):
+        return self.parent.gene_names
+
+    @property
+    def sample_names(self):
+        # Resampled observations are labeled by position, the same as they are by get_bootstrap
+        return pd.Index(np.arange(self.num_obs).astype(str))
+
+    @property
+    def gene_means(self):
+        return self._weighted_sum(self.parent.values) / self.num_obs
+
+    @property
+    def gene_stdev(self):
+        # Match InferelatorData, which uses ddof=0 for sparse data and ddof=1 for dense data
+        ddof = 0 if self.is_sparse else 1
+        means = self.gene_means
+        sum_sq = self._weighted_sum(self.parent.values.power(2) if self.is_sparse else np.square(self.parent.values))
+        return np.sqrt(np.maximum(sum_sq - self.num_obs * np.square(means), 0) / (self.num_obs - ddof))
+
+    @property
+    def is_sparse(self):
+        return self.parent.is_sparse
+
+    @property
+    def shape(self):
+        return self.num_obs, self.num_genes
+
+    @property
+    def num_obs(self):
+        return len(self.sample_index)
+
+    @property
+    def num_genes(self):
+        return self.parent.num_genes
+
+    def __str__(self):
+        msg = "InferelatorBootstrapView [{sh}] of {p}"
+        return msg.format(sh=self.shape, p=str(self.parent))
+
+    def __init__(self, parent, sample_index):
+        """
+        Create a bootstrap view
+
+        :param parent: The data to resample
+        :type parent: InferelatorData
+        :param sample_index: Resampled sample indices
+        :type sample_index: list(int), np.ndarray
+        """
+
+        assert check.argument_type(parent, InferelatorData)
+
+        self.parent = parent
+        self.sample_index = np.asarray(sample_index, dtype=int)
+        self.name = parent.name
+
+    def get_gene_data(self, gene_list, copy=False, force_dense=False, to_df=False, zscore=False, flatten=False):
+
+        x = self.parent.get_gene_data(gene_list, force_dense=force_dense or to_df or zscore)
+
+        # Gather the resampled rows (this always makes a new array)
+        x = x[self.sample_index] if x.ndim == 1 else x[self.sample_index, :]
+
+        if zscore and x.ndim == 1:
+            x = scale_vector(x)
+        elif zscore:
+            x = np.column_stack([scale_vector(x[:, i]) for i in range(x.shape[1])])
+
+        if flatten:
+            x = x.A.flatten() if sparse.issparse(x) else x.flatten()
+
+        if to_df:
+            return pd.DataFrame(x, columns=self.parent._adata[:, gene_list].var_names, index=self.sample_names)
+        else:
+            return x
+
+    def to_inferelator_data(self):
+        """
+        Make a resampled copy of the data
+
+        :return: InferelatorData
+        """
+        return self.parent.get_bootstrap(self.sample_index)
+
+    def _weighted_sum(self, arr):
+        """
+        Sum each column of a parent-aligned array, weighting each row by its bootstrap multiplicity
+        """
+
+        weights = self.multiplicity.astype(float)
+
+        if sparse.issparse(arr):
+            return np.asarray(arr.T.dot(weights)).flatten()
+        else:
+            return np.dot(weights, arr)
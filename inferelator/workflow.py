@@ -702,6 +702,18 @@ class WorkflowBase(WorkflowBaseLoader):
     # Use numba for JIT
     use_numba = False
 
+    # Save each bootstrap to this path as it finishes and skip any bootstraps already saved
+    checkpoint_dir = None
+
+    # Regress several bootstraps at once instead of one after another
+    concurrent_bootstraps = False
+
+    # The number of bootstraps to run at once if concurrent_bootstraps is set (None runs one for each worker)
+    concurrent_bootstrap_window = None
+
+    # Record the time and size of every multiprocessing task and write a report to the output path
+    task_telemetry = False
+
     # Multiprocessing controller
     initialize_mp = True
     multiprocessing_controller = None
@@ -820,7 +832,9 @@ class WorkflowBase(WorkflowBaseLoader):
         if curve_data_file_name != "":
             InferelatorResults.curve_data_file_name = curve_data_file_name
 
-    def set_run_parameters(self, num_bootstraps=None, random_seed=None, use_mkl=None, use_numba=None):
+    def set_run_parameters(self, num_bootstraps=None, random_seed=None, use_mkl=None, use_numba=None,
+                           checkpoint_dir=None, concurrent_bootstraps=None, concurrent_bootstrap_window=None,
+                           task_telemetry=None):
         """
         Set parameters used during runtime
 
@@ -831,14 +845,37 @@ class WorkflowBase(WorkflowBaseLoader):
         :param use_mkl: A flag to indicate if the intel MKL library should be used for matrix multiplication
         :type use_mkl: bool
         :param use_numba: A flag to indicate if numba should be used to accelerate the calculations.
-        Requires numba to be installed if set. Currently only accelerates AMuSR regression.
+        Requires numba to be installed if set. Currently accelerates AMuSR regression and the mutual information
+        calculation for BBSR.
         :type use_numba: bool
+        :param checkpoint_dir: A path to save the betas from each bootstrap in as it is finished. A workflow which is
+            restarted with the same checkpoint_dir and settings will load these bootstraps instead of running them
+            again. Defaults to None (bootstraps are not saved).
+        :type checkpoint_dir: str
+        :param concurrent_bootstraps: A flag to indicate that bootstraps should run in parallel with each other, one
+            bootstrap in each worker, instead of one after another with each bootstrap split across the workers.
+            This works best when there are at least as many bootstraps as workers. Each bootstrap has its own random
+            state from a seed sequence, so models with random state (e.g. scikit-learn with add_random_state) will
+            have different results than bootstraps run one after another. Not supported by StARS. Defaults to False.
+        :type concurrent_bootstraps: bool
+        :param concurrent_bootstrap_window: The number of bootstraps to run at once if concurrent_bootstraps is set.
+            Each bootstrap that is running is held in memory. Defaults to None (one for each worker).
+        :type concurrent_bootstrap_window: int
+        :param task_telemetry: A flag to indicate that the wall time, worker and input and result sizes of every task
+            sent to the multiprocessing engine should be recorded. A TSV file of tasks and a JSON file of summaries
+            for each stage (throughput, latency percentiles, idle worker time and the slowest tasks) are written to
+            the output path. Defaults to False.
+        :type task_telemetry: bool
         """
 
         self._set_without_warning("num_bootstraps", num_bootstraps)
         self._set_without_warning("random_seed", random_seed)
         self._set_without_warning("use_mkl", use_mkl)
         self._set_without_warning("use_numba", use_numba)
+        self._set_without_warning("checkpoint_dir", checkpoint_dir)
+        self._set_without_warning("concurrent_bootstraps", concurrent_bootstraps)
+        self._set_without_warning("concurrent_bootstrap_window", concurrent_bootstrap_window)
+        self._set_without_warning("task_telemetry", task_telemetry)
 
     def initialize_multiprocessing(self):
         """
@@ -865,6 +902,11 @@ class WorkflowBase(WorkflowBaseLoader):
         if self.initialize_mp and not MPControl.is_initialized:
             self.initialize_multiprocessing()
 
+        # Clear the telemetry so that tasks from earlier runs in this process aren't reported
+        if self.task_telemetry:
+            MPControl.enable_telemetry()
+            MPControl.telemetry.clear()
+
         self.startup_run()
         self.startup_finish()
 
@@ -885,7 +927,21 @@ class WorkflowBase(WorkflowBaseLoader):
         """
         Execute workflow, after all configuration.
         """
-        raise NotImplementedError  # implement in subclass
+
+        # Set the random seed (for bootstrap selection)
+        np.random.seed(self.random_seed)
+
+        # Call the startup workflow
+        self.startup()
+
+        # Run regression after startup
+        betas, rescaled_betas = self.run_regression()
+
+        # Write the results out to a file
+        results = self.emit_results(betas, rescaled_betas, self.gold_standard, self.priors_data)
+        self.emit_telemetry()
+
+        return results
 
     def process_priors_and_gold_standard(self):
         """
@@ -965,6 +1021,17 @@ class WorkflowBase(WorkflowBaseLoader):
         """
         raise NotImplementedError  # implement in subclass
 
+    def emit_telemetry(self):
+        """
+        Write the task telemetry report into the output path if task telemetry is being recorded, and then stop
+        recording task telemetry
+        """
+
+        if self.task_telemetry and MPControl.telemetry is not None:
+            self.create_output_dir()
+            MPControl.telemetry.write_report(self.output_dir)
+            MPControl.disable_telemetry()
+
     def create_output_dir(self):
         """
         Set a default output_dir if nothing is set. Create the path if it doesn't exist.